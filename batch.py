@@ -0,0 +1,413 @@
+"""
+Parallel batch encoding and decoding for the steganography application.
+"""
+import csv
+import glob
+import json
+import os
+import posixpath
+import shutil
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import closing
+from stegano import Steganography, SteganographyError, Carrier, Instrumentation
+from utils import SUPPORTED_EXTENSIONS, safe_text_read
+
+# Column order of a batch manifest (CSV); a header row with these names is optional
+MANIFEST_COLUMNS = ('image', 'payload', 'output')
+
+# Manifest read from a batch archive when none is given separately, and the
+# summary written at the end of a result archive
+ARCHIVE_MANIFEST = 'manifest.json'
+ARCHIVE_REPORT = 'report.json'
+
+# Steganography.encode/decode options a JSON manifest may set
+ARCHIVE_OPTIONS = {
+    'encode': ('bits_per_channel', 'output_format', 'save_profile', 'compression', 'scatter', 'passphrase',
+               'matrix'),
+    'decode': ('passphrase',),
+}
+
+def is_supported_image_name(path):
+    """Check if a file name has a supported image extension."""
+    return os.path.splitext(path)[1].lower().lstrip('.') in SUPPORTED_EXTENSIONS
+
+def list_images(source):
+    """
+    List the supported images in a directory or matching a glob pattern.
+    
+    Args:
+        source: Directory of images or glob pattern
+    
+    Returns:
+        list: Sorted image paths
+    """
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source, recursive=True)
+    return sorted(path for path in paths if os.path.isfile(path) and is_supported_image_name(path))
+
+def read_manifest(manifest_path):
+    """
+    Read (image, payload, output) rows from a CSV manifest.
+    
+    For encoding the payload column holds the text to hide, or '@path' to
+    read it from a text file. For decoding it holds the optional
+    authentication code, and the output column names an optional text file
+    for the extracted message. Relative paths are resolved against the
+    manifest's directory.
+    
+    Args:
+        manifest_path: Path to the CSV manifest
+    
+    Returns:
+        list: One dict per row with 'image', 'payload' and 'output' keys
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    
+    def resolve(path):
+        return os.path.join(base_dir, path) if path else None
+    
+    rows = []
+    with open(manifest_path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith('#'):
+                continue
+            if tuple(cell.strip().lower() for cell in row[:3]) == MANIFEST_COLUMNS[:len(row[:3])]:
+                continue
+            
+            image, payload, output = (row + ['', '', ''])[:3]
+            if payload.startswith('@'):
+                payload = '@' + resolve(payload[1:])
+            rows.append({'image': resolve(image), 'payload': payload or None, 'output': resolve(output)})
+    return rows
+
+def collect_items(source, operation, payload=None, output_dir=None, output_format='png'):
+    """
+    Build the list of batch items from a directory, glob or manifest.
+    
+    Args:
+        source: Directory of images, glob pattern or CSV manifest path
+        operation: 'encode' or 'decode'
+        payload: Default payload for items without their own: the text to
+            hide (encoding) or the auth code (decoding)
+        output_dir: Directory for encoded images (defaults to next to each input)
+        output_format: Format (and extension) of generated output names
+    
+    Returns:
+        list: One dict per item with 'index', 'operation', 'image',
+            'payload' and 'output' keys
+    """
+    if os.path.isfile(source) and source.lower().endswith('.csv'):
+        rows = read_manifest(source)
+    else:
+        rows = [{'image': path, 'payload': None, 'output': None} for path in list_images(source)]
+    
+    items = []
+    for index, row in enumerate(rows):
+        output = row['output']
+        if row['payload'] is None:
+            row['payload'] = payload
+        if operation == 'encode':
+            if not output:
+                name = os.path.splitext(os.path.basename(row['image']))[0]
+                directory = output_dir or os.path.dirname(row['image'])
+                output = os.path.join(directory, f"{name}_encoded.{output_format}")
+        items.append({'index': index, 'operation': operation, 'image': row['image'],
+                      'payload': row['payload'], 'output': output})
+    return items
+
+def run_item(item, options=None, profile=False):
+    """
+    Encode or decode a single batch item, capturing any failure.
+    
+    This runs inside worker processes, so it never raises; errors are
+    reported in the returned result instead.
+    
+    Args:
+        item: Batch item from collect_items
+        options: Keyword arguments for Steganography.encode when encoding
+            (bits_per_channel, output_format, save_profile, compression,
+            scatter, passphrase, matrix) or Steganography.decode when decoding
+            (passphrase)
+        profile: Record per-stage timings in the result's 'stages' list
+    
+    Returns:
+        dict: Item result with status, timing and output details
+    """
+    result = {'index': item['index'], 'operation': item['operation'], 'image': item['image'],
+              'output': item['output'], 'status': 'ok', 'error': None}
+    instrumentation = Instrumentation() if profile else None
+    started = time.perf_counter()
+    
+    try:
+        image = Carrier.load(item['image'], instrumentation) if profile else item['image']
+        if item['operation'] == 'encode':
+            text = item['payload']
+            if text and text.startswith('@'):
+                text = safe_text_read(text[1:])
+            if not text:
+                raise SteganographyError("No text provided for encoding")
+            
+            output_path, auth_code = Steganography.encode(image, text, item['output'], **(options or {}))
+            result.update(output=output_path, auth_code=auth_code)
+        else:
+            message = Steganography.decode(image, item['payload'], **(options or {}))
+            if isinstance(message, dict):
+                raise SteganographyError("Authentication code required")
+            
+            if item['output']:
+                with open(item['output'], 'w', encoding='utf-8') as f:
+                    f.write(message)
+            else:
+                result['message'] = message
+    except Exception as e:
+        result.update(status='error', error=str(e))
+    
+    result['seconds'] = round(time.perf_counter() - started, 6)
+    if instrumentation:
+        result['stages'] = instrumentation.stages
+    return result
+
+def run_batch(items, workers=None, ordered=False, options=None, profile=False):
+    """
+    Process batch items on a process pool, yielding results.
+    
+    Failed items are yielded with status 'error' and do not stop the batch.
+    Closing the generator early (e.g. when a client disconnects from a
+    streamed archive) cancels the items that have not started yet.
+    
+    Args:
+        items: Items from collect_items
+        workers: Number of worker processes (defaults to the CPU count)
+        ordered: Yield results in input order instead of as they finish
+        options: Keyword arguments for Steganography.encode or decode
+        profile: Record per-stage timings for every item
+    
+    Yields:
+        dict: One result per item from run_item
+    """
+    if not items:
+        return
+    
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(run_item, item, options, profile) for item in items]
+        for future in futures if ordered else as_completed(futures):
+            yield future.result()
+    finally:
+        # Don't wait for queued items nobody will read
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def build_report(results, operation, workers, seconds):
+    """
+    Summarise batch results for the JSON report.
+    
+    Args:
+        results: Results yielded by run_batch
+        operation: 'encode' or 'decode'
+        workers: Number of worker processes used
+        seconds: Wall time of the whole batch
+    
+    Returns:
+        dict: Report with aggregate counts and per-item results in input order
+    """
+    results = sorted(results, key=lambda result: result['index'])
+    succeeded = sum(1 for result in results if result['status'] == 'ok')
+    return {
+        'operation': operation,
+        'workers': workers or os.cpu_count(),
+        'total': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'seconds': round(seconds, 6),
+        'items': results,
+    }
+
+def write_report(report, report_path):
+    """Write a batch report as JSON."""
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+def read_archive_items(archive, manifest, directory, max_bytes):
+    """
+    Unpack the images (and text files) a JSON manifest names from a ZIP archive.
+    
+    The manifest is a dict with 'operation' ('encode' or 'decode'), optional
+    'options' for Steganography.encode or decode, and 'items': rows with
+    the same 'image', 'payload' and 'output' keys as a CSV manifest, naming
+    archive members instead of paths ('@name' payloads read a text member).
+    Rows without a payload use the manifest's 'text' (encoding) or
+    'auth_code' (decoding), and without 'items' every image in the archive
+    is processed that way. Images must have a supported extension and
+    every output name must be unique. Members are unpacked under numbered
+    names, so their paths never touch the file system.
+    
+    Args:
+        archive: Open zipfile.ZipFile
+        manifest: Parsed manifest, or None to read ARCHIVE_MANIFEST from the archive
+        directory: Empty directory to unpack into
+        max_bytes: Largest total uncompressed size of the members used
+    
+    Returns:
+        tuple: (operation, options, items like those from collect_items,
+            with the member names kept as 'name' and 'output_name')
+    """
+    try:
+        if manifest is None:
+            manifest = json.loads(archive.read(ARCHIVE_MANIFEST))
+    except KeyError:
+        raise SteganographyError(f"No manifest given and no {ARCHIVE_MANIFEST} in the archive")
+    except ValueError as e:
+        raise SteganographyError(f"Invalid manifest: {str(e)}")
+    if not isinstance(manifest, dict):
+        raise SteganographyError("The manifest must be a JSON object")
+    
+    operation = manifest.get('operation', 'encode')
+    if operation not in ARCHIVE_OPTIONS:
+        raise SteganographyError(f"Unknown operation '{operation}'. Use 'encode' or 'decode'")
+    options = manifest.get('options') or {}
+    unknown = [name for name in options if name not in ARCHIVE_OPTIONS[operation]]
+    if unknown:
+        raise SteganographyError(f"Unknown {operation} option(s): {', '.join(unknown)}")
+    
+    # Text to hide, or the auth code to decode with, where a row gives none
+    shared = manifest.get('text' if operation == 'encode' else 'auth_code')
+    rows = manifest.get('items')
+    if rows is None:
+        rows = [{'image': name} for name in sorted(archive.namelist())
+                if not name.endswith('/') and is_supported_image_name(name)]
+    
+    paths = {}
+    unpacked_bytes = 0
+    
+    def unpack(name):
+        # Each member is unpacked once, however many rows name it
+        nonlocal unpacked_bytes
+        if name not in paths:
+            try:
+                info = archive.getinfo(name)
+            except KeyError:
+                raise SteganographyError(f"'{name}' is not in the archive")
+            unpacked_bytes += info.file_size
+            if unpacked_bytes > max_bytes:
+                raise SteganographyError(f"The archive's files add up to more than {max_bytes} bytes")
+            paths[name] = os.path.join(directory, f"{len(paths)}{os.path.splitext(name)[1].lower()}")
+            with archive.open(info) as source, open(paths[name], 'wb') as target:
+                shutil.copyfileobj(source, target)
+        return paths[name]
+    
+    output_format = options.get('output_format') or 'png'
+    items = []
+    outputs = {}
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict) or not row.get('image'):
+            raise SteganographyError(f"Manifest item {index + 1} has no image")
+        name = row['image']
+        if not isinstance(name, str) or not is_supported_image_name(name):
+            raise SteganographyError(
+                f"Manifest item {index + 1} is not a supported image (use {', '.join(SUPPORTED_EXTENSIONS)})")
+        payload = row.get('payload', shared)
+        if payload is not None and not isinstance(payload, str):
+            raise SteganographyError(f"Manifest item {index + 1} has a payload that is not a string")
+        if payload and operation == 'encode' and payload.startswith('@'):
+            payload = '@' + unpack(payload[1:])
+        
+        stem = posixpath.splitext(name)[0]
+        output_name = row.get('output') or (f"{stem}_encoded.{output_format}" if operation == 'encode'
+                                            else f"{stem}.txt")
+        if output_name == ARCHIVE_REPORT:
+            raise SteganographyError(f"Manifest item {index + 1} cannot write '{ARCHIVE_REPORT}'")
+        if output_name in outputs:
+            raise SteganographyError(
+                f"Manifest items {outputs[output_name] + 1} and {index + 1} both write '{output_name}'")
+        outputs[output_name] = index
+        items.append({'index': index, 'operation': operation, 'image': unpack(name), 'payload': payload,
+                      'output': os.path.join(directory, f"{index}.out{posixpath.splitext(output_name)[1]}"),
+                      'name': name, 'output_name': output_name})
+    return operation, options, items
+
+def count_pixels(items):
+    """
+    Add up the pixel counts of the items' images, reading only their headers.
+    
+    Images are opened the way they will be processed (see Carrier.load),
+    and any image whose size cannot be read is rejected rather than
+    counted as zero.
+    """
+    pixels = 0
+    for item in items:
+        try:
+            carrier = Carrier.load(item['image'])
+        except Exception:
+            raise SteganographyError(f"Cannot read the size of '{item.get('name', item['image'])}'")
+        pixels += carrier.width * carrier.height
+    return pixels
+
+class ArchiveStream:
+    """
+    Write-only buffer for a ZIP archive that is sent while it is written.
+    
+    zipfile falls back to data descriptors for streams it cannot seek, so
+    each entry can be drained and sent as soon as it has been added.
+    """
+    
+    def __init__(self):
+        self.chunks = []
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        """Return and forget everything written so far."""
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def stream_archive(items, operation, workers=None, options=None):
+    """
+    Process archive items on a process pool, yielding a ZIP of the results.
+    
+    Each output (an encoded image, or a decoded message as a text file) is
+    added under its 'output_name' as soon as its item finishes, and
+    ARCHIVE_REPORT with the build_report summary closes the archive.
+    
+    Args:
+        items: Items from read_archive_items
+        operation: 'encode' or 'decode'
+        workers: Number of worker processes (defaults to the CPU count)
+        options: Keyword arguments for Steganography.encode or decode
+    
+    Yields:
+        bytes: The next part of the archive
+    """
+    names = {item['index']: item for item in items}
+    results = []
+    started = time.perf_counter()
+    stream = ArchiveStream()
+    
+    with zipfile.ZipFile(stream, 'w') as archive, closing(run_batch(items, workers, options=options)) as batch:
+        for result in batch:
+            item = names[result['index']]
+            if result['status'] == 'ok':
+                # Images are already compressed; text compresses well
+                compression = zipfile.ZIP_STORED if operation == 'encode' else zipfile.ZIP_DEFLATED
+                archive.write(item['output'], item['output_name'], compress_type=compression)
+                os.remove(item['output'])
+                result['output'] = item['output_name']
+            else:
+                result['output'] = None
+                result['error'] = result['error'].replace(item['image'], item['name'])
+            result['image'] = item['name']
+            results.append(result)
+            yield stream.drain()
+        
+        report = build_report(results, operation, workers, time.perf_counter() - started)
+        archive.writestr(ARCHIVE_REPORT, json.dumps(report, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+    yield stream.drain()
@@ -0,0 +1,63 @@
+"""
+Deterministic synthetic carrier images for the benchmarks.
+"""
+import io
+import numpy as np
+from PIL import Image
+
+# Image modes the benchmarks generate carriers in
+CARRIER_MODES = ('RGB', 'RGBA', 'L', 'P')
+
+def synthetic_image(megapixels, mode='RGB', seed=0):
+    """
+    Create a deterministic photo-like image.
+    
+    Smooth gradients plus mild noise compress roughly like a real photo,
+    unlike pure noise (incompressible) or flat colour (trivially small).
+    
+    Args:
+        megapixels: Image size in millions of pixels
+        mode: 'RGB', 'RGBA', 'L' or 'P'
+        seed: Random seed for the noise
+    
+    Returns:
+        PIL.Image.Image: Image in the requested mode
+    """
+    side = max(1, int((megapixels * 1_000_000) ** 0.5))
+    y, x = np.mgrid[0:side, 0:side].astype(np.float32) / side
+    rng = np.random.default_rng(seed)
+    channels = [
+        128 + 100 * np.sin(6 * x + 3 * y),
+        128 + 100 * np.cos(4 * y - 2 * x),
+        255 * x * y,
+    ]
+    pixels = np.stack(channels, axis=-1) + rng.normal(0, 4, (side, side, 3)).astype(np.float32)
+    img = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'RGB')
+    
+    if mode == 'RGBA':
+        img.putalpha(Image.fromarray((255 * (1 - x / 2)).astype(np.uint8), 'L'))
+    elif mode == 'P':
+        img = img.quantize(colors=256)
+    elif mode != 'RGB':
+        img = img.convert(mode)
+    return img
+
+def synthetic_png(megapixels, mode='RGB', seed=0):
+    """
+    Create a synthetic carrier and return it encoded as PNG bytes.
+    
+    Args:
+        megapixels: Image size in millions of pixels
+        mode: 'RGB', 'RGBA', 'L' or 'P'
+        seed: Random seed for the noise
+    
+    Returns:
+        bytes: PNG file contents
+    """
+    buffer = io.BytesIO()
+    synthetic_image(megapixels, mode, seed).save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+def random_payload(size, seed=1):
+    """Return size deterministic pseudo-random bytes."""
+    return np.random.default_rng(seed).integers(0, 256, size, dtype=np.uint8).tobytes()
@@ -0,0 +1,85 @@
+"""
+Benchmark encode time against output size for each output format and save profile.
+
+Usage:
+    python -m benchmarks.save_profiles [--megapixels 4] [--repeat 3] [--json results.json]
+"""
+import argparse
+import io
+import json
+import time
+from stegano import Steganography, Carrier, OUTPUT_FORMATS, SAVE_PROFILES
+from benchmarks.carriers import synthetic_png, random_payload
+
+def run(megapixels=4, repeat=3, payload_size=64 * 1024):
+    """
+    Time encoding with every output format and save profile.
+    
+    Args:
+        megapixels: Carrier size in millions of pixels
+        repeat: Number of timed runs per combination (the best is kept)
+        payload_size: Size of the random payload in bytes
+    
+    Returns:
+        list: One dict per format/profile with timings and output size
+    """
+    source = io.BytesIO(synthetic_png(megapixels))
+    payload = random_payload(payload_size)
+    
+    results = []
+    for output_format in OUTPUT_FORMATS:
+        for save_profile in SAVE_PROFILES:
+            best_embed = best_save = float('inf')
+            for _ in range(repeat):
+                source.seek(0)
+                carrier = Carrier(source)
+                
+                started = time.perf_counter()
+                carrier.embed(payload)
+                embedded = time.perf_counter()
+                
+                output = io.BytesIO()
+                carrier.save(output, output_format, save_profile)
+                saved = time.perf_counter()
+                
+                best_embed = min(best_embed, embedded - started)
+                best_save = min(best_save, saved - embedded)
+            
+            # Check the output actually round-trips before reporting it
+            output.seek(0)
+            if Steganography.read_payload(output)[0] != payload:
+                raise RuntimeError(f"{output_format}/{save_profile} output did not round-trip")
+            
+            results.append({
+                'format': output_format,
+                'profile': save_profile,
+                'embed_seconds': round(best_embed, 6),
+                'save_seconds': round(best_save, 6),
+                'encode_seconds': round(best_embed + best_save, 6),
+                'output_bytes': output.getbuffer().nbytes,
+            })
+    return results
+
+def main():
+    """Run the benchmark and print a table."""
+    parser = argparse.ArgumentParser(description="Benchmark output formats and save profiles")
+    parser.add_argument('--megapixels', type=float, default=4, help='Carrier size in megapixels')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per combination')
+    parser.add_argument('--payload', type=int, default=64 * 1024, help='Payload size in bytes')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+    
+    results = run(args.megapixels, args.repeat, args.payload)
+    
+    print(f"{'format':<8}{'profile':<10}{'embed s':>10}{'save s':>10}{'encode s':>10}{'output MB':>12}")
+    for result in results:
+        print(f"{result['format']:<8}{result['profile']:<10}{result['embed_seconds']:>10.3f}"
+              f"{result['save_seconds']:>10.3f}{result['encode_seconds']:>10.3f}"
+              f"{result['output_bytes'] / 1e6:>12.2f}")
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Benchmark suite for the core steganography codec.
+
+Generates deterministic synthetic carriers across image modes, sizes and
+payload sizes, times every stage of an encode/decode round trip, records
+peak traced memory per stage and writes the results as JSON. Results can be
+compared against a saved baseline to fail on regressions.
+
+Usage:
+    python -m benchmarks.suite [--sizes 0.1 1 4] [--json results.json]
+    python -m benchmarks.suite --preset full --save-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json --threshold 0.25
+    python -m benchmarks.suite --verify-embed
+"""
+import argparse
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+from stegano import Steganography, Carrier, HEADER_BITS
+from utils import steganalysis_score
+from benchmarks.carriers import CARRIER_MODES, synthetic_png, random_payload
+
+# Carrier sizes (megapixels) for each preset
+PRESETS = {
+    'quick': (0.1, 1),
+    'default': (0.1, 1, 4),
+    'full': (0.1, 1, 4, 12, 24, 50),
+}
+
+# Fixed payload sizes in bytes; 'capacity' fills the carrier completely
+PAYLOAD_SIZES = (16, 1024, 64 * 1024, 'capacity')
+
+# Stage timings shorter than this are too noisy to flag as regressions
+MIN_COMPARABLE_SECONDS = 0.005
+
+# Bit lengths checked by --verify-embed, including ones that are not whole bytes
+VERIFY_BIT_LENGTHS = (0, 1, 7, 8, 9, 63, 257, 1000, 4093)
+
+def measure(function, repeat=3, trace_memory=True):
+    """
+    Time a function and record its peak traced memory.
+    
+    Timing runs are made without tracemalloc (which slows allocation
+    heavy code down); one extra traced run records the peak.
+    
+    Args:
+        function: Zero-argument callable to benchmark
+        repeat: Number of timed runs (the fastest is kept)
+        trace_memory: Whether to make the traced run
+    
+    Returns:
+        tuple: (best seconds, peak bytes or None, last return value)
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    
+    return best, peak, result
+
+def run_case(source, mode, megapixels, payload_size, repeat=3, trace_memory=True):
+    """
+    Benchmark one carrier/payload combination through every stage.
+    
+    Args:
+        source: PNG bytes of the carrier
+        mode: Image mode of the carrier
+        megapixels: Carrier size in megapixels
+        payload_size: Payload size in bytes
+        repeat: Number of timed runs per stage
+        trace_memory: Whether to record peak memory
+    
+    Returns:
+        dict: Case description and per-stage results
+    """
+    payload = random_payload(payload_size)
+    stages = {}
+    
+    def record(name, function):
+        seconds, peak, result = measure(function, repeat, trace_memory)
+        stages[name] = {'seconds': round(seconds, 6), 'peak_bytes': peak}
+        return result
+    
+    def open_carrier():
+        opened = Carrier(io.BytesIO(source))
+        # Carriers decode their pixels lazily; time the decode here
+        opened.pixels
+        return opened
+    carrier = record('open', open_carrier)
+    record('can_encode', lambda: Steganography.can_encode(io.BytesIO(source), payload))
+    
+    # Embedding modifies the carrier in place, so each run gets a fresh copy
+    pixels = carrier.pixels.copy()
+    
+    def embed():
+        carrier.pixels[...] = pixels
+        carrier.embed(payload)
+    record('embed', embed)
+    
+    def save():
+        buffer = io.BytesIO()
+        carrier.save(buffer)
+        return buffer.getvalue()
+    encoded = record('save', save)
+    
+    # PNG payloads are read incrementally from the leading rows when possible
+    extracted = record('read_payload', lambda: Steganography.read_payload(io.BytesIO(encoded))[0])
+    if extracted != payload:
+        raise RuntimeError(f"{mode} {megapixels}MP {payload_size}B payload did not round-trip")
+    
+    record('steganalysis', lambda: steganalysis_score(io.BytesIO(encoded)))
+    
+    return {
+        'id': f"{mode}-{megapixels}MP-{payload_size}B",
+        'mode': mode,
+        'megapixels': megapixels,
+        'pixels': carrier.width * carrier.height,
+        'payload_bytes': payload_size,
+        'encoded_bytes': len(encoded),
+        'stages': stages,
+    }
+
+def run_suite(sizes, modes=CARRIER_MODES, payload_sizes=PAYLOAD_SIZES, repeat=3,
+              trace_memory=True, log=None):
+    """
+    Run every mode/size/payload combination.
+    
+    Args:
+        sizes: Carrier sizes in megapixels
+        modes: Carrier image modes
+        payload_sizes: Payload sizes in bytes, or 'capacity'
+        repeat: Number of timed runs per stage
+        trace_memory: Whether to record peak memory
+        log: Optional callable receiving a progress line per case
+    
+    Returns:
+        dict: Environment description and the list of case results
+    """
+    cases = []
+    for megapixels in sizes:
+        for mode in modes:
+            source = synthetic_png(megapixels, mode)
+            side = max(1, int((megapixels * 1_000_000) ** 0.5))
+            capacity = Steganography.max_payload_size(side * side * 3)
+            
+            for payload_size in payload_sizes:
+                size = capacity if payload_size == 'capacity' else payload_size
+                if size > capacity or size <= 0:
+                    continue
+                
+                case = run_case(source, mode, megapixels, size, repeat, trace_memory)
+                cases.append(case)
+                if log:
+                    total = sum(stage['seconds'] for stage in case['stages'].values())
+                    log(f"{case['id']:<28} {total:>9.3f}s")
+    
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'header_bits': HEADER_BITS,
+        },
+        'repeat': repeat,
+        'cases': cases,
+    }
+
+def verify_embed_bits(trials=20, seed=0):
+    """
+    Check embed_bits bit-for-bit against embed_bits_reference.
+    
+    Random carriers are filled with random bit strings of every length in
+    VERIFY_BIT_LENGTHS (plus random lengths up to the carrier size) and
+    embedded with both implementations.
+    
+    Args:
+        trials: Number of random carriers to check
+        seed: Seed for the random generator
+    
+    Returns:
+        list: Description of every mismatching case (empty when all match)
+    """
+    rng = np.random.default_rng(seed)
+    mismatches = []
+    
+    for trial in range(trials):
+        carrier = rng.integers(0, 256, size=int(rng.integers(1, 8192)), dtype=np.uint8)
+        lengths = [length for length in VERIFY_BIT_LENGTHS if length <= len(carrier)]
+        lengths.append(int(rng.integers(0, len(carrier) + 1)))
+        
+        for length in lengths:
+            bits = rng.integers(0, 2, size=length, dtype=np.uint8)
+            expected = Steganography.embed_bits_reference(carrier.copy(), ''.join(map(str, bits)))
+            actual = Steganography.embed_bits(carrier.copy(), bits)
+            if not np.array_equal(actual, expected):
+                first = int(np.flatnonzero(actual != expected)[0])
+                mismatches.append(f"trial {trial}: {length} bits into {len(carrier)} values "
+                                  f"differ first at index {first}")
+    return mismatches
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Compare stage timings against a baseline.
+    
+    Args:
+        results: Output of run_suite
+        baseline: Earlier output of run_suite
+        threshold: Allowed slowdown as a fraction (0.2 = 20% slower)
+    
+    Returns:
+        list: One dict per regressed case/stage
+    """
+    baseline_cases = {case['id']: case for case in baseline.get('cases', [])}
+    regressions = []
+    
+    for case in results['cases']:
+        previous = baseline_cases.get(case['id'])
+        if previous is None:
+            continue
+        
+        for name, stage in case['stages'].items():
+            before = previous['stages'].get(name, {}).get('seconds')
+            after = stage['seconds']
+            if before is None or max(before, after) < MIN_COMPARABLE_SECONDS:
+                continue
+            if after > before * (1 + threshold):
+                regressions.append({
+                    'case': case['id'],
+                    'stage': name,
+                    'baseline_seconds': before,
+                    'seconds': after,
+                    'ratio': round(after / before, 3) if before else None,
+                })
+    return regressions
+
+def main():
+    """Run the suite from the command line."""
+    parser = argparse.ArgumentParser(description="Benchmark the steganography codec")
+    parser.add_argument('--preset', choices=PRESETS, default='default', help='Carrier size preset')
+    parser.add_argument('--sizes', type=float, nargs='+', help='Carrier sizes in megapixels (overrides --preset)')
+    parser.add_argument('--modes', nargs='+', choices=CARRIER_MODES, default=list(CARRIER_MODES),
+                        help='Carrier image modes')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per stage')
+    parser.add_argument('--no-memory', action='store_true', help='Skip peak memory tracing')
+    parser.add_argument('--json', help='Write the results to this JSON file')
+    parser.add_argument('--save-baseline', help='Write the results as a new baseline file')
+    parser.add_argument('--baseline', help='Compare against this baseline file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Allowed slowdown against the baseline as a fraction (default: 0.2)')
+    parser.add_argument('--verify-embed', action='store_true',
+                        help='Check embed_bits against the reference loop instead of benchmarking')
+    args = parser.parse_args()
+    
+    if args.verify_embed:
+        mismatches = verify_embed_bits()
+        for mismatch in mismatches:
+            print(f"MISMATCH {mismatch}")
+        if mismatches:
+            sys.exit(1)
+        print("embed_bits matches embed_bits_reference")
+        return
+    
+    sizes = args.sizes or PRESETS[args.preset]
+    results = run_suite(sizes, args.modes, repeat=args.repeat, trace_memory=not args.no_memory, log=print)
+    
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['case']} {regression['stage']}: "
+                  f"{regression['baseline_seconds']:.4f}s -> {regression['seconds']:.4f}s "
+                  f"(x{regression['ratio']})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+In-process caching helpers for the steganography application.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a total size cap and a per-entry time-to-live.
+    
+    Entries are evicted least-recently-used first whenever the combined size
+    of all values exceeds max_bytes, and are dropped on access once they are
+    older than ttl seconds.
+    """
+    
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=600, clock=time.monotonic):
+        """
+        Create an empty cache.
+        
+        Args:
+            max_bytes: Maximum combined size of all cached values
+            ttl: Lifetime of an entry in seconds
+            clock: Function returning the current time in seconds
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+    
+    def __contains__(self, key):
+        return self.get(key) is not None
+    
+    def get(self, key, default=None):
+        """
+        Return a cached value and mark it as recently used.
+        
+        Args:
+            key: Cache key
+            default: Value returned when the key is missing or expired
+            
+        Returns:
+            The cached value or default
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            
+            value, size, expires = entry
+            if expires <= self.clock():
+                self._remove(key)
+                return default
+            
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key, value, size):
+        """
+        Store a value, evicting least-recently-used entries as needed.
+        
+        Values larger than max_bytes are not cached.
+        
+        Args:
+            key: Cache key
+            value: Value to store
+            size: Size of the value in bytes, counted against max_bytes
+        """
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            
+            self._entries[key] = (value, size, self.clock() + self.ttl)
+            self.current_bytes += size
+            
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+    
+    def pop(self, key, default=None):
+        """
+        Remove a value from the cache and return it.
+        
+        Args:
+            key: Cache key
+            default: Value returned when the key is missing
+            
+        Returns:
+            The removed value or default
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+            return self._remove(key)
+    
+    def purge_expired(self):
+        """Drop every entry whose time-to-live has passed."""
+        with self._lock:
+            now = self.clock()
+            for key in [key for key, entry in self._entries.items() if entry[2] <= now]:
+                self._remove(key)
+    
+    def _remove(self, key):
+        value, size, expires = self._entries.pop(key)
+        self.current_bytes -= size
+        return value
@@ -0,0 +1,191 @@
+"""
+Indexed pool of pre-decoded cover images.
+
+Adding an image to a pool decodes it once and stores its RGB pixels as a
+.npy file, next to an index of each carrier's dimensions, mode and channel
+count kept sorted by size. Encoding then picks the smallest carrier that
+fits a payload with a binary search and memory-maps its pixels (see
+RawCarrier), so neither choosing nor decoding a cover costs anything per
+message.
+
+Usage:
+    python carrierpool.py POOL_DIR image.png [more images or directories ...]
+"""
+import argparse
+import bisect
+import json
+import os
+import sys
+import numpy as np
+from stegano import Steganography, SteganographyError, Carrier, RawCarrier, HEADER_BITS
+from batch import list_images
+
+# Index file kept in the pool directory, and its format version
+INDEX_FILENAME = 'index.json'
+INDEX_VERSION = 1
+
+class CarrierPool:
+    """
+    A directory of pre-decoded carriers with a capacity-sorted index.
+    
+    Entries are kept sorted by channel count; since capacity grows with the
+    channel count for any bits-per-channel setting, one sorted list serves
+    best-fit lookups for every setting.
+    """
+    
+    def __init__(self, directory):
+        """
+        Open a pool, reading its index if it has one.
+        
+        Args:
+            directory: Pool directory (created when the first carrier is added)
+        """
+        self.directory = directory
+        self.entries = []
+        
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, encoding='utf-8') as f:
+                    index = json.load(f)
+            except (OSError, ValueError) as e:
+                raise SteganographyError(f"Error reading carrier pool index: {str(e)}")
+            if index.get('version') != INDEX_VERSION:
+                raise SteganographyError(f"Unsupported carrier pool index version: {index.get('version')}")
+            self.entries = sorted(index['carriers'], key=lambda entry: entry['channels'])
+        
+        # Sorted channel counts searched by find()
+        self._channels = [entry['channels'] for entry in self.entries]
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    @property
+    def index_path(self):
+        """Path to the pool's index file."""
+        return os.path.join(self.directory, INDEX_FILENAME)
+    
+    def save_index(self):
+        """Write the index, replacing the old one atomically."""
+        temporary_path = self.index_path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'carriers': self.entries}, f, indent=2)
+        os.replace(temporary_path, self.index_path)
+    
+    def add(self, image_path, name=None):
+        """
+        Decode an image and add its pixels to the pool.
+        
+        Args:
+            image_path: Path to the cover image
+            name: Carrier name (defaults to the image's file name stem)
+        
+        Returns:
+            dict: The new index entry
+        """
+        name = name or os.path.splitext(os.path.basename(image_path))[0]
+        if any(entry['name'] == name for entry in self.entries):
+            raise SteganographyError(f"The pool already has a carrier named '{name}'")
+        
+        carrier = Carrier.load(image_path)
+        pixels = carrier.pixels
+        if pixels.ndim != 3 or pixels.shape[2] != 3:
+            raise SteganographyError("Only RGB carriers can be added to a pool")
+        
+        os.makedirs(self.directory, exist_ok=True)
+        filename = f"{name}.npy"
+        np.save(os.path.join(self.directory, filename), pixels)
+        
+        entry = {
+            'name': name,
+            'file': filename,
+            'source': os.path.abspath(image_path),
+            'width': carrier.width,
+            'height': carrier.height,
+            'mode': carrier.mode,
+            'channels': int(pixels.size),
+        }
+        position = bisect.bisect_right(self._channels, entry['channels'])
+        self.entries.insert(position, entry)
+        self._channels.insert(position, entry['channels'])
+        self.save_index()
+        return entry
+    
+    def capacity(self, entry, bits_per_channel=1, matrix=0):
+        """
+        Return the payload capacity of a pool entry in bytes.
+        
+        Args:
+            entry: Index entry
+            bits_per_channel: Number of LSBs used per channel value
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        
+        Returns:
+            int: Number of payload bytes that fit after the header
+        """
+        return Steganography.max_payload_size(entry['channels'], bits_per_channel, matrix)
+    
+    def find(self, payload_size, bits_per_channel=1, matrix=0):
+        """
+        Find the smallest carrier that can hold a payload.
+        
+        Args:
+            payload_size: Stored payload size in bytes
+            bits_per_channel: Number of LSBs used per channel value
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        
+        Returns:
+            dict or None: Index entry, or None if no carrier is large enough
+        """
+        needed = HEADER_BITS + Steganography.channels_needed(payload_size, bits_per_channel, matrix)
+        position = bisect.bisect_left(self._channels, needed)
+        return self.entries[position] if position < len(self.entries) else None
+    
+    def pick(self, payload_size, bits_per_channel=1, instrumentation=None, matrix=0):
+        """
+        Open the best-fitting carrier for a payload.
+        
+        The carrier's pixels are mapped copy-on-write, so embedding never
+        changes the pool.
+        
+        Args:
+            payload_size: Stored payload size in bytes (see Steganography.compress_message)
+            bits_per_channel: Number of LSBs used per channel value
+            instrumentation: Optional Instrumentation recording stage timings
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        
+        Returns:
+            RawCarrier: The mapped carrier
+        """
+        bits_per_channel = Steganography.check_bits_per_channel(bits_per_channel)
+        matrix = Steganography.check_matrix(matrix)
+        entry = self.find(payload_size, bits_per_channel, matrix)
+        if entry is None:
+            if not self.entries:
+                raise SteganographyError("The carrier pool is empty")
+            raise SteganographyError(
+                f"No carrier in the pool can hold {payload_size} bytes "
+                f"(the largest holds {self.capacity(self.entries[-1], bits_per_channel, matrix)} bytes)")
+        return RawCarrier(os.path.join(self.directory, entry['file']), instrumentation)
+
+def main():
+    """Add images (or every image in the given directories) to a carrier pool."""
+    parser = argparse.ArgumentParser(description="Add cover images to a pre-decoded carrier pool")
+    parser.add_argument('pool', help='Pool directory')
+    parser.add_argument('images', nargs='+', help='Images or directories of images to add')
+    args = parser.parse_args()
+    
+    pool = CarrierPool(args.pool)
+    for source in args.images:
+        for image_path in list_images(source) if os.path.isdir(source) else [source]:
+            try:
+                entry = pool.add(image_path)
+            except SteganographyError as e:
+                print(f"Skipped {image_path}: {str(e)}")
+                continue
+            print(f"Added {entry['name']}: {entry['width']}x{entry['height']}, "
+                  f"capacity {pool.capacity(entry)} bytes")
+    print(f"The pool now holds {len(pool)} carriers.")
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
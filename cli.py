@@ -4,16 +4,36 @@ Command-line interface for the steganography application.
 import argparse
 import os
 import sys
+import time
 import logging
-from stegano import Steganography, SteganographyError
+from stegano import (
+    Steganography,
+    SteganographyError,
+    Carrier,
+    JPEGCarrier,
+    Instrumentation,
+    MIN_BITS_PER_CHANNEL,
+    MAX_BITS_PER_CHANNEL,
+    MIN_MATRIX_K,
+    MAX_MATRIX_K,
+    OUTPUT_FORMATS,
+    JPEG_OUTPUT_FORMAT,
+    SAVE_PROFILES,
+    DEFAULT_SAVE_PROFILE,
+    COMPRESSION_CHOICES
+)
 from utils import (
-    validate_image_path, 
+    SUPPORTED_FORMATS,
     validate_output_path, 
     display_progress, 
     estimate_encoding_capacity,
-    is_likely_steganographic_image,
+    steganalysis_score,
+    STEGANALYSIS_THRESHOLD,
     safe_text_read
 )
+from batch import collect_items, list_images, run_batch, build_report, write_report
+from sharding import encode_sharded, decode_sharded
+from carrierpool import CarrierPool
 
 def parse_arguments():
     """
@@ -32,8 +52,18 @@ def parse_arguments():
     operation_group.add_argument('-e', '--encode', action='store_true', help='Encode text into an image')
     operation_group.add_argument('-d', '--decode', action='store_true', help='Decode text from an image')
     
-    # Image input is always required
-    parser.add_argument('-i', '--image', required=True, help='Path to the input image')
+    # Image input: a single image, a batch source, a set of shard carriers or a carrier pool
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument('-i', '--image', help='Path to the input image')
+    input_group.add_argument('--batch', metavar='SOURCE',
+                             help='Process many images: a directory, a glob pattern or a CSV manifest '
+                                  'of image,payload,output rows')
+    input_group.add_argument('--shards', metavar='SOURCE',
+                             help='Split one message across the images in a directory or glob pattern '
+                                  '(encoding), or reassemble it from them in any order (decoding)')
+    input_group.add_argument('--pool', metavar='DIR',
+                             help='Encode into the smallest pre-decoded carrier from a pool directory '
+                                  'that fits the message (see carrierpool.py)')
     
     # Text argument for encoding
     text_group = parser.add_mutually_exclusive_group()
@@ -43,50 +73,195 @@ def parse_arguments():
     # Output image path for encoding
     parser.add_argument('-o', '--output', help='Path for the output image (encoding only)')
     
+    # Payload bits per color channel for encoding
+    parser.add_argument('-b', '--bits', type=int, default=1, choices=range(MIN_BITS_PER_CHANNEL, MAX_BITS_PER_CHANNEL + 1),
+                        help='Bits hidden per color channel (1-4); higher values fit more text '
+                             'in smaller images at the cost of visibility (encoding and --capacity)')
+    parser.add_argument('-m', '--matrix', type=int, default=0, metavar='K',
+                        choices=(0,) + tuple(range(MIN_MATRIX_K, MAX_MATRIX_K + 1)),
+                        help=f'Matrix embedding: hide K bits in each block of 2^K-1 channels, changing at most '
+                             f'one ({MIN_MATRIX_K}-{MAX_MATRIX_K}; fewer changed pixels for less capacity; '
+                             f'needs -b 1; encoding and --capacity)')
+    
+    # Output image format and compression trade-off for encoding
+    parser.add_argument('--format', choices=OUTPUT_FORMATS + (JPEG_OUTPUT_FORMAT,),
+                        help='Output format (default: from the --output extension, or png; '
+                             'raw BMP/PPM/PGM/.npy carriers keep their own format; jpeg keeps a JPEG '
+                             'carrier as JPEG, hiding the text in its DCT coefficients)')
+    parser.add_argument('--save-profile', choices=SAVE_PROFILES, default=DEFAULT_SAVE_PROFILE,
+                        help='Output compression: fast (larger files), balanced or smallest (slower)')
+    
+    # Payload compression before embedding
+    parser.add_argument('-z', '--compress', choices=COMPRESSION_CHOICES, default='auto',
+                        help='Compress the text before hiding it; auto keeps the smallest result (default: auto)')
+    
     # Authentication code for decoding
     parser.add_argument('-a', '--auth', help='Authentication code for decoding protected images')
     
+    # Keyed scattered embedding
+    parser.add_argument('--scatter', action='store_true',
+                        help='Scatter the message over the image in an order seeded by the auth code (encoding only)')
+    parser.add_argument('-p', '--passphrase',
+                        help='Scatter the message in an order seeded by this passphrase (needed again to decode)')
+    
+    # Batch options
+    parser.add_argument('--workers', type=int,
+                        help='Number of worker processes for --batch and --shards (default: CPU count)')
+    parser.add_argument('--ordered', action='store_true',
+                        help='Report --batch results in input order instead of as they finish')
+    parser.add_argument('--output-dir', help='Directory for encoded images in --batch and --shards mode')
+    parser.add_argument('--report', help='Write a JSON summary of a --batch run to this path')
+    
     # Additional options
+    parser.add_argument('--profile', action='store_true',
+                        help='Print per-stage timings (open, decode, convert, embed, save, ...) after the operation')
     parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
     parser.add_argument('--capacity', action='store_true', help='Show the image capacity without encoding/decoding')
     
     args = parser.parse_args()
     
     # Validate arguments
-    if args.encode and not (args.text or args.file):
+    manifest = args.batch and args.batch.lower().endswith('.csv')
+    if args.encode and not (args.text or args.file or manifest):
         parser.error("Encoding requires either --text or --file argument")
     
     if args.output and not args.encode:
         parser.error("--output can only be used with --encode")
     
+    if args.scatter and not args.encode:
+        parser.error("--scatter can only be used with --encode")
+    
+    if args.batch and (args.output or args.capacity):
+        parser.error("--output and --capacity cannot be used with --batch")
+    
+    if args.shards and (args.output or args.capacity):
+        parser.error("--output and --capacity cannot be used with --shards")
+    
+    if args.pool and (not args.encode or args.capacity):
+        parser.error("--pool can only be used with --encode")
+    
+    if args.matrix and args.bits != 1:
+        parser.error("--matrix hides 1 bit per channel; it cannot be combined with -b/--bits above 1")
+    
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    
     return args
 
-def show_capacity(image_path):
+def load_carrier(image_path, instrumentation=None):
     """
-    Show the estimated capacity of the image for steganography.
+    Open and decode the input image once, exiting if it is not supported.
     
     Args:
         image_path: Path to the image file
+        instrumentation: Optional Instrumentation recording stage timings
+        
+    Returns:
+        Carrier: The loaded image
     """
-    if not validate_image_path(image_path):
+    try:
+        carrier = Carrier.load(image_path, instrumentation)
+    except SteganographyError:
+        carrier = None
+    
+    if carrier is None or carrier.format not in SUPPORTED_FORMATS:
         print(f"Error: '{image_path}' is not a valid image file or is not supported.")
         sys.exit(1)
     
-    capacity = estimate_encoding_capacity(image_path)
-    print(f"Image capacity: Approximately {capacity} characters")
+    return carrier
 
-def run_encode(args):
+def pick_pool_carrier(args, text, auth_code, instrumentation=None):
     """
-    Run the encoding operation.
+    Pick the best-fitting carrier for a message from the carrier pool, exiting on failure.
     
     Args:
         args: Command-line arguments
+        text: Text to encode
+        auth_code: Auth code the message will be encoded with
+        instrumentation: Optional Instrumentation recording stage timings
+        
+    Returns:
+        tuple: (The mapped RawCarrier, (codec, payload) from
+            Steganography.compress_message to encode without compressing again)
     """
-    # Validate input image
-    if not validate_image_path(args.image):
-        print(f"Error: '{args.image}' is not a valid image file or is not supported.")
+    if not os.path.isdir(args.pool):
+        print(f"Error: Carrier pool '{args.pool}' does not exist.")
+        sys.exit(1)
+    
+    try:
+        pool = CarrierPool(args.pool)
+        compressed = Steganography.compress_message(text, auth_code, args.compress)
+        size = Steganography.payload_size(compressed[1])
+        carrier = pool.pick(size, args.bits, instrumentation, args.matrix)
+    except SteganographyError as e:
+        print(f"Error: {str(e)}")
         sys.exit(1)
     
+    if args.verbose:
+        print(f"Picked carrier '{carrier.filename}' ({carrier.width}x{carrier.height}) for {size} bytes")
+    return carrier, compressed
+
+def show_efficiency(bits_per_channel=1, matrix=0):
+    """
+    Print the expected embedding efficiency of an embedding setting.
+    
+    Args:
+        bits_per_channel: Number of LSBs used per channel value
+        matrix: Matrix embedding k, or 0 for plain LSB embedding
+    """
+    efficiency = Steganography.embedding_efficiency(bits_per_channel, matrix)
+    if matrix:
+        print(f"Matrix embedding (k={matrix}): {matrix} bits per block of {Steganography.block_size(matrix)} "
+              f"channels, about {efficiency:.2f} bits per changed channel "
+              f"(plain LSB: {Steganography.embedding_efficiency():.2f})")
+    else:
+        print(f"Embedding efficiency: about {efficiency:.2f} bits per changed channel")
+
+def show_capacity(image_path, bits_per_channel=1, matrix=0):
+    """
+    Show the estimated capacity of the image for steganography.
+    
+    Args:
+        image_path: Path to the image file
+        bits_per_channel: Number of LSBs used per channel value
+        matrix: Matrix embedding k, or 0 for plain LSB embedding
+    """
+    carrier = load_carrier(image_path)
+    setting = f"matrix embedding, k={matrix}" if matrix else f"{bits_per_channel} bit(s) per channel"
+    
+    # JPEGs saved as JPEG hold 1 bit per usable DCT coefficient instead (less
+    # when some blocks do not survive re-encoding, see JPEGCarrier.save)
+    if isinstance(carrier, JPEGCarrier) and carrier.dct_supported:
+        jpeg_capacity = carrier.capacity(1, matrix)
+        carrier = carrier.for_format(OUTPUT_FORMATS[0])
+        print(f"Lossless output capacity: Approximately {carrier.capacity(bits_per_channel, matrix)} characters "
+              f"({setting})")
+        print(f"JPEG output capacity (--format jpeg): At most {jpeg_capacity} characters "
+              f"({f'matrix embedding, k={matrix}' if matrix else '1 bit per DCT coefficient'})")
+    elif matrix:
+        print(f"Image capacity: Approximately {carrier.capacity(bits_per_channel, matrix)} characters ({setting})")
+    else:
+        capacity = estimate_encoding_capacity(carrier, bits_per_channel)
+        print(f"Image capacity: Approximately {capacity} characters ({setting})")
+    show_efficiency(bits_per_channel, matrix)
+
+def show_profile(instrumentation):
+    """
+    Print the per-stage timings recorded during an operation.
+    
+    Args:
+        instrumentation: Instrumentation holding the recorded stages
+    """
+    print("\nStage timings:")
+    print(instrumentation.format_table())
+
+def run_encode(args):
+    """
+    Run the encoding operation.
+    
+    Args:
+        args: Command-line arguments
+    """
     # Get text to encode
     text = ""
     if args.text:
@@ -103,27 +278,36 @@ def run_encode(args):
         print(f"Error: Cannot write to '{args.output}'. Check directory permissions.")
         sys.exit(1)
     
-    # Check capacity
-    try:
-        if not Steganography.can_encode(args.image, text):
-            print("Error: Text is too large for this image.")
-            capacity = estimate_encoding_capacity(args.image)
-            print(f"Maximum capacity: ~{capacity} characters. Your text: {len(text)} characters")
-            sys.exit(1)
-    except SteganographyError as e:
-        print(f"Error: {str(e)}")
-        sys.exit(1)
+    # Validate and load the input image, or pick one from the carrier pool
+    instrumentation = Instrumentation() if args.profile else None
+    output_path, auth_code, compressed = args.output, None, None
+    if args.pool:
+        # The auth code is fixed first so the message size is exact
+        auth_code = Steganography.generate_auth_code()
+        carrier, compressed = pick_pool_carrier(args, text, auth_code, instrumentation)
+        if not output_path:
+            name = os.path.splitext(os.path.basename(carrier.filename))[0]
+            output_path = f"{name}_encoded.{args.format or 'png'}"
+    else:
+        carrier = load_carrier(args.image, instrumentation)
     
-    # Encode the message
+    # Encode the message (the capacity is checked against the compressed size)
     try:
         print("Encoding message into image...")
-        output_path, auth_code = Steganography.encode(args.image, text, args.output)
+        output_path, auth_code = Steganography.encode(
+            carrier, text, output_path, args.bits, args.format, args.save_profile, args.compress,
+            args.scatter, args.passphrase, auth_code, args.matrix, compressed)
         print(f"Success! Encoded image saved at: {output_path}")
+        if args.matrix or args.verbose:
+            show_efficiency(args.bits, args.matrix)
         print(f"IMPORTANT: Your authentication code is: {auth_code}")
         print("Keep this code safe! You will need it to decode the message.")
     except SteganographyError as e:
         print(f"Error: {str(e)}")
         sys.exit(1)
+    
+    if instrumentation:
+        show_profile(instrumentation)
 
 def run_decode(args):
     """
@@ -132,31 +316,38 @@ def run_decode(args):
     Args:
         args: Command-line arguments
     """
-    # Validate input image
-    if not validate_image_path(args.image):
-        print(f"Error: '{args.image}' is not a valid image file or is not supported.")
-        sys.exit(1)
-    
-    # Check if image likely contains hidden data
-    if not is_likely_steganographic_image(args.image):
-        print("Warning: This image may not contain hidden data or uses a different steganography method.")
+    # Validate and load the input image
+    instrumentation = Instrumentation() if args.profile else None
+    carrier = load_carrier(args.image, instrumentation)
     
     # Decode the message
     try:
         print("Extracting hidden message from image...")
         
         # First attempt to decode without auth code
-        result = Steganography.decode(args.image)
+        result = Steganography.decode(carrier, passphrase=args.passphrase)
+        
+        # Check if image likely contains hidden data (this decodes every pixel,
+        # so it is skipped when a header was found by reading only a few rows)
+        if args.verbose or not result:
+            score = steganalysis_score(carrier)
+            if args.verbose:
+                print(f"Steganalysis score: {score:.2f}")
+            if score < STEGANALYSIS_THRESHOLD and not Steganography.has_header(carrier.flattened):
+                print("Warning: This image may not contain hidden data or uses a different steganography method.")
         
         # Check if authentication is required
         if isinstance(result, dict) and result.get('auth_required'):
             if not args.auth:
                 print("\nThis image requires an authentication code to decode.")
-                print("Please run again with the -a/--auth parameter and the 4-digit code.")
+                if result.get('stored_code') is None:
+                    print("The message is scattered; run again with -a/--auth or the -p/--passphrase it was hidden with.")
+                else:
+                    print("Please run again with the -a/--auth parameter and the 4-digit code.")
                 sys.exit(0)
             else:
                 # Try again with the provided auth code
-                extracted_text = Steganography.decode(args.image, args.auth)
+                extracted_text = Steganography.decode(carrier, args.auth, args.passphrase)
         else:
             extracted_text = result
         
@@ -171,6 +362,159 @@ def run_decode(args):
     except SteganographyError as e:
         print(f"Error: {str(e)}")
         sys.exit(1)
+    
+    if instrumentation:
+        show_profile(instrumentation)
+
+def run_batch_mode(args):
+    """
+    Run an encoding or decoding operation over many images in parallel.
+    
+    Args:
+        args: Command-line arguments
+    """
+    operation = 'encode' if args.encode else 'decode'
+    
+    # Text (or auth code) shared by every image (manifest rows may supply their own)
+    text = None
+    if operation == 'decode':
+        text = args.auth
+    elif args.text:
+        text = args.text
+    elif args.file:
+        try:
+            text = safe_text_read(args.file)
+        except Exception as e:
+            print(f"Error reading text file: {str(e)}")
+            sys.exit(1)
+    
+    if args.output_dir and not os.path.isdir(args.output_dir):
+        print(f"Error: Output directory '{args.output_dir}' does not exist.")
+        sys.exit(1)
+    
+    try:
+        items = collect_items(args.batch, operation, text, args.output_dir, args.format or 'png')
+    except (OSError, ValueError) as e:
+        print(f"Error reading batch source: {str(e)}")
+        sys.exit(1)
+    
+    if not items:
+        print(f"No supported images found in '{args.batch}'.")
+        sys.exit(1)
+    
+    print(f"Processing {len(items)} images with {args.workers or os.cpu_count()} workers...")
+    started = time.perf_counter()
+    results = []
+    
+    if operation == 'encode':
+        options = {
+            'bits_per_channel': args.bits,
+            'output_format': args.format,
+            'save_profile': args.save_profile,
+            'compression': args.compress,
+            'scatter': args.scatter,
+            'passphrase': args.passphrase,
+            'matrix': args.matrix,
+        }
+    else:
+        options = {'passphrase': args.passphrase}
+    for done, result in enumerate(run_batch(items, args.workers, args.ordered, options, args.profile), 1):
+        results.append(result)
+        
+        # Print each result above the aggregate progress bar
+        if result['status'] != 'ok':
+            line = f"FAILED {result['image']}: {result['error']}"
+        elif operation == 'encode':
+            line = f"{result['image']} -> {result['output']} (auth code: {result['auth_code']})"
+        elif result['output']:
+            line = f"{result['image']} -> {result['output']}"
+        else:
+            line = f"{result['image']}: {result['message']}"
+        sys.stdout.write('\r\033[K' + line + '\n')
+        display_progress(done, len(items))
+    
+    report = build_report(results, operation, args.workers, time.perf_counter() - started)
+    print(f"Done: {report['succeeded']} succeeded, {report['failed']} failed in {report['seconds']:.2f}s")
+    
+    if args.report:
+        try:
+            write_report(report, args.report)
+            print(f"Report written to: {args.report}")
+        except OSError as e:
+            print(f"Error writing report: {str(e)}")
+            sys.exit(1)
+    
+    sys.exit(1 if report['failed'] else 0)
+
+def run_shard_mode(args):
+    """
+    Split a message across several images, or reassemble it from them.
+    
+    Args:
+        args: Command-line arguments
+    """
+    try:
+        images = list_images(args.shards)
+    except OSError as e:
+        print(f"Error reading shard source: {str(e)}")
+        sys.exit(1)
+    
+    if not images:
+        print(f"No supported images found in '{args.shards}'.")
+        sys.exit(1)
+    
+    if args.decode:
+        try:
+            print(f"Reassembling hidden message from {len(images)} images...")
+            result = decode_sharded(images, args.auth, args.passphrase, args.workers)
+        except SteganographyError as e:
+            print(f"Error: {str(e)}")
+            sys.exit(1)
+        
+        if isinstance(result, dict):
+            print("\nThis message requires an authentication code to decode.")
+            if result.get('stored_code') is None:
+                print("The shards are scattered; run again with -a/--auth or the -p/--passphrase they were hidden with.")
+            else:
+                print("Please run again with the -a/--auth parameter and the 4-digit code.")
+            sys.exit(0)
+        
+        print("\nExtracted message:")
+        print("-" * 40)
+        print(result)
+        print("-" * 40)
+        sys.exit(0)
+    
+    # Get text to encode
+    text = ""
+    if args.text:
+        text = args.text
+    elif args.file:
+        try:
+            text = safe_text_read(args.file)
+        except Exception as e:
+            print(f"Error reading text file: {str(e)}")
+            sys.exit(1)
+    
+    if args.output_dir and not os.path.isdir(args.output_dir):
+        print(f"Error: Output directory '{args.output_dir}' does not exist.")
+        sys.exit(1)
+    
+    try:
+        print(f"Splitting message across up to {len(images)} images...")
+        outputs, auth_code = encode_sharded(
+            images, text, args.output_dir, args.bits, args.format, args.save_profile, args.compress,
+            args.scatter, args.passphrase, args.workers, args.matrix)
+    except SteganographyError as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+    
+    print(f"Success! Message split into {len(outputs)} shard(s):")
+    for output_path in outputs:
+        print(f"  {output_path}")
+    print(f"IMPORTANT: Your authentication code is: {auth_code}")
+    print("Keep this code safe! You will need it and every shard image to decode the message.")
+    sys.exit(0)
 
 def main():
     """Main entry point for the CLI application."""
@@ -180,9 +524,17 @@ def main():
     log_level = logging.DEBUG if args.verbose else logging.INFO
     logging.basicConfig(level=log_level, format='%(levelname)s: %(message)s')
     
+    # Batch mode handles many images in one run
+    if args.batch:
+        run_batch_mode(args)
+    
+    # Shard mode spreads one message over many images
+    if args.shards:
+        run_shard_mode(args)
+    
     # Show capacity if requested
     if args.capacity:
-        show_capacity(args.image)
+        show_capacity(args.image, args.bits, args.matrix)
         sys.exit(0)
     
     # Run appropriate operation
@@ -0,0 +1,210 @@
+"""
+Background job queue for the steganography web application.
+
+Encode and decode work is handed to a thread pool so a request can return a
+job ID straight away. Progress is reported through the Instrumentation stage
+callback, and watchers can block until a job changes (used by the
+Server-Sent Events stream). This in-process queue stands in for an external
+broker; jobs live only as long as the process.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from stegano import Instrumentation
+
+# Job states, in the order a job moves through them
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_ERROR = 'error'
+FINISHED_STATES = (JOB_DONE, JOB_ERROR)
+
+class Job:
+    """
+    A unit of background work with observable status and progress.
+    
+    Every change bumps `version` and wakes threads blocked in wait().
+    """
+    
+    def __init__(self, kind, clock=time.monotonic):
+        """
+        Create a queued job.
+        
+        Args:
+            kind: Job type, e.g. 'encode' or 'decode'
+            clock: Function returning the current time in seconds
+        """
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = JOB_QUEUED
+        self.progress = 0.0
+        self.stage = None
+        self.result = None
+        self.error = None
+        self.recorder = None
+        self.version = 0
+        self.clock = clock
+        self.created = clock()
+        self.finished = None
+        self._changed = threading.Condition()
+    
+    @property
+    def done(self):
+        """True once the job has succeeded or failed."""
+        return self.status in FINISHED_STATES
+    
+    def update(self, **fields):
+        """
+        Change job fields and notify watchers.
+        
+        Args:
+            **fields: Attributes to set (status, progress, stage, result, error)
+        """
+        with self._changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            if self.done and self.finished is None:
+                self.finished = self.clock()
+            self.version += 1
+            self._changed.notify_all()
+    
+    def wait(self, version, timeout=None):
+        """
+        Block until the job changes past a known version.
+        
+        Args:
+            version: Last version seen by the caller
+            timeout: Maximum time to wait in seconds
+        
+        Returns:
+            int: The current version (unchanged if the wait timed out)
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+    
+    def instrumentation(self, expected_stages):
+        """
+        Create an Instrumentation that reports progress on this job.
+        
+        Progress is the share of expected stages that have finished. The
+        recorder is kept as `recorder` so its timings can be reported later.
+        
+        Args:
+            expected_stages: Names of the stages the job will record
+        
+        Returns:
+            Instrumentation: Recorder whose callback updates the job
+        """
+        expected = set(expected_stages)
+        
+        def report(record):
+            completed = sum(1 for stage in self.recorder.stages if stage['name'] in expected)
+            self.update(stage=record['name'], progress=min(1.0, completed / max(1, len(expected))))
+        
+        self.recorder = Instrumentation(callback=report)
+        return self.recorder
+    
+    def to_dict(self):
+        """
+        Describe the job for status responses.
+        
+        Returns:
+            dict: id, kind, status, progress, stage, error and stage timings
+        """
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': round(self.progress, 3),
+            'stage': self.stage,
+            'error': self.error,
+            'stages': [{'name': stage['name'], 'ms': round(stage['seconds'] * 1000, 2)}
+                       for stage in (self.recorder.stages if self.recorder else [])],
+        }
+
+class JobQueue:
+    """
+    Runs jobs on a thread pool and keeps them for polling until they expire.
+    
+    Threads are used rather than processes so progress callbacks and results
+    can be shared directly; NumPy and Pillow release the GIL for the heavy
+    pixel work.
+    """
+    
+    def __init__(self, workers=2, ttl=600, clock=time.monotonic):
+        """
+        Create the queue and its worker pool.
+        
+        Args:
+            workers: Number of worker threads
+            ttl: Seconds a finished job is kept for polling
+            clock: Function returning the current time in seconds
+        """
+        self.ttl = ttl
+        self.clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stego-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+    
+    def submit(self, kind, function, *args, **kwargs):
+        """
+        Queue a job.
+        
+        The function is called as function(job, *args, **kwargs) on a worker
+        thread; its return value becomes the job result and any exception
+        marks the job as failed.
+        
+        Args:
+            kind: Job type, e.g. 'encode' or 'decode'
+            function: Callable doing the work
+        
+        Returns:
+            Job: The queued job
+        """
+        self.purge_expired()
+        job = Job(kind, self.clock)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, function, args, kwargs)
+        return job
+    
+    def get(self, job_id):
+        """
+        Look up a job by ID.
+        
+        Args:
+            job_id: Job ID returned by submit
+        
+        Returns:
+            Job or None: The job, or None if unknown or expired
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def purge_expired(self):
+        """Drop finished jobs older than the time-to-live."""
+        cutoff = self.clock() - self.ttl
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if job.finished is not None and job.finished <= cutoff]:
+                del self._jobs[job_id]
+    
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and optionally wait for running ones."""
+        self._executor.shutdown(wait=wait)
+    
+    @staticmethod
+    def _run(job, function, args, kwargs):
+        job.update(status=JOB_RUNNING)
+        try:
+            result = function(job, *args, **kwargs)
+        except Exception as e:
+            job.update(status=JOB_ERROR, error=str(e))
+        else:
+            job.update(status=JOB_DONE, progress=1.0, result=result)
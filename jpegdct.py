@@ -0,0 +1,238 @@
+"""
+Quantized DCT coefficients of JPEG luma, computed with NumPy.
+
+JPEG stores each 8x8 block of an image as DCT coefficients divided by a
+quantization table and rounded. Recomputing them from the decoded luma
+plane with the same tables gives back the stored values, so a payload can
+be hidden in their least significant bits (JSteg style) and written out as
+a JPEG with the original tables, keeping the file about the same size.
+
+Only AC coefficients (not the DC term) with a magnitude of at least 2 carry
+data, so setting the lowest bit never turns them into zeros or ones, and
+only in table positions with a quantization step of at least
+MIN_QUANT_STEP; smaller steps (quality 90 and above) let pixel rounding
+move coefficients. The round trip through pixels is still not exact for
+every block: blocks whose samples would clip at 0 or 255 cannot be stored
+as computed, and rounding occasionally moves a coefficient. settle()
+pulls clipping blocks back into range before encoding, and blocks that
+still come back wrong are rebuilt from what was read (see set_parity and
+perturb) until the encoded image reads back exactly.
+"""
+import os
+import numpy as np
+
+JPEG_SIGNATURE = b'\xff\xd8\xff'
+
+# Width and height of a DCT block
+BLOCK_SIZE = 8
+
+# Smallest coefficient magnitude and quantization step used for data
+MIN_COEFFICIENT = 2
+MIN_QUANT_STEP = 3
+
+# Distance from 0 and 255 that settle() pulls clipping blocks to, and the
+# most projections it tries per call
+CLIP_MARGIN = 2
+SETTLE_ROUNDS = 8
+
+def _dct_matrix(size=BLOCK_SIZE):
+    """Return the orthonormal DCT-II matrix C, so that C @ block @ C.T is the 2-D DCT."""
+    k = np.arange(size)
+    matrix = np.sqrt(2 / size) * np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+DCT_MATRIX = _dct_matrix()
+
+def is_jpeg(source):
+    """
+    Check whether a path or seekable stream holds a JPEG image.
+    
+    Args:
+        source: Path or binary file-like object (its position is restored)
+    
+    Returns:
+        bool: True if the data starts with a JPEG signature
+    """
+    try:
+        if isinstance(source, (str, os.PathLike)):
+            if not os.path.isfile(source):
+                return False
+            with open(source, 'rb') as f:
+                signature = f.read(len(JPEG_SIGNATURE))
+        else:
+            position = source.tell()
+            signature = source.read(len(JPEG_SIGNATURE))
+            source.seek(position)
+    except (OSError, AttributeError, ValueError):
+        return False
+    return signature == JPEG_SIGNATURE
+
+def quant_table(quantization, index=0):
+    """
+    Return one of an image's quantization tables as an 8x8 array.
+    
+    Args:
+        quantization: Pillow's `quantization` dict (tables in natural order)
+        index: Table number (0 is used for luma)
+    
+    Returns:
+        numpy.ndarray: float64 array of shape (8, 8)
+    """
+    return np.asarray(quantization[index], dtype=np.float64).reshape(BLOCK_SIZE, BLOCK_SIZE)
+
+def to_blocks(plane):
+    """
+    View the whole 8x8 blocks of a plane as an array of blocks.
+    
+    Partial blocks at the right and bottom edges are left out.
+    
+    Args:
+        plane: 2-D array
+    
+    Returns:
+        numpy.ndarray: View of shape (block rows, block columns, 8, 8)
+    """
+    rows, columns = plane.shape[0] // BLOCK_SIZE, plane.shape[1] // BLOCK_SIZE
+    cropped = plane[:rows * BLOCK_SIZE, :columns * BLOCK_SIZE]
+    return cropped.reshape(rows, BLOCK_SIZE, columns, BLOCK_SIZE).swapaxes(1, 2)
+
+def forward(plane, table):
+    """
+    Compute the quantized DCT coefficients of a plane's whole blocks.
+    
+    Args:
+        plane: 2-D uint8 sample array (e.g. the Y plane of a YCbCr image)
+        table: 8x8 quantization table (see quant_table)
+    
+    Returns:
+        numpy.ndarray: int32 coefficients of shape (block rows, block columns, 8, 8)
+    """
+    blocks = to_blocks(plane).astype(np.float64) - 128
+    return np.rint(DCT_MATRIX @ blocks @ DCT_MATRIX.T / table).astype(np.int32)
+
+def inverse(coefficients, table):
+    """
+    Reconstruct 8-bit samples from quantized DCT coefficients.
+    
+    Args:
+        coefficients: Integer array of shape (..., 8, 8)
+        table: 8x8 quantization table
+    
+    Returns:
+        numpy.ndarray: uint8 blocks of the same shape
+    """
+    blocks = DCT_MATRIX.T @ (coefficients * table) @ DCT_MATRIX + 128
+    return np.clip(np.rint(blocks), 0, 255).astype(np.uint8)
+
+def usable_positions(table):
+    """Return the 8x8 mask of block positions whose coefficients may carry data."""
+    positions = table >= MIN_QUANT_STEP
+    positions[0, 0] = False
+    return positions
+
+def usable_mask(coefficients, table):
+    """
+    Select the coefficients that can carry payload bits.
+    
+    Args:
+        coefficients: Quantized coefficients from forward()
+        table: The quantization table they were computed with
+    
+    Returns:
+        numpy.ndarray: Boolean mask of the same shape
+    """
+    return (np.abs(coefficients) >= MIN_COEFFICIENT) & usable_positions(table)
+
+def set_parity(coefficients, usable, parity, signs, table):
+    """
+    Give usable coefficients the lowest bits they must hold.
+    
+    Usable coefficients keep a magnitude of at least MIN_COEFFICIENT with
+    the given lowest bit; any other coefficient in a usable position is
+    clamped below MIN_COEFFICIENT so the usable mask does not change.
+    
+    Args:
+        coefficients: Integer array of shape (..., 8, 8)
+        usable: Boolean mask of the coefficients carrying data
+        parity: Lowest bit each usable coefficient must have
+        signs: Signs used where a usable coefficient is zero
+        table: 8x8 quantization table
+    
+    Returns:
+        numpy.ndarray: The adjusted coefficients
+    """
+    signs = np.where(coefficients != 0, np.sign(coefficients), signs)
+    magnitudes = (np.maximum(np.abs(coefficients), MIN_COEFFICIENT) & ~1) | parity
+    adjusted = np.where(usable, signs * magnitudes, coefficients)
+    stray = ~usable & usable_positions(table) & (np.abs(adjusted) >= MIN_COEFFICIENT)
+    return np.where(stray, np.sign(adjusted) * (MIN_COEFFICIENT - 1), adjusted)
+
+def settle(coefficients, usable, parity, table):
+    """
+    Pull blocks whose samples would clip back into the 0-255 range.
+    
+    Clipped samples cannot be stored as computed, so the block is
+    projected onto its clipped samples (kept CLIP_MARGIN inside the range)
+    and the usable coefficients' lowest bits are restored, a few times over.
+    
+    Args:
+        coefficients: Integer array of shape (blocks, 8, 8)
+        usable: Boolean mask of the coefficients carrying data
+        parity: Lowest bit each usable coefficient must have
+        table: 8x8 quantization table
+    
+    Returns:
+        numpy.ndarray: The adjusted coefficients
+    """
+    coefficients = coefficients.copy()
+    signs = np.sign(coefficients)
+    for _ in range(SETTLE_ROUNDS):
+        samples = DCT_MATRIX.T @ (coefficients * table) @ DCT_MATRIX + 128
+        clipping = (samples.min(axis=(1, 2)) < -0.5) | (samples.max(axis=(1, 2)) > 255.5)
+        if not clipping.any():
+            break
+        clipped = np.clip(samples[clipping], CLIP_MARGIN, 255 - CLIP_MARGIN) - 128
+        projected = np.rint(DCT_MATRIX @ clipped @ DCT_MATRIX.T / table).astype(np.int32)
+        coefficients[clipping] = set_parity(projected, usable[clipping], parity[clipping], signs[clipping],
+                                            table)
+    return coefficients
+
+def perturb(coefficients, usable, rng):
+    """
+    Nudge one coefficient that carries no data in each block.
+    
+    Used for blocks that keep reading back wrong: a zero becomes +-1 or a
+    +-1 becomes zero, which changes how the block's samples round.
+    
+    Args:
+        coefficients: Integer array of shape (blocks, 8, 8) (modified in place)
+        usable: Boolean mask of the coefficients carrying data
+        rng: numpy.random.Generator choosing the coefficient
+    
+    Returns:
+        numpy.ndarray: The modified coefficients
+    """
+    free = ~usable & (np.abs(coefficients) < MIN_COEFFICIENT)
+    free[:, 0, 0] = False
+    for index in range(len(coefficients)):
+        candidates = np.argwhere(free[index])
+        if not len(candidates):
+            continue
+        row, column = candidates[rng.integers(len(candidates))]
+        value = coefficients[index, row, column]
+        coefficients[index, row, column] = rng.choice((-1, 1)) if value == 0 else 0
+    return coefficients
+
+def write_blocks(plane, coefficients, changed, table):
+    """
+    Write the samples of changed blocks back into a plane.
+    
+    Args:
+        plane: 2-D uint8 array (modified in place)
+        coefficients: Quantized coefficients of the plane's whole blocks
+        changed: Boolean array of shape (block rows, block columns)
+            selecting the blocks to reconstruct
+        table: 8x8 quantization table
+    """
+    to_blocks(plane)[changed] = inverse(coefficients[changed], table)
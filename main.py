@@ -2,20 +2,56 @@
 Flask web application for steganography.
 """
 import os
+import io
+import json
 import uuid
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, session
+import shutil
+import hashlib
+import tempfile
+import contextlib
+import zipfile
+from flask import (
+    Flask, Request, Response, abort, current_app, g, jsonify, render_template, request, redirect,
+    url_for, flash, send_from_directory, session
+)
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-from stegano import Steganography, SteganographyError
-from utils import estimate_encoding_capacity, is_likely_steganographic_image
+from stegano import (
+    Steganography, SteganographyError, KeyRequiredError, Carrier, Instrumentation, FLAG_TEXT,
+    MIN_BITS_PER_CHANNEL, MAX_BITS_PER_CHANNEL, OUTPUT_FORMATS, SAVE_PROFILES, DEFAULT_SAVE_PROFILE,
+    COMPRESSION_CHOICES, JPEG_OUTPUT_FORMAT, MIN_MATRIX_K, MAX_MATRIX_K
+)
+from utils import steganalysis_score, STEGANALYSIS_THRESHOLD
+from cache import TTLCache
+from jobs import JobQueue
+from carrierpool import CarrierPool
+from batch import read_archive_items, count_pixels, stream_archive
+from sessions import ServerSessionInterface, create_session_store
+
+class UploadRequest(Request):
+    """
+    Request class that keeps file uploads in memory.
+    
+    Uploads up to UPLOAD_SPOOL_THRESHOLD bytes are parsed straight into a
+    BytesIO buffer and decoded from there; only larger ones spill to a
+    temporary file on the upload volume.
+    """
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        threshold = current_app.config['UPLOAD_SPOOL_THRESHOLD']
+        if total_content_length is not None and total_content_length <= threshold:
+            return io.BytesIO()
+        return tempfile.TemporaryFile('rb+', dir=current_app.config['UPLOAD_FOLDER'])
 
 # Initialize Flask app
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key_for_development")
 
 # Configure file upload settings
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'outputs'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp', 'tif', 'tiff'}
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
@@ -23,11 +59,335 @@ os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Uploads larger than this are spooled to disk instead of kept in memory
+app.config['UPLOAD_SPOOL_THRESHOLD'] = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD', 2 * 1024 * 1024))
+
+# Extraction results keyed by upload content hash, so /auth-decode never
+# has to touch the image pixels again
+app.config['EXTRACTION_CACHE_BYTES'] = int(os.environ.get('EXTRACTION_CACHE_BYTES', 64 * 1024 * 1024))
+app.config['EXTRACTION_CACHE_TTL'] = int(os.environ.get('EXTRACTION_CACHE_TTL', 600))
+
+extraction_cache = TTLCache(max_bytes=app.config['EXTRACTION_CACHE_BYTES'],
+                            ttl=app.config['EXTRACTION_CACHE_TTL'])
+
+# Encode/decode work runs on a background pool; finished jobs are kept for
+# JOB_TTL seconds so clients can poll for the result
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['JOB_TTL'] = int(os.environ.get('JOB_TTL', 600))
+# Seconds between keep-alive comments on an idle job event stream
+app.config['JOB_EVENT_KEEPALIVE'] = 15
+
+job_queue = JobQueue(workers=app.config['JOB_WORKERS'], ttl=app.config['JOB_TTL'])
+
+# Optional directory of pre-decoded cover images (see carrierpool.py); when
+# set, the encode form can pick the best-fitting cover instead of an upload
+app.config['CARRIER_POOL'] = os.environ.get('CARRIER_POOL')
+
+carrier_pool = CarrierPool(app.config['CARRIER_POOL']) if app.config['CARRIER_POOL'] else None
+
+# ZIP batches posted to /api/v1/batch may be larger than other uploads, but
+# the images they unpack to are capped in bytes and in total pixels
+app.config['BATCH_MAX_CONTENT_LENGTH'] = int(os.environ.get('BATCH_MAX_CONTENT_LENGTH', 256 * 1024 * 1024))
+app.config['BATCH_PIXEL_BUDGET'] = int(os.environ.get('BATCH_PIXEL_BUDGET', 200_000_000))
+app.config['BATCH_WORKERS'] = int(os.environ.get('BATCH_WORKERS', 0)) or None
+
+# Session data is kept on the server and the cookie only holds a random
+# session ID. SESSION_BACKEND is 'memory' (an in-process LRU) or 'sqlalchemy'
+# (SESSION_DATABASE_URI, a SQLite file in the instance folder by default)
+app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', 'memory')
+app.config['SESSION_TTL'] = int(os.environ.get('SESSION_TTL', 3600))
+app.config['SESSION_CACHE_BYTES'] = int(os.environ.get('SESSION_CACHE_BYTES', 64 * 1024 * 1024))
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SESSION_DATABASE_URI', 'sqlite:///sessions.db')
+
+app.session_interface = ServerSessionInterface(create_session_store(app))
+
+# Stages recorded by each job type, used to report progress
+ENCODE_STAGES = ('open', 'decode', 'convert', 'array', 'compress', 'embed', 'fromarray', 'save')
+DECODE_STAGES = ('hash', 'open', 'decode', 'convert', 'array', 'extract', 'steganalysis')
 
 def allowed_file(filename):
     """Check if the uploaded file has an allowed extension."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.after_request
+def add_server_timing(response):
+    """Expose per-stage timings recorded for the request's job as Server-Timing."""
+    instrumentation = g.get('instrumentation')
+    if instrumentation and instrumentation.stages:
+        response.headers['Server-Timing'] = instrumentation.server_timing()
+    return response
+
+def detach_upload(stream):
+    """
+    Copy an upload out of the request so a background job can read it.
+    
+    The request's own upload stream is closed when the response is sent.
+    
+    Args:
+        stream: Upload stream from request.files
+        
+    Returns:
+        file-like: BytesIO for in-memory uploads, otherwise a temporary file
+    """
+    stream.seek(0)
+    if isinstance(stream, io.BytesIO):
+        return io.BytesIO(stream.getvalue())
+    
+    copy = tempfile.TemporaryFile('rb+', dir=app.config['UPLOAD_FOLDER'])
+    shutil.copyfileobj(stream, copy)
+    copy.seek(0)
+    return copy
+
+def extract_upload(stream, instrumentation):
+    """
+    Extract the hidden payload from an uploaded image, using the cache.
+    
+    Args:
+        stream: Binary file-like object holding the upload
+        instrumentation: Instrumentation recording the stages
+        
+    Returns:
+        dict: Upload digest, payload bytes, header and steganalysis score
+            (None when the image has a header).
+            Scattered messages cannot be read before the auth code is known,
+            so their payload is None and the upload bytes are kept as
+            'source' instead.
+    """
+    with instrumentation.stage('hash', bytes=Carrier.source_size(stream)):
+        digest = hashlib.file_digest(stream, 'sha256').hexdigest()
+    
+    extraction = extraction_cache.get(digest)
+    if extraction is None:
+        stream.seek(0)
+        carrier = Carrier.load(stream, instrumentation)
+        source = None
+        try:
+            payload, header = carrier.extract()
+        except KeyRequiredError:
+            stream.seek(0)
+            payload, header, source = None, None, stream.read()
+        # The score only matters for images without a v2 header, so
+        # incrementally extracted PNGs are never decoded in full
+        score = None
+        if header is None and source is None:
+            with instrumentation.stage('steganalysis', pixels=carrier.width * carrier.height):
+                score = steganalysis_score(carrier)
+        extraction = {
+            'digest': digest,
+            'payload': payload,
+            'header': header,
+            'source': source,
+            'score': score,
+        }
+        extraction_cache.set(digest, extraction, size=len(source if payload is None else payload))
+    return extraction
+
+def read_extraction(extraction, auth_code=None):
+    """
+    Return the decoded text of a cached extraction.
+    
+    Scattered messages are extracted from the kept upload with the auth code.
+    
+    Args:
+        extraction: Result of extract_upload
+        auth_code: Auth code seeding a scattered message's order
+        
+    Returns:
+        str or None: Full text, or None if the message is scattered and no
+            auth code was given
+    """
+    payload, header = extraction['payload'], extraction['header']
+    if payload is None:
+        if auth_code is None:
+            return None
+        payload, header = Carrier.load(io.BytesIO(extraction['source'])).extract(auth_code)
+    return Steganography.decode_text(payload, header)
+
+def encode_message(carrier, message, output, require_auth, bits_per_channel, output_format, save_profile,
+                   compression, scatter, auth_code=None, matrix=0, compressed=None):
+    """
+    Hide a message in a loaded carrier, with or without an auth code.
+    
+    Args:
+        carrier: Loaded Carrier
+        message: Text to hide
+        output: Output path or binary file-like object
+        require_auth: Protect the message with a 4-digit code
+        bits_per_channel: Payload bits per color channel
+        output_format: Output image format (None for the carrier's default)
+        save_profile: Output save profile
+        compression: Message compression ('none', 'zlib', 'lzma', 'bz2' or 'auto')
+        scatter: Scatter the message in an order seeded by the auth code
+        auth_code: Auth code to use instead of a newly generated one
+        matrix: Matrix embedding k, or 0 for plain LSB embedding
+        compressed: (codec, payload) from Steganography.compress_message for
+            this message and auth code, so it is not compressed again
+        
+    Returns:
+        tuple: (Output path or object, authentication code or None)
+    """
+    if require_auth:
+        # Encode with authentication
+        return Steganography.encode(
+            carrier, message, output, bits_per_channel, output_format, save_profile, compression,
+            scatter, auth_code=auth_code, matrix=matrix, compressed=compressed)
+    
+    # Encode without authentication by adding a dummy prefix that doesn't start with AUTH:
+    if compressed is not None:
+        codec, data = compressed
+    else:
+        codec, data = None, f"NOAUTH:{message}".encode('utf-8')
+    output = Steganography.encode_bytes(
+        carrier, data, output, FLAG_TEXT, bits_per_channel,
+        output_format, save_profile, compression, matrix=matrix, codec=codec)
+    return output, None
+
+def run_encode_job(job, source, message, require_auth, bits_per_channel, output_format, save_profile,
+                   compression, scatter, output_path, matrix=0):
+    """
+    Hide a message in an uploaded image (runs on the job pool).
+    
+    Args:
+        job: Job reporting progress
+        source: Detached upload stream (closed when done), or None to use
+            the best-fitting carrier from the carrier pool
+        message: Text to hide
+        require_auth: Protect the message with a 4-digit code
+        bits_per_channel: Payload bits per color channel
+        output_format: Output image format
+        save_profile: Output save profile
+        compression: Message compression ('none', 'zlib', 'lzma', 'bz2' or 'auto')
+        scatter: Scatter the message in an order seeded by the auth code
+        output_path: Where to write the encoded image
+        matrix: Matrix embedding k, or 0 for plain LSB embedding
+        
+    Returns:
+        dict: Output filename and authentication code (None without auth)
+    """
+    instrumentation = job.instrumentation(ENCODE_STAGES)
+    auth_code = Steganography.generate_auth_code() if require_auth else None
+    
+    compressed = None
+    with source or contextlib.nullcontext():
+        if source is None:
+            # Map the smallest pre-decoded pool carrier that fits the message,
+            # compressing it once for both sizing and embedding
+            with instrumentation.stage('compress', bytes=Steganography.payload_size(message)):
+                compressed = Steganography.compress_message(message, auth_code, compression)
+            size = Steganography.payload_size(compressed[1])
+            carrier = carrier_pool.pick(size, bits_per_channel, instrumentation, matrix)
+        else:
+            # Decode the image straight from the upload stream
+            carrier = Carrier.load(source, instrumentation)
+        
+        # Encoding checks the capacity against the compressed message size
+        output_file, auth_code = encode_message(carrier, message, output_path, require_auth, bits_per_channel,
+                                                output_format, save_profile, compression, scatter, auth_code,
+                                                matrix, compressed)
+    
+    return {'output_filename': os.path.basename(output_file), 'auth_code': auth_code}
+
+def run_decode_job(job, source):
+    """
+    Extract the hidden message from an uploaded image (runs on the job pool).
+    
+    Args:
+        job: Job reporting progress
+        source: Detached upload stream (closed when done)
+        
+    Returns:
+        dict: Upload digest, whether an auth code is needed, the message
+            and whether the image looked empty to steganalysis
+    """
+    with source:
+        extraction = extract_upload(source, job.instrumentation(DECODE_STAGES))
+    
+    # Try to decode the message (without auth code first)
+    full_text = read_extraction(extraction)
+    if full_text is None:
+        result = {'auth_required': True}
+    else:
+        result = Steganography.unwrap_message(full_text)
+    auth_required = isinstance(result, dict) and result.get('auth_required', False)
+    
+    return {
+        'digest': extraction['digest'],
+        'auth_required': auth_required,
+        'message': None if auth_required else result,
+        'warning': looks_empty(extraction),
+    }
+
+def looks_empty(extraction):
+    """Check if steganalysis suggests an image without a header holds no message."""
+    scattered = extraction['payload'] is None
+    return not scattered and extraction['header'] is None and extraction['score'] < STEGANALYSIS_THRESHOLD
+
+def read_encode_options(form, default_format='png'):
+    """
+    Read the encoding settings shared by the encode form and the API.
+    
+    Args:
+        form: Request form
+        default_format: Output format when the form names none (None lets
+            the carrier choose, e.g. raw BMP uploads keep their format)
+        
+    Returns:
+        tuple: (bits per channel, output format, save profile, compression,
+            whether an auth code is required, whether to scatter, matrix
+            embedding k)
+    """
+    # Payload bits per color channel and output settings
+    bits_per_channel = Steganography.check_bits_per_channel(form.get('bits', 1))
+    matrix = Steganography.check_matrix(form.get('matrix', 0))
+    if matrix and bits_per_channel != 1:
+        raise SteganographyError("Matrix embedding uses 1 bit per channel")
+    output_format = form.get('output_format') or default_format
+    if output_format is not None and output_format != JPEG_OUTPUT_FORMAT:
+        # JPEG output is checked against the upload when it is encoded
+        output_format = Steganography.resolve_output_format(output_format=output_format)
+    save_profile = form.get('save_profile', DEFAULT_SAVE_PROFILE)
+    compression = form.get('compression', 'auto')
+    if compression not in COMPRESSION_CHOICES:
+        raise SteganographyError(f"Unknown compression '{compression}'")
+    
+    # Check if authentication is required; scattering is seeded by the auth code
+    require_auth = form.get('requireAuth') == 'true'
+    scatter = require_auth and form.get('scatter') == 'true'
+    return bits_per_channel, output_format, save_profile, compression, require_auth, scatter, matrix
+
+def wants_json():
+    """Check if the client asked for a JSON response rather than HTML."""
+    return request.accept_mimetypes.best == 'application/json'
+
+def job_urls(job):
+    """Return the status, event stream and result URLs of a job."""
+    return {
+        'status_url': url_for('job_status', job_id=job.id),
+        'events_url': url_for('job_events', job_id=job.id),
+        'result_url': url_for('job_result', job_id=job.id),
+    }
+
+def job_submitted(job):
+    """
+    Respond to a form submission that queued a job.
+    
+    JSON clients get 202 Accepted with the job URLs; browsers are sent to
+    the progress page.
+    """
+    if wants_json():
+        response = jsonify({**job.to_dict(), **job_urls(job)})
+        response.status_code = 202
+        response.headers['Location'] = url_for('job_status', job_id=job.id)
+        return response
+    return redirect(url_for('job_progress', job_id=job.id))
+
+def get_job_or_404(job_id):
+    """Return a job by ID or abort with 404."""
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return job
+
 @app.route('/')
 def index():
     """Render the main page of the application."""
@@ -37,15 +397,18 @@ def index():
 def encode():
     """Handle encoding requests."""
     if request.method == 'POST':
+        # A cover from the carrier pool replaces the upload when requested
+        use_pool = carrier_pool is not None and request.form.get('usePool') == 'true'
+        
         # Check if a file was uploaded
-        if 'file' not in request.files:
+        if not use_pool and 'file' not in request.files:
             flash('No file part', 'error')
             return redirect(request.url)
         
-        file = request.files['file']
+        file = request.files.get('file')
         
         # Check if the user submitted an empty form
-        if file.filename == '':
+        if not use_pool and file.filename == '':
             flash('No selected file', 'error')
             return redirect(request.url)
         
@@ -56,63 +419,43 @@ def encode():
             return redirect(request.url)
         
         # Process the file
-        if file and allowed_file(file.filename):
+        if use_pool or (file and allowed_file(file.filename)):
             # Generate a unique filename
-            original_filename = secure_filename(file.filename)
+            original_filename = 'pool.png' if use_pool else secure_filename(file.filename)
             unique_id = str(uuid.uuid4().hex)
             filename = f"{unique_id}_{original_filename}"
             
-            # Save the uploaded file
-            input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(input_path)
-            
-            # Generate the output filename
-            name, ext = os.path.splitext(filename)
-            output_filename = f"{name}_encoded.png"
-            output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
-            
             try:
-                # Check if the image has enough capacity
-                if not Steganography.can_encode(input_path, message):
-                    capacity = estimate_encoding_capacity(input_path)
-                    flash(f'Text too large. Max capacity: ~{capacity} characters', 'error')
-                    return redirect(request.url)
-                
-                # Check if authentication is required
-                require_auth = request.form.get('requireAuth') == 'true'
-                
-                # Get the message
-                if require_auth:
-                    # Encode with authentication
-                    output_file, auth_code = Steganography.encode(input_path, message, output_path)
-                    session['auth_code'] = auth_code
-                else:
-                    # Encode without authentication by adding a dummy prefix that doesn't start with AUTH:
-                    secured_text = f"NOAUTH:{message}"
-                    output_file = Steganography.encode(input_path, secured_text, output_path)[0]
-                    session['auth_code'] = None
+                # Payload bits per color channel and output settings chosen in the form
+                (bits_per_channel, output_format, save_profile, compression,
+                 require_auth, scatter, matrix) = read_encode_options(request.form)
                 
-                # Store the output filename in the session
-                session['encoded_file'] = output_filename
+                # Generate the output filename
+                name, ext = os.path.splitext(filename)
+                output_filename = f"{name}_encoded.{output_format}"
+                output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
                 
-                # Redirect to the download page
-                flash('Message successfully encoded!', 'success')
-                return redirect(url_for('download_encoded'))
+                # Encode in the background and send the client to the job
+                source = None if use_pool else detach_upload(file.stream)
+                job = job_queue.submit('encode', run_encode_job, source, message,
+                                       require_auth, bits_per_channel, output_format, save_profile,
+                                       compression, scatter, output_path, matrix)
+                return job_submitted(job)
                 
             except SteganographyError as e:
                 flash(f'Error encoding the message: {str(e)}', 'error')
                 return redirect(request.url)
-            finally:
-                # Clean up the uploaded file
-                if os.path.exists(input_path):
-                    os.remove(input_path)
         
         else:
-            flash('File type not allowed. Please upload a PNG or JPG file.', 'error')
+            flash('File type not allowed. Please upload a PNG, JPG, WebP or TIFF file.', 'error')
             return redirect(request.url)
     
     # GET request - show the upload form
-    return render_template('encode.html')
+    return render_template('encode.html', min_bits=MIN_BITS_PER_CHANNEL, max_bits=MAX_BITS_PER_CHANNEL,
+                           min_matrix=MIN_MATRIX_K, max_matrix=MAX_MATRIX_K,
+                           output_formats=OUTPUT_FORMATS, save_profiles=SAVE_PROFILES,
+                           default_save_profile=DEFAULT_SAVE_PROFILE, compressions=COMPRESSION_CHOICES,
+                           pool_size=len(carrier_pool) if carrier_pool is not None else 0)
 
 @app.route('/download-encoded')
 def download_encoded():
@@ -144,50 +487,12 @@ def decode():
         
         # Process the file
         if file and allowed_file(file.filename):
-            # Generate a unique filename
-            filename = secure_filename(file.filename)
-            unique_id = str(uuid.uuid4().hex)
-            filename = f"{unique_id}_{filename}"
-            
-            # Save the uploaded file
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            try:
-                # Check if the image likely contains hidden data
-                if not is_likely_steganographic_image(file_path):
-                    flash('Warning: This image may not contain hidden data', 'warning')
-                
-                # Try to decode the message (without auth code first)
-                result = Steganography.decode(file_path)
-                
-                # Check if authentication is required
-                if isinstance(result, dict) and result.get('auth_required'):
-                    # Store the file path in the session for auth checking later
-                    session['pending_decode_file'] = file_path
-                    # Don't delete the file yet, we'll need it for the actual decoding
-                    return redirect(url_for('auth_decode'))
-                
-                if not result:
-                    flash('No hidden message found or message is empty', 'warning')
-                    return redirect(request.url)
-                
-                # Store the decoded message and redirect to the results page
-                session['decoded_message'] = result
-                
-                # Redirect to the results page
-                return redirect(url_for('decode_results'))
-                
-            except SteganographyError as e:
-                flash(f'Error decoding the message: {str(e)}', 'error')
-                return redirect(request.url)
-            finally:
-                # Clean up the uploaded file only if we're not going to use it for auth decoding
-                if not session.get('pending_decode_file') and os.path.exists(file_path):
-                    os.remove(file_path)
+            # Decode in the background and send the client to the job
+            job = job_queue.submit('decode', run_decode_job, detach_upload(file.stream))
+            return job_submitted(job)
         
         else:
-            flash('File type not allowed. Please upload a PNG or JPG file.', 'error')
+            flash('File type not allowed. Please upload a PNG, JPG, WebP or TIFF file.', 'error')
             return redirect(request.url)
     
     # GET request - show the upload form
@@ -197,11 +502,17 @@ def decode():
 def auth_decode():
     """Handle authentication for protected messages."""
     # Check if there's a pending decode
-    file_path = session.get('pending_decode_file')
-    if not file_path:
+    digest = session.get('pending_decode')
+    if not digest:
         flash('No image to decode', 'error')
         return redirect(url_for('decode'))
     
+    extraction = extraction_cache.get(digest)
+    if extraction is None:
+        session.pop('pending_decode', None)
+        flash('The uploaded image has expired. Please upload it again.', 'error')
+        return redirect(url_for('decode'))
+    
     if request.method == 'POST':
         # Get the auth code from the form
         auth_code = request.form.get('auth_code')
@@ -210,16 +521,13 @@ def auth_decode():
             return redirect(url_for('auth_decode'))
         
         try:
-            # Decode with the auth code
-            extracted_text = Steganography.decode(file_path, auth_code)
+            # Verify the auth code against the cached payload
+            full_text = read_extraction(extraction, auth_code)
+            extracted_text = Steganography.unwrap_message(full_text, auth_code)
             
             # Store the decoded message
             session['decoded_message'] = extracted_text
-            
-            # Clean up
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            session.pop('pending_decode_file', None)
+            session.pop('pending_decode', None)
             
             # Redirect to results
             return redirect(url_for('decode_results'))
@@ -241,6 +549,232 @@ def decode_results():
     
     return render_template('results.html', message=message)
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report the status and progress of a background job as JSON."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify({**job.to_dict(), **job_urls(job)})
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Stream job status changes as Server-Sent Events until the job finishes."""
+    job = get_job_or_404(job_id)
+    keepalive = app.config['JOB_EVENT_KEEPALIVE']
+    
+    def stream():
+        seen = None
+        while True:
+            version = job.wait(seen, timeout=keepalive)
+            if version == seen:
+                yield ': keepalive\n\n'
+                continue
+            
+            seen = version
+            yield f"data: {json.dumps(job.to_dict())}\n\n"
+            if job.done:
+                return
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """
+    Return the result of a finished job.
+    
+    Encode jobs return the encoded image; decode jobs return the message
+    (or that an authentication code is needed) as JSON.
+    """
+    job = get_job_or_404(job_id)
+    if not job.done:
+        return jsonify(job.to_dict()), 409
+    if job.error:
+        return jsonify(job.to_dict()), 422
+    
+    # Report the job's stage timings on the result response
+    g.instrumentation = job.recorder
+    
+    if job.kind == 'encode':
+        response = send_from_directory(app.config['OUTPUT_FOLDER'], job.result['output_filename'],
+                                       as_attachment=True)
+        if job.result['auth_code']:
+            response.headers['X-Auth-Code'] = job.result['auth_code']
+        return response
+    
+    return jsonify({'auth_required': job.result['auth_required'], 'message': job.result['message']})
+
+@app.route('/jobs/<job_id>/progress')
+def job_progress(job_id):
+    """Show a progress page that follows the job's event stream."""
+    job = get_job_or_404(job_id)
+    return render_template('job.html', job=job, events_url=url_for('job_events', job_id=job.id),
+                           finish_url=url_for('job_finish', job_id=job.id))
+
+@app.route('/jobs/<job_id>/finish')
+def job_finish(job_id):
+    """Move a finished job's result into the session and show it."""
+    job = get_job_or_404(job_id)
+    if not job.done:
+        return redirect(url_for('job_progress', job_id=job.id))
+    
+    if job.kind == 'encode':
+        if job.error:
+            flash(f'Error encoding the message: {job.error}', 'error')
+            return redirect(url_for('encode'))
+        
+        # Store the output filename in the session
+        session['encoded_file'] = job.result['output_filename']
+        session['auth_code'] = job.result['auth_code']
+        
+        # Redirect to the download page
+        flash('Message successfully encoded!', 'success')
+        return redirect(url_for('download_encoded'))
+    
+    if job.error:
+        flash(f'Error decoding the message: {job.error}', 'error')
+        return redirect(url_for('decode'))
+    
+    # Check if the image likely contains hidden data
+    if job.result['warning']:
+        flash('Warning: This image may not contain hidden data', 'warning')
+    
+    # Check if authentication is required
+    if job.result['auth_required']:
+        # Only the upload hash is kept; auth attempts reuse the cached payload
+        session['pending_decode'] = job.result['digest']
+        return redirect(url_for('auth_decode'))
+    
+    if not job.result['message']:
+        flash('No hidden message found or message is empty', 'warning')
+        return redirect(url_for('decode'))
+    
+    # Store the decoded message and redirect to the results page
+    session['decoded_message'] = job.result['message']
+    return redirect(url_for('decode_results'))
+
+@app.route('/api/v1/encode', methods=['POST'])
+def api_encode():
+    """
+    Hide a message in an uploaded image and return the encoded image.
+    
+    Takes the same multipart fields as the encode form (file, message,
+    bits, matrix, output_format, save_profile, compression, requireAuth,
+    scatter)
+    and encodes in the request, so the image comes back in one round trip.
+    The auth code and output settings are sent in X- headers; errors are
+    returned as JSON.
+    """
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No image uploaded'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'File type not allowed. Upload a PNG, JPG, WebP or TIFF file.'}), 400
+    message = request.form.get('message', '')
+    if not message:
+        return jsonify({'error': 'No message to hide'}), 400
+    
+    instrumentation = g.instrumentation = Instrumentation()
+    try:
+        (bits_per_channel, output_format, save_profile, compression,
+         require_auth, scatter, matrix) = read_encode_options(request.form, default_format=None)
+        carrier = Carrier.load(file.stream, instrumentation)
+        output_format = carrier.resolve_output_format(None, output_format)
+        output = io.BytesIO()
+        _, auth_code = encode_message(carrier, message, output, require_auth, bits_per_channel, output_format,
+                                      save_profile, compression, scatter, matrix=matrix)
+    except SteganographyError as e:
+        return jsonify({'error': str(e)}), 422
+    
+    name = os.path.splitext(secure_filename(file.filename))[0] or 'image'
+    response = Response(output.getvalue(), mimetype=f"image/{output_format}")
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}_encoded.{output_format}"'
+    response.headers['X-Output-Format'] = output_format
+    response.headers['X-Bits-Per-Channel'] = str(bits_per_channel)
+    response.headers['X-Matrix-K'] = str(matrix)
+    response.headers['X-Embedding-Efficiency'] = f"{Steganography.embedding_efficiency(bits_per_channel, matrix):.2f}"
+    if auth_code:
+        response.headers['X-Auth-Code'] = auth_code
+    return response
+
+@app.route('/api/v1/decode', methods=['POST'])
+def api_decode():
+    """
+    Extract the message from an uploaded image in one request.
+    
+    The auth code for a protected message is given up front as the
+    auth_code form field (or an X-Auth-Code header). Responds with JSON:
+    the message, or 401 when a protected message was sent without a code.
+    """
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No image uploaded'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'File type not allowed. Upload a PNG, JPG, WebP or TIFF file.'}), 400
+    auth_code = request.form.get('auth_code') or request.headers.get('X-Auth-Code')
+    
+    instrumentation = g.instrumentation = Instrumentation()
+    try:
+        extraction = extract_upload(file.stream, instrumentation)
+        full_text = read_extraction(extraction, auth_code)
+        result = {'auth_required': True} if full_text is None else Steganography.unwrap_message(full_text, auth_code)
+    except SteganographyError as e:
+        return jsonify({'error': str(e)}), 422
+    
+    if isinstance(result, dict) and result.get('auth_required'):
+        return jsonify({'auth_required': True, 'error': 'This message is protected; send its auth_code'}), 401
+    return jsonify({'auth_required': False, 'message': result, 'warning': looks_empty(extraction)})
+
+@app.route('/api/v1/batch', methods=['POST'])
+def api_batch():
+    """
+    Encode or decode every image in a ZIP archive on a worker pool.
+    
+    Takes the archive as the 'archive' field and a JSON manifest as the
+    'manifest' field or as manifest.json inside the archive (see
+    batch.read_archive_items). Responds with a ZIP that is streamed as items
+    finish: the encoded images or decoded messages, then report.json.
+    """
+    # Batches get their own upload limit; the pixel budget bounds the work
+    request.max_content_length = app.config['BATCH_MAX_CONTENT_LENGTH']
+    try:
+        upload = request.files.get('archive')
+        manifest = request.form.get('manifest')
+    except RequestEntityTooLarge:
+        return jsonify({'error': f"The archive is larger than {app.config['BATCH_MAX_CONTENT_LENGTH']} bytes"}), 413
+    if upload is None or upload.filename == '':
+        return jsonify({'error': 'No archive uploaded'}), 400
+    
+    directory = tempfile.mkdtemp(dir=app.config['UPLOAD_FOLDER'])
+    try:
+        if manifest is not None:
+            manifest = json.loads(manifest)
+        with zipfile.ZipFile(upload.stream) as archive:
+            operation, options, items = read_archive_items(archive, manifest, directory,
+                                                           app.config['BATCH_MAX_CONTENT_LENGTH'])
+        if not items:
+            raise SteganographyError("No images to process")
+        
+        pixels = count_pixels(items)
+        if pixels > app.config['BATCH_PIXEL_BUDGET']:
+            shutil.rmtree(directory, ignore_errors=True)
+            return jsonify({'error': f"The images hold {pixels} pixels; the limit per batch is "
+                                     f"{app.config['BATCH_PIXEL_BUDGET']}"}), 413
+    except (SteganographyError, zipfile.BadZipFile, ValueError) as e:
+        shutil.rmtree(directory, ignore_errors=True)
+        return jsonify({'error': str(e)}), 400
+    
+    def stream():
+        try:
+            yield from stream_archive(items, operation, app.config['BATCH_WORKERS'], options)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    
+    return Response(stream(), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="{operation}_results.zip"',
+                             'X-Accel-Buffering': 'no'})
+
 @app.route('/download/<filename>')
 def download_file(filename):
     """Handle file downloads."""
@@ -0,0 +1,215 @@
+"""
+Incremental row-by-row PNG decoding.
+
+Reads a non-interlaced 8-bit PNG a few rows at a time, inflating only as
+much IDAT data as the requested rows need. Extraction uses it to stop
+decompressing as soon as the embedded payload has been read, instead of
+decoding the whole image.
+"""
+import struct
+import zlib
+import numpy as np
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Bytes of compressed IDAT data read, and the most bytes inflated, per step
+INFLATE_BLOCK_SIZE = 64 * 1024
+
+# Samples per pixel for each supported PNG colour type
+# (0 grayscale, 2 RGB, 3 palette, 4 grayscale + alpha, 6 RGBA)
+SAMPLES_PER_PIXEL = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+_CHUNK_HEADER = struct.Struct('>I4s')
+
+class UnsupportedPNGError(Exception):
+    """Raised for PNGs that cannot be decoded incrementally (use Pillow)."""
+    pass
+
+class PNGRowReader:
+    """
+    Decode the rows of a PNG stream in order, on demand, as RGB.
+    
+    Only 8-bit, non-interlaced images are supported; anything else raises
+    UnsupportedPNGError so the caller can fall back to a full decode.
+    """
+    
+    def __init__(self, fp):
+        """
+        Read the PNG header chunks up to the first IDAT chunk.
+        
+        Args:
+            fp: Binary file object positioned at the PNG signature
+        """
+        self.fp = fp
+        if fp.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+            raise UnsupportedPNGError("Not a PNG stream")
+        
+        self.palette = None
+        self._idat_remaining = 0
+        self._ended = False
+        header = None
+        while True:
+            length, chunk_type = self._read_chunk_header()
+            if chunk_type == b'IDAT':
+                self._idat_remaining = length
+                break
+            
+            data = fp.read(length)
+            fp.read(4)  # CRC
+            if chunk_type == b'IHDR':
+                header = struct.unpack('>IIBBBBB', data)
+            elif chunk_type == b'PLTE':
+                palette = np.zeros((256, 3), dtype=np.uint8)
+                colors = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)[:256]
+                palette[:len(colors)] = colors
+                self.palette = palette
+            elif chunk_type == b'IEND':
+                raise UnsupportedPNGError("PNG has no image data")
+        
+        if header is None:
+            raise UnsupportedPNGError("PNG has no IHDR chunk")
+        self.width, self.height, bit_depth, self.color_type, _, _, interlace = header
+        if bit_depth != 8 or interlace or self.color_type not in SAMPLES_PER_PIXEL:
+            raise UnsupportedPNGError("Only 8-bit non-interlaced PNGs are decoded incrementally")
+        if self.color_type == 3 and self.palette is None:
+            raise UnsupportedPNGError("Palette PNG has no PLTE chunk")
+        
+        self.samples = SAMPLES_PER_PIXEL[self.color_type]
+        self.stride = self.width * self.samples
+        self.rows_read = 0
+        self._previous = np.zeros(self.stride, dtype=np.uint8)
+        self._inflater = zlib.decompressobj()
+        self._buffer = bytearray()
+        self._offset = 0
+        self._rows = []
+        self._channels = np.empty(0, dtype=np.uint8)
+    
+    def _read_chunk_header(self):
+        header = self.fp.read(_CHUNK_HEADER.size)
+        if len(header) < _CHUNK_HEADER.size:
+            raise UnsupportedPNGError("PNG stream ended unexpectedly")
+        return _CHUNK_HEADER.unpack(header)
+    
+    def _next_idat_block(self):
+        """Read the next block of compressed data, crossing IDAT chunk boundaries."""
+        while not self._idat_remaining:
+            if self._ended:
+                raise UnsupportedPNGError("PNG image data ended early")
+            self.fp.read(4)  # CRC of the previous IDAT chunk
+            length, chunk_type = self._read_chunk_header()
+            if chunk_type != b'IDAT':
+                self._ended = True
+                raise UnsupportedPNGError("PNG image data ended early")
+            self._idat_remaining = length
+        
+        data = self.fp.read(min(INFLATE_BLOCK_SIZE, self._idat_remaining))
+        if not data:
+            raise UnsupportedPNGError("PNG stream ended unexpectedly")
+        self._idat_remaining -= len(data)
+        return data
+    
+    def _inflate_more(self):
+        """Inflate more image data into the row buffer, with bounded output."""
+        data = self._inflater.unconsumed_tail or self._next_idat_block()
+        
+        # Drop the rows already consumed before growing the buffer
+        del self._buffer[:self._offset]
+        self._offset = 0
+        self._buffer += self._inflater.decompress(data, self.stride + 1 + INFLATE_BLOCK_SIZE)
+    
+    def _unfilter(self, filter_type, row):
+        """Reverse the PNG filter of one row (see the PNG spec, section 9)."""
+        previous = self._previous
+        if filter_type == 0:
+            return row
+        if filter_type == 1:
+            return np.cumsum(row.reshape(-1, self.samples), axis=0, dtype=np.uint8).reshape(-1)
+        if filter_type == 2:
+            return row + previous
+        
+        # Average and Paeth depend on the reconstructed left neighbour, so
+        # they run sequentially; only the few rows being read pay for this
+        step = self.samples
+        out = bytearray(row.tobytes())
+        above = previous.tobytes()
+        if filter_type == 3:
+            for i in range(len(out)):
+                left = out[i - step] if i >= step else 0
+                out[i] = (out[i] + ((left + above[i]) >> 1)) & 0xFF
+        elif filter_type == 4:
+            for i in range(len(out)):
+                if i >= step:
+                    left, upper_left = out[i - step], above[i - step]
+                else:
+                    left = upper_left = 0
+                up = above[i]
+                estimate = left + up - upper_left
+                distance_left = abs(estimate - left)
+                distance_up = abs(estimate - up)
+                distance_upper_left = abs(estimate - upper_left)
+                if distance_left <= distance_up and distance_left <= distance_upper_left:
+                    predictor = left
+                elif distance_up <= distance_upper_left:
+                    predictor = up
+                else:
+                    predictor = upper_left
+                out[i] = (out[i] + predictor) & 0xFF
+        else:
+            raise UnsupportedPNGError(f"Invalid PNG filter type {filter_type}")
+        return np.frombuffer(bytes(out), dtype=np.uint8)
+    
+    def _to_rgb(self, row):
+        """Convert one reconstructed row to RGB the way Pillow's convert('RGB') does."""
+        pixels = row.reshape(self.width, self.samples)
+        if self.color_type == 2:
+            return pixels
+        if self.color_type == 6:
+            return pixels[:, :3]
+        if self.color_type == 3:
+            return self.palette[pixels[:, 0]]
+        return np.repeat(pixels[:, :1], 3, axis=1)
+    
+    def read_rows(self, count):
+        """
+        Decode the next rows of the image.
+        
+        Args:
+            count: Number of rows to decode (clipped to the rows left)
+        
+        Returns:
+            numpy.ndarray: uint8 array of shape (rows, width, 3)
+        """
+        count = min(count, self.height - self.rows_read)
+        rows = np.empty((count, self.width, 3), dtype=np.uint8)
+        row_size = self.stride + 1
+        for index in range(count):
+            while len(self._buffer) - self._offset < row_size:
+                self._inflate_more()
+            filter_type = self._buffer[self._offset]
+            filtered = np.frombuffer(self._buffer, dtype=np.uint8, count=self.stride, offset=self._offset + 1).copy()
+            self._offset += row_size
+            
+            self._previous = self._unfilter(filter_type, filtered)
+            rows[index] = self._to_rgb(self._previous)
+        self.rows_read += count
+        return rows
+    
+    def read_channels(self, count):
+        """
+        Return at least the first count RGB channel values of the image.
+        
+        Rows are decoded only as far as needed and kept for later calls.
+        
+        Args:
+            count: Number of channel values needed from the start
+        
+        Returns:
+            numpy.ndarray: 1-D uint8 array of whole decoded rows
+        """
+        row_channels = self.width * 3
+        needed_rows = min(self.height, -(-count // row_channels))
+        if needed_rows > self.rows_read:
+            self._rows.append(self.read_rows(needed_rows - self.rows_read).reshape(-1))
+            self._channels = np.concatenate(self._rows) if len(self._rows) > 1 else self._rows[0]
+            self._rows = [self._channels]
+        return self._channels
@@ -0,0 +1,202 @@
+"""
+Memory-mapped access to uncompressed carrier images.
+
+BMP, binary PPM/PGM and NumPy .npy files store their samples as plain bytes
+at a known offset, so they can be mapped with np.memmap instead of being
+decoded. Embedding and extraction then touch only the pages holding the
+header and payload, and very large scans never have to fit in memory.
+"""
+import os
+import shutil
+import struct
+import numpy as np
+
+# Uncompressed formats that are memory-mapped, keyed by their file signature
+RAW_SIGNATURES = {
+    b'BM': 'bmp',
+    b'P6': 'ppm',
+    b'P5': 'pgm',
+    b'\x93NUMPY': 'npy',
+}
+RAW_FORMATS = ('bmp', 'ppm', 'pgm', 'npy')
+
+# Bytes copied per step when writing a mapped image to another file
+COPY_BLOCK_SIZE = 16 * 1024 * 1024
+
+# Image modes for the number of samples per pixel
+SAMPLE_MODES = {1: 'L', 3: 'RGB', 4: 'RGBA'}
+
+class UnsupportedRawImageError(Exception):
+    """Raised for files that look like a raw format but cannot be mapped."""
+    pass
+
+def raw_format(path):
+    """
+    Detect an uncompressed image format from its file signature.
+    
+    Args:
+        path: Path to the file (anything else is reported as not raw)
+    
+    Returns:
+        str or None: 'bmp', 'ppm', 'pgm' or 'npy', or None
+    """
+    if not isinstance(path, (str, os.PathLike)) or not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            signature = f.read(max(len(magic) for magic in RAW_SIGNATURES))
+    except OSError:
+        return None
+    for magic, format in RAW_SIGNATURES.items():
+        if signature.startswith(magic):
+            return format
+    return None
+
+def _parse_bmp(fp):
+    """Return (offset, height, width, samples, row_size, top_down) for a BMP."""
+    file_header = fp.read(14)
+    info_size = struct.unpack('<I', fp.read(4))[0]
+    if len(file_header) < 14 or info_size < 40:
+        raise UnsupportedRawImageError("Only BMPs with a BITMAPINFOHEADER or later are supported")
+    offset = struct.unpack('<I', file_header[10:14])[0]
+    width, height, _, bit_count, compression = struct.unpack('<iiHHI', fp.read(16))
+    if compression != 0 or bit_count not in (24, 32):
+        raise UnsupportedRawImageError("Only uncompressed 24-bit and 32-bit BMPs are supported")
+    
+    # Rows are padded to 4 bytes and stored bottom-up unless the height is negative
+    samples = bit_count // 8
+    row_size = (width * bit_count + 31) // 32 * 4
+    return offset, abs(height), width, samples, row_size, height < 0
+
+def _read_netpbm_tokens(fp, count):
+    """Read whitespace-separated header fields, skipping comments."""
+    tokens = []
+    token = b''
+    while len(tokens) < count:
+        byte = fp.read(1)
+        if not byte:
+            raise UnsupportedRawImageError("Image header ended unexpectedly")
+        if byte == b'#':
+            fp.readline()
+        elif byte.isspace():
+            if token:
+                tokens.append(token)
+                token = b''
+        else:
+            token += byte
+    return tokens
+
+def _parse_netpbm(fp):
+    """Return (offset, height, width, samples) for a binary PPM or PGM."""
+    magic, width, height, maxval = _read_netpbm_tokens(fp, 4)
+    if int(maxval) != 255:
+        raise UnsupportedRawImageError("Only 8-bit PPM/PGM images are supported")
+    # A single whitespace byte after maxval was consumed with it
+    return fp.tell(), int(height), int(width), 3 if magic == b'P6' else 1
+
+def _parse_npy(fp):
+    """Return (offset, shape, fortran_order) for a uint8 .npy array."""
+    version = np.lib.format.read_magic(fp)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fp)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fp)
+    if dtype != np.uint8 or len(shape) not in (2, 3):
+        raise UnsupportedRawImageError("Only 2-D or 3-D uint8 .npy arrays are supported")
+    return fp.tell(), shape, fortran_order
+
+class RawImage:
+    """
+    An uncompressed image file mapped into memory.
+    
+    `samples` is a flat view of every sample byte in storage order (for
+    BMPs this includes the row padding) and `pixels` is a view of shape
+    (height, width, channels) in top-down RGB order. Both read and write
+    the file through the mapping. `rgb_order` is True when the two orders
+    are the same, as for a decoded RGB image.
+    """
+    
+    def __init__(self, path, mode='r'):
+        """
+        Map an image file.
+        
+        Args:
+            path: Path to a BMP, PPM, PGM or .npy file
+            mode: np.memmap mode: 'r' (read-only), 'c' (copy-on-write; changes
+                stay in memory) or 'r+' (changes are written to the file)
+        """
+        self.path = path
+        self.format = raw_format(path)
+        if self.format is None:
+            raise UnsupportedRawImageError("Not a BMP, PPM, PGM or .npy file")
+        
+        with open(path, 'rb') as fp:
+            if self.format == 'bmp':
+                offset, height, width, channels, row_size, top_down = _parse_bmp(fp)
+                size = row_size * height
+            elif self.format == 'npy':
+                offset, shape, fortran_order = _parse_npy(fp)
+                height, width = shape[:2]
+                channels = shape[2] if len(shape) == 3 else 1
+                size = height * width * channels
+            else:
+                offset, height, width, channels = _parse_netpbm(fp)
+                size = height * width * channels
+        
+        if offset + size > os.path.getsize(path):
+            raise UnsupportedRawImageError("Image data is truncated")
+        
+        self.mode = SAMPLE_MODES.get(channels, 'raw')
+        self.rgb_order = channels == 3 and (self.format == 'ppm' or (self.format == 'npy' and not fortran_order))
+        self.width, self.height = width, height
+        self.data = np.memmap(path, dtype=np.uint8, mode=mode)
+        self.samples = self.data[offset:offset + size]
+        
+        # Present the samples as top-down RGB without copying them
+        if self.format == 'bmp':
+            rows = self.samples.reshape(height, row_size)[:, :width * channels]
+            pixels = rows.reshape(height, width, channels)[:, :, 2::-1]
+            self.pixels = pixels if top_down else pixels[::-1]
+        elif self.format == 'npy' and fortran_order:
+            self.pixels = self.samples.reshape((channels, width, height)).T
+        else:
+            self.pixels = self.samples.reshape(height, width, channels)
+    
+    @property
+    def writable(self):
+        """True if changes to the samples are written to the file."""
+        return self.data.mode == 'r+'
+    
+    def flush(self):
+        """Write changes to the file (only for mode 'r+')."""
+        if self.writable:
+            self.data.flush()
+    
+    def write_to(self, output):
+        """
+        Write the whole mapped file, including in-memory changes, to a stream.
+        
+        Args:
+            output: Binary file-like object
+        
+        Returns:
+            int: Number of bytes written
+        """
+        view = memoryview(self.data)
+        for start in range(0, len(view), COPY_BLOCK_SIZE):
+            output.write(view[start:start + COPY_BLOCK_SIZE])
+        return len(view)
+    
+    def copy_to(self, output_path, mode='r+'):
+        """
+        Copy the image file on disk and map the copy.
+        
+        Args:
+            output_path: Destination path
+            mode: np.memmap mode for the copy
+        
+        Returns:
+            RawImage: The mapped copy
+        """
+        shutil.copyfile(self.path, output_path)
+        return RawImage(output_path, mode)
@@ -0,0 +1,100 @@
+"""
+Keyed pseudo-random channel order for scattered embedding.
+
+A keyed Feistel network permutes the index space [0, n) of a carrier's
+channel values, so the position of the i-th payload bit can be computed
+directly from i. Only the indices a payload needs are ever generated, which
+keeps the cost proportional to the payload size rather than the image size.
+"""
+import hashlib
+import numpy as np
+
+# Number of Feistel rounds (4 rounds give a pseudo-random permutation)
+FEISTEL_ROUNDS = 4
+
+# Domain separation for key derivation
+KEY_CONTEXT = b'stegopy-scatter-v1:'
+
+_MULTIPLIER_1 = np.uint64(0x9E3779B97F4A7C15)
+_MULTIPLIER_2 = np.uint64(0xBF58476D1CE4E5B9)
+
+class FeistelPermutation:
+    """
+    Keyed bijection of [0, size) evaluated on arrays of indices.
+    
+    The network works on the smallest even number of bits covering size;
+    results that fall outside the domain are fed through again
+    (cycle-walking) until they land inside it, which preserves the
+    bijection.
+    """
+    
+    def __init__(self, key, size):
+        """
+        Derive the round keys for a domain.
+        
+        Args:
+            key: Key material (str or bytes), e.g. an auth code or passphrase
+            size: Number of indices in the domain
+        """
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+        self.size = int(size)
+        self.half_bits = max(1, (max(1, self.size - 1).bit_length() + 1) // 2)
+        self.mask = np.uint64((1 << self.half_bits) - 1)
+        
+        digest = hashlib.sha256(KEY_CONTEXT + self.size.to_bytes(8, 'big') + key).digest()
+        self.round_keys = [np.uint64(int.from_bytes(digest[i * 8:(i + 1) * 8], 'big'))
+                           for i in range(FEISTEL_ROUNDS)]
+    
+    def _round(self, value, round_key):
+        x = (value ^ round_key) * _MULTIPLIER_1
+        x ^= x >> np.uint64(32)
+        x *= _MULTIPLIER_2
+        x ^= x >> np.uint64(29)
+        return x & self.mask
+    
+    def _encrypt(self, indices):
+        shift = np.uint64(self.half_bits)
+        left = indices >> shift
+        right = indices & self.mask
+        for round_key in self.round_keys:
+            left, right = right, left ^ self._round(right, round_key)
+        return (left << shift) | right
+    
+    def __call__(self, indices):
+        """
+        Map indices through the permutation.
+        
+        Args:
+            indices: Integer array of indices in [0, size)
+        
+        Returns:
+            numpy.ndarray: int64 array of permuted indices in [0, size)
+        """
+        with np.errstate(over='ignore'):
+            result = self._encrypt(np.asarray(indices, dtype=np.uint64))
+            outside = np.flatnonzero(result >= self.size)
+            while outside.size:
+                result[outside] = self._encrypt(result[outside])
+                outside = outside[result[outside] >= self.size]
+        return result.astype(np.int64)
+
+def scatter_positions(key, size, count, offset=0):
+    """
+    Return the channel positions used for the first count payload values.
+    
+    Args:
+        key: Key material (str or bytes)
+        size: Number of channel values available for the payload
+        count: Number of positions needed
+        offset: Index of the first available channel value
+    
+    Returns:
+        numpy.ndarray: int64 array of count distinct positions
+    """
+    if count > size:
+        raise ValueError("More positions requested than the domain holds")
+    positions = FeistelPermutation(key, size)(np.arange(count, dtype=np.uint64))
+    if offset:
+        positions += offset
+    return positions
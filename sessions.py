@@ -0,0 +1,267 @@
+"""
+Server-side sessions for the steganography web application.
+
+Flask's default session is a signed cookie, so everything put in it (a
+decoded message, say) travels with every request until it hits the 4 KB
+cookie limit. ServerSessionInterface keeps the session data in a store on
+the server and puts only a random session ID in the cookie.
+
+Two stores are provided: MemorySessionStore, an in-process LRU with a
+time-to-live (the default), and SQLAlchemySessionStore, which keeps
+sessions in a database through Flask-SQLAlchemy (SQLite unless configured
+otherwise) so they survive restarts and are shared between workers.
+
+Values larger than LARGE_VALUE_BYTES are stored once in their own record
+and only read from the store when a request looks at them; other requests
+just carry a small placeholder.
+"""
+import re
+import secrets
+import time
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import delete
+from werkzeug.datastructures import CallbackDict
+from cache import TTLCache
+
+# Session backends accepted by create_session_store
+SESSION_BACKENDS = ('memory', 'sqlalchemy')
+
+# Values at least this large (in characters or bytes) get their own record
+LARGE_VALUE_BYTES = 1024
+
+# Bytes of randomness in a session ID, and the form IDs from cookies must have
+SESSION_ID_BYTES = 32
+SESSION_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{43}')
+
+db = SQLAlchemy()
+
+class SessionRecord(db.Model):
+    """A stored session or large session value."""
+    __tablename__ = 'sessions'
+    
+    id = db.Column(db.String(128), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    expires = db.Column(db.Float, nullable=False, index=True)
+
+class MemorySessionStore:
+    """Keeps serialized sessions in an in-process LRU cache with a time-to-live."""
+    
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=3600):
+        """
+        Create an empty store.
+        
+        Args:
+            max_bytes: Maximum combined size of all stored records
+            ttl: Lifetime of a record in seconds
+        """
+        self.cache = TTLCache(max_bytes=max_bytes, ttl=ttl)
+    
+    def load(self, key):
+        """Return a stored record, or None if it is missing or expired."""
+        return self.cache.get(key)
+    
+    def save(self, key, data):
+        """Store a record, restarting its time-to-live."""
+        self.cache.set(key, data, size=len(data))
+    
+    def delete(self, key):
+        """Remove a record if it exists."""
+        self.cache.pop(key)
+    
+    def purge_expired(self):
+        """Drop every record whose time-to-live has passed."""
+        self.cache.purge_expired()
+
+class SQLAlchemySessionStore:
+    """
+    Keeps serialized sessions in a database table through Flask-SQLAlchemy.
+    
+    The database is set by the app's SQLALCHEMY_DATABASE_URI; expired rows
+    are ignored when read.
+    """
+    
+    def __init__(self, app, ttl=3600, clock=time.time):
+        """
+        Bind the store to an app and create its table if needed.
+        
+        Args:
+            app: Flask app configured with SQLALCHEMY_DATABASE_URI
+            ttl: Lifetime of a record in seconds
+            clock: Function returning the current time in seconds
+        """
+        self.ttl = ttl
+        self.clock = clock
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+    
+    def load(self, key):
+        """Return a stored record, or None if it is missing or expired."""
+        record = db.session.get(SessionRecord, key)
+        if record is None or record.expires <= self.clock():
+            return None
+        return record.data
+    
+    def save(self, key, data):
+        """Store a record, restarting its time-to-live."""
+        db.session.merge(SessionRecord(id=key, data=data, expires=self.clock() + self.ttl))
+        db.session.commit()
+    
+    def delete(self, key):
+        """Remove a record if it exists."""
+        db.session.execute(delete(SessionRecord).where(SessionRecord.id == key))
+        db.session.commit()
+    
+    def purge_expired(self):
+        """Delete every record whose time-to-live has passed."""
+        db.session.execute(delete(SessionRecord).where(SessionRecord.expires <= self.clock()))
+        db.session.commit()
+
+def create_session_store(app):
+    """
+    Create the session store selected by the app's configuration.
+    
+    Args:
+        app: Flask app with SESSION_BACKEND ('memory' or 'sqlalchemy'),
+            SESSION_TTL and SESSION_CACHE_BYTES set
+    
+    Returns:
+        MemorySessionStore or SQLAlchemySessionStore
+    """
+    backend = app.config['SESSION_BACKEND']
+    if backend == 'memory':
+        return MemorySessionStore(max_bytes=app.config['SESSION_CACHE_BYTES'], ttl=app.config['SESSION_TTL'])
+    if backend == 'sqlalchemy':
+        return SQLAlchemySessionStore(app, ttl=app.config['SESSION_TTL'])
+    raise ValueError(f"Unknown session backend '{backend}'. Use one of: {', '.join(SESSION_BACKENDS)}")
+
+class StoredValue:
+    """Placeholder for a large session value that has not been read yet."""
+    
+    def __init__(self, key):
+        self.key = key
+
+class ServerSession(CallbackDict, SessionMixin):
+    """
+    Session data held in a store, with large values read on first access.
+    
+    `loaded` remembers the large values read from the store, so saving the
+    session does not write them again unless they were replaced.
+    """
+    
+    def __init__(self, initial=None, sid=None, store=None, new=False):
+        def on_update(self):
+            self.modified = True
+        
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.store = store
+        self.new = new
+        self.modified = False
+        self.stored = {key for key, value in self.items() if isinstance(value, StoredValue)}
+        self.loaded = {}
+    
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, StoredValue):
+            data = self.store.load(value.key)
+            if data is None:
+                # The value expired before the session that points to it
+                dict.__delitem__(self, key)
+                self.modified = True
+                raise KeyError(key)
+            value = session_json_serializer.loads(data)
+            dict.__setitem__(self, key, value)
+            self.loaded[key] = value
+        return value
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[key]
+        return value
+
+class ServerSessionInterface(SessionInterface):
+    """
+    Session interface storing session data server-side under an opaque cookie ID.
+    
+    Expired records are purged whenever a new session starts.
+    """
+    
+    session_class = ServerSession
+    
+    def __init__(self, store):
+        """
+        Args:
+            store: MemorySessionStore or SQLAlchemySessionStore
+        """
+        self.store = store
+    
+    @staticmethod
+    def value_key(sid, name):
+        """Return the store key of a session's large value."""
+        return f"{sid}:{name}"
+    
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and SESSION_ID_PATTERN.fullmatch(sid):
+            data = self.store.load(sid)
+            if data is not None:
+                values = session_json_serializer.loads(data)
+                for name in values.pop('_stored', ()):
+                    values[name] = StoredValue(self.value_key(sid, name))
+                return self.session_class(values, sid=sid, store=self.store)
+        
+        self.store.purge_expired()
+        return self.session_class(sid=secrets.token_urlsafe(SESSION_ID_BYTES), store=self.store, new=True)
+    
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        
+        # Drop emptied sessions from the store and the browser
+        if not session:
+            if not session.new:
+                self.store.delete(session.sid)
+                for key in session.stored:
+                    self.store.delete(self.value_key(session.sid, key))
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       httponly=self.get_cookie_httponly(app),
+                                       samesite=self.get_cookie_samesite(app))
+                response.vary.add('Cookie')
+            return
+        
+        if session.modified:
+            values = {}
+            stored = []
+            for key, value in dict.items(session):
+                if isinstance(value, StoredValue) or session.loaded.get(key) is value:
+                    # Already in the store
+                    stored.append(key)
+                elif isinstance(value, (str, bytes)) and len(value) >= LARGE_VALUE_BYTES:
+                    self.store.save(self.value_key(session.sid, key), session_json_serializer.dumps(value).encode('utf-8'))
+                    stored.append(key)
+                else:
+                    values[key] = value
+            for key in session.stored - set(stored):
+                self.store.delete(self.value_key(session.sid, key))
+            values['_stored'] = stored
+            self.store.save(session.sid, session_json_serializer.dumps(values).encode('utf-8'))
+        
+        if session.new or self.should_set_cookie(app, session):
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+            response.vary.add('Cookie')
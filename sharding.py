@@ -0,0 +1,225 @@
+"""
+Messages split across several carrier images.
+
+A message too large for any single carrier is compressed once and split
+into shards sized to each carrier's capacity. Each shard is embedded with a
+shard header (set ID, shard index, shard count and the CRC32 of the whole
+payload) after the usual v2 header. Shards are embedded and extracted on a
+process pool, and decoding reassembles them from the images in any order.
+"""
+import os
+import secrets
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from stegano import (
+    Steganography,
+    SteganographyError,
+    KeyRequiredError,
+    Carrier,
+    FLAG_TEXT,
+    FLAG_SHARD,
+    SHARD_STRUCT,
+    DEFAULT_SAVE_PROFILE,
+    DEFAULT_COMPRESSION
+)
+
+# Largest number of shards in a set (the index and count are 16-bit fields)
+MAX_SHARDS = 0xFFFF
+
+def plan_shards(size, capacities):
+    """
+    Split a payload over carriers in order, filling each one before the next.
+    
+    Args:
+        size: Stored payload size in bytes
+        capacities: Shard data capacity of each carrier in bytes (after the
+            shard header)
+    
+    Returns:
+        list: (carrier index, start, end) byte ranges, one per shard
+    """
+    shards = []
+    start = 0
+    for index, capacity in enumerate(capacities):
+        if start >= size:
+            break
+        if capacity <= 0:
+            continue
+        end = min(size, start + capacity)
+        shards.append((index, start, end))
+        start = end
+    
+    if start < size:
+        raise SteganographyError(
+            f"Message is too large for these images ({size} bytes to store, "
+            f"combined capacity {sum(max(0, capacity) for capacity in capacities)} bytes)")
+    if len(shards) > MAX_SHARDS:
+        raise SteganographyError(f"Message needs more than {MAX_SHARDS} shards")
+    return shards
+
+def shard_capacity(image_path, bits_per_channel=1, output_format=None, matrix=0):
+    """
+    Return how many bytes of shard data a carrier holds.
+    
+    Args:
+        image_path: Path to the carrier image
+        bits_per_channel: Number of LSBs used per channel value
+        output_format: Output format (JPEG carriers hold less as JPEG)
+        matrix: Matrix embedding k, or 0 for plain LSB embedding
+    
+    Returns:
+        int: Shard data capacity in bytes (after the shard header)
+    """
+    carrier = Carrier.load(image_path)
+    carrier = carrier.for_format(carrier.resolve_output_format(None, output_format))
+    return carrier.capacity(bits_per_channel, matrix) - SHARD_STRUCT.size
+
+def encode_shard(image_path, payload, output_dir=None, flags=0, bits_per_channel=1, output_format=None,
+                 save_profile=DEFAULT_SAVE_PROFILE, codec='none', key=None, matrix=0):
+    """
+    Embed one shard into a carrier and save it (runs in a worker process).
+    
+    Args:
+        image_path: Path to the carrier image
+        payload: Shard header followed by the shard data
+        output_dir: Directory for the output image (defaults to the input's)
+        flags: Header flag bits
+        bits_per_channel: Number of LSBs used per channel value
+        output_format: Output format (see Carrier.resolve_output_format)
+        save_profile: 'fast', 'balanced' or 'smallest' speed/size trade-off
+        codec: Compression codec of the whole payload
+        key: Optional auth code or passphrase for scattered embedding
+        matrix: Matrix embedding k, or 0 for plain LSB embedding
+    
+    Returns:
+        str: Path to the output image
+    """
+    carrier = Carrier.load(image_path)
+    output_format = carrier.resolve_output_format(None, output_format)
+    carrier = carrier.for_format(output_format)
+    name = os.path.splitext(os.path.basename(carrier.filename))[0]
+    directory = output_dir or os.path.dirname(carrier.filename)
+    output_path = os.path.join(directory, f"{name}_encoded.{output_format}")
+    
+    carrier = carrier.for_output(output_path, output_format)
+    carrier.embed(payload, flags, bits_per_channel, codec, key, matrix)
+    carrier.save(output_path, output_format, save_profile)
+    return output_path
+
+def read_shard(image_path, key=None):
+    """
+    Extract the shard held by an image (runs in a worker process).
+    
+    Args:
+        image_path: Path to the image
+        key: Auth code or passphrase for scattered shards
+    
+    Returns:
+        tuple or None: (shard data, header dict with a 'shard' entry), or
+            None if the image does not hold a shard
+    """
+    payload, header = Steganography.read_payload(image_path, key)
+    if header is None or not header["flags"] & FLAG_SHARD:
+        return None
+    return payload, header
+
+def encode_sharded(image_paths, text, output_dir=None, bits_per_channel=1, output_format=None,
+                   save_profile=DEFAULT_SAVE_PROFILE, compression=DEFAULT_COMPRESSION,
+                   scatter=False, passphrase=None, workers=None, matrix=0):
+    """
+    Hide text across several images and generate a 4-digit auth code.
+    
+    Carriers are filled in the order given, so only as many images as the
+    message needs are written.
+    
+    Args:
+        image_paths: Paths to the carrier images
+        text: Text to hide
+        output_dir: Directory for the output images (defaults to each input's)
+        bits_per_channel: Number of LSBs used per channel value (1-4)
+        output_format: 'png', 'webp' or 'tiff' (raw carriers keep their format
+            and JPEG carriers can be saved as 'jpeg')
+        save_profile: 'fast', 'balanced' or 'smallest' speed/size trade-off
+        compression: 'none', 'zlib', 'lzma', 'bz2' or 'auto'
+        scatter: Scatter each shard in an order seeded by the auth code
+        passphrase: Scatter each shard in an order seeded by this passphrase
+        workers: Number of worker processes (defaults to the CPU count)
+        matrix: Matrix embedding k, or 0 for plain LSB embedding
+    
+    Returns:
+        tuple: (List of output image paths in shard order, authentication code)
+    """
+    if not text:
+        raise SteganographyError("No text provided for encoding")
+    bits_per_channel = Steganography.check_bits_per_channel(bits_per_channel)
+    matrix = Steganography.check_matrix(matrix)
+    
+    auth_code = Steganography.generate_auth_code()
+    key = passphrase or (auth_code if scatter else None)
+    codec, payload = Steganography.compress(f"AUTH:{auth_code}:{text}".encode('utf-8'), compression)
+    payload = bytes(payload)
+    
+    capacities = [shard_capacity(path, bits_per_channel, output_format, matrix) for path in image_paths]
+    shards = plan_shards(len(payload), capacities)
+    set_id = secrets.token_bytes(8)
+    crc = zlib.crc32(payload)
+    
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(shards))) as executor:
+        futures = [
+            executor.submit(
+                encode_shard, image_paths[carrier],
+                Steganography.build_shard_header(set_id, index, len(shards), crc) + payload[start:end],
+                output_dir, FLAG_TEXT | FLAG_SHARD, bits_per_channel, output_format, save_profile, codec, key,
+                matrix)
+            for index, (carrier, start, end) in enumerate(shards)
+        ]
+        outputs = [future.result() for future in futures]
+    
+    return outputs, auth_code
+
+def decode_sharded(image_paths, auth_code=None, passphrase=None, workers=None):
+    """
+    Reassemble and extract text hidden across several images.
+    
+    The images may be given in any order; images that hold no shard are
+    ignored, but every shard of the message must be present.
+    
+    Args:
+        image_paths: Paths to the images
+        auth_code: Optional authentication code for decoding
+        passphrase: Optional passphrase for scattered shards
+        workers: Number of worker processes (defaults to the CPU count)
+    
+    Returns:
+        str or dict: Extracted text or auth_required flag with auth code
+    """
+    if not image_paths:
+        raise SteganographyError("No images provided for decoding")
+    
+    key = passphrase or auth_code
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(image_paths))) as executor:
+            results = list(executor.map(read_shard, image_paths, [key] * len(image_paths)))
+    except KeyRequiredError:
+        return {"auth_required": True, "stored_code": None}
+    
+    shards = [result for result in results if result is not None]
+    if not shards:
+        raise SteganographyError("No message shards found in these images")
+    set_ids = {header["shard"]["set_id"] for _, header in shards}
+    if len(set_ids) > 1:
+        raise SteganographyError(f"Images hold shards of {len(set_ids)} different messages")
+    
+    header = shards[0][1]
+    count = header["shard"]["count"]
+    chunks = {shard_header["shard"]["index"]: chunk for chunk, shard_header in shards}
+    missing = [str(index + 1) for index in range(count) if index not in chunks]
+    if missing:
+        raise SteganographyError(f"Missing shard(s) {', '.join(missing)} of {count}")
+    
+    payload = b"".join(chunks[index] for index in range(count))
+    if zlib.crc32(payload) != header["shard"]["crc"]:
+        raise SteganographyError("Message is corrupted (checksum mismatch)")
+    
+    full_text = Steganography.decompress(payload, header["codec"]).decode('utf-8')
+    return Steganography.unwrap_message(full_text, auth_code)
@@ -1,19 +1,222 @@
 """
 Core steganography functionality for hiding and extracting text in images.
 """
+import io
 import os
+import shutil
+import time
+from contextlib import contextmanager
 import numpy as np
-from PIL import Image
+from PIL import Image, JpegImagePlugin
 import logging
 import random
 import hashlib
+import struct
+import zlib
+import lzma
+import bz2
+from scatter import scatter_positions
+from pngstream import PNGRowReader, UnsupportedPNGError
+from rawimage import RawImage, UnsupportedRawImageError, raw_format
+import jpegdct
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
+# 16-bit end-of-message marker appended by text_to_binary
+DELIMITER = '1111111111111110'
+DELIMITER_BYTES = b'\xff\xfe'
+
+# Legacy (headerless) messages are only looked for in this many leading
+# bytes, and must read as text: control characters (other than tab and line
+# breaks) mean the LSBs are just image noise
+LEGACY_MAX_BYTES = 64 * 1024
+LEGACY_CONTROL_BYTES = bytes(set(range(0x20)) - {0x09, 0x0A, 0x0D}) + bytes(range(0x7F, 0xA0))
+
+# v2 container header stored in the first LSBs (always 1 bit per channel):
+# magic, version, flags, payload bits per channel (low nibble) and matrix
+# embedding parameter k (high nibble, 0 for plain LSB), compression codec,
+# stored payload length in bytes and CRC32 of the stored payload
+HEADER_MAGIC = b'SGPY'
+HEADER_VERSION = 2
+HEADER_STRUCT = struct.Struct('>4sBBBBII')
+HEADER_BITS = HEADER_STRUCT.size * 8
+
+# Payload bits stored per channel value (k-LSB embedding)
+MIN_BITS_PER_CHANNEL = 1
+MAX_BITS_PER_CHANNEL = 4
+
+# Matrix embedding with (1, 2^k - 1, k) Hamming codes: k payload bits are
+# held by the syndrome of each block of 2^k - 1 LSBs, and writing them
+# changes at most one LSB per block (0 selects plain LSB embedding)
+MIN_MATRIX_K = 2
+MAX_MATRIX_K = 8
+
+# Header flag bits
+FLAG_TEXT = 0x01  # Payload is UTF-8 text written by Steganography.encode
+FLAG_KEYED = 0x02  # Payload bits are scattered in a keyed pseudo-random order
+FLAG_SHARD = 0x04  # Payload is one shard of a message spread over several images
+
+# Shard header at the start of a FLAG_SHARD payload: shard set ID, shard
+# index, shard count and CRC32 of the whole reassembled (stored) payload
+SHARD_STRUCT = struct.Struct('>8sHHI')
+
+# Payload compression codecs and the header codec field value for each;
+# 'auto' keeps whichever result (including uncompressed) is smallest
+COMPRESSION_CODECS = {'none': 0, 'zlib': 1, 'lzma': 2, 'bz2': 3}
+COMPRESSION_CHOICES = tuple(COMPRESSION_CODECS) + ('auto',)
+DEFAULT_COMPRESSION = 'none'
+COMPRESSORS = {
+    'zlib': (lambda data: zlib.compress(data, 9), zlib.decompressobj),
+    'lzma': (lzma.compress, lzma.LZMADecompressor),
+    'bz2': (lambda data: bz2.compress(data, 9), bz2.BZ2Decompressor),
+}
+
+# Largest payload a compressed message may expand to (guards against
+# decompression bombs in untrusted images)
+MAX_DECOMPRESSED_SIZE = 256 * 1024 * 1024
+
+# Lossless output formats, the file extensions that select them and the
+# Pillow save options for each speed/size profile
+SAVE_PROFILES = ('fast', 'balanced', 'smallest')
+DEFAULT_SAVE_PROFILE = 'balanced'
+OUTPUT_FORMATS = ('png', 'webp', 'tiff')
+OUTPUT_FORMAT_EXTENSIONS = {'png': 'png', 'webp': 'webp', 'tif': 'tiff', 'tiff': 'tiff'}
+SAVE_OPTIONS = {
+    'png': {
+        'fast': {'compress_level': 1},
+        'balanced': {'compress_level': 6},
+        'smallest': {'compress_level': 9, 'optimize': True},
+    },
+    'webp': {
+        'fast': {'lossless': True, 'exact': True, 'method': 0, 'quality': 0},
+        'balanced': {'lossless': True, 'exact': True, 'method': 4, 'quality': 80},
+        'smallest': {'lossless': True, 'exact': True, 'method': 6, 'quality': 90},
+    },
+    'tiff': {
+        'fast': {'compression': 'raw'},
+        'balanced': {'compression': 'tiff_lzw'},
+        'smallest': {'compression': 'tiff_adobe_deflate'},
+    },
+    'jpeg': {
+        'fast': {},
+        'balanced': {'optimize': True},
+        'smallest': {'optimize': True, 'progressive': True},
+    },
+}
+
+# JPEG carriers can also be saved as JPEG when asked to (output format
+# 'jpeg' or a .jpg/.jpeg output path), with the payload hidden in their
+# quantized DCT coefficients (see JPEGCarrier)
+JPEG_OUTPUT_FORMAT = 'jpeg'
+JPEG_EXTENSIONS = ('jpg', 'jpeg')
+
+# Times a JPEG output is encoded and read back without progress before
+# giving up on blocks whose coefficients do not survive the round trip, and
+# the number of those attempts after which such a block stops carrying data
+# (which restarts the count)
+JPEG_SAVE_ATTEMPTS = 8
+JPEG_RETIRE_AFTER = 4
+
+# Number of channel values unpacked per step during extraction (multiple of 8)
+EXTRACT_CHUNK_SIZE = 1 << 20
+
+# PNG payloads are read row by row, without decoding the whole image, when
+# they end within this many channel values and this share of the image
+INCREMENTAL_MAX_CHANNELS = 1 << 20
+INCREMENTAL_MAX_FRACTION = 0.25
+
 class SteganographyError(Exception):
     """Custom exception for steganography operations."""
     pass
 
+class KeyRequiredError(SteganographyError):
+    """Raised when a scattered payload is read without its key."""
+    pass
+
+class Instrumentation:
+    """
+    Records per-stage wall time, byte and pixel counts for an operation.
+    
+    Pass an instance to Carrier to see where time goes (open, decode,
+    convert, array copy, embed, fromarray, save, extract; dct and verify for
+    JPEG outputs). Each finished
+    stage is appended to `stages` and handed to the optional callback, so
+    callers can forward timings to a log or an APM system.
+    """
+    
+    def __init__(self, callback=None, enabled=True):
+        """
+        Create an empty recorder.
+        
+        Args:
+            callback: Optional callable receiving each finished stage dict
+            enabled: Record stages; a disabled instance only runs the code
+        """
+        self.callback = callback
+        self.enabled = enabled
+        self.stages = []
+    
+    @contextmanager
+    def stage(self, name, bytes=None, pixels=None):
+        """
+        Time a block of code as a named stage.
+        
+        The yielded dict may be updated inside the block, e.g. to fill in
+        'bytes' once an output size is known.
+        
+        Args:
+            name: Stage name
+            bytes: Number of bytes processed, if known up front
+            pixels: Number of pixels processed, if known up front
+        
+        Yields:
+            dict: The stage record ('name', 'seconds', 'bytes', 'pixels')
+        """
+        record = {'name': name, 'seconds': 0.0, 'bytes': bytes, 'pixels': pixels}
+        if not self.enabled:
+            yield record
+            return
+        
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - started
+            self.stages.append(record)
+            if self.callback:
+                self.callback(record)
+    
+    def total_seconds(self):
+        """Return the combined wall time of all recorded stages."""
+        return sum(record['seconds'] for record in self.stages)
+    
+    def server_timing(self):
+        """
+        Format the recorded stages as a Server-Timing header value.
+        
+        Returns:
+            str: e.g. 'open;dur=0.41, decode;dur=12.70, embed;dur=0.93'
+        """
+        return ', '.join(f"{record['name']};dur={record['seconds'] * 1000:.2f}" for record in self.stages)
+    
+    def format_table(self):
+        """
+        Format the recorded stages as a plain-text table.
+        
+        Returns:
+            str: One line per stage plus a total
+        """
+        lines = [f"{'stage':<12}{'ms':>10}{'bytes':>14}{'pixels':>14}"]
+        for record in self.stages:
+            size = '' if record['bytes'] is None else record['bytes']
+            pixels = '' if record['pixels'] is None else record['pixels']
+            lines.append(f"{record['name']:<12}{record['seconds'] * 1000:>10.2f}{size:>14}{pixels:>14}")
+        lines.append(f"{'total':<12}{self.total_seconds() * 1000:>10.2f}")
+        return '\n'.join(lines)
+
+# Shared recorder used when no instrumentation is requested
+NO_INSTRUMENTATION = Instrumentation(enabled=False)
+
 class Steganography:
     """
     Class that provides methods for encoding and decoding text in images.
@@ -37,7 +240,7 @@ class Steganography:
         Args:
             input_code: Code provided by the user
             stored_code: Original code generated during encoding
-            
+        
         Returns:
             bool: True if codes match, False otherwise
         """
@@ -50,7 +253,7 @@ class Steganography:
             return ""
         binary = ''.join(format(ord(char), '08b') for char in text)
         # Add delimiter to know where the text ends
-        binary += '1111111111111110'  # 16-bit delimiter
+        binary += DELIMITER  # 16-bit delimiter
         return binary
     
     @staticmethod
@@ -60,196 +263,1876 @@ class Steganography:
             return ""
         
         # Look for the delimiter
-        delimiter_index = binary.find('1111111111111110')
+        delimiter_index = binary.find(DELIMITER)
         if delimiter_index != -1:
             binary = binary[:delimiter_index]
         
-        # Process 8 bits at a time to recover characters
-        text = ""
-        for i in range(0, len(binary), 8):
-            if i + 8 <= len(binary):
-                byte = binary[i:i+8]
-                text += chr(int(byte, 2))
-        return text
+        # Pack 8 bits at a time to recover characters, dropping any partial byte
+        bits = Steganography.binary_to_bits(binary[:len(binary) - len(binary) % 8])
+        return np.packbits(bits).tobytes().decode('latin-1')
     
     @staticmethod
-    def can_encode(image_path, text):
+    def binary_to_bits(binary):
         """
-        Check if the image has enough capacity to encode the text.
+        Convert a '0'/'1' string into a uint8 array of bit values.
         
         Args:
-            image_path: Path to the image file
-            text: Text to encode
-            
+            binary: String of '0' and '1' characters
+        
         Returns:
-            bool: True if the image can store the text, False otherwise
+            numpy.ndarray: Array of 0/1 values, one per character
+        """
+        return np.frombuffer(binary.encode('ascii'), dtype=np.uint8) - ord('0')
+    
+    @staticmethod
+    def check_bits_per_channel(bits_per_channel):
+        """
+        Validate a bits-per-channel setting.
+        
+        Args:
+            bits_per_channel: Number of LSBs used per channel value
+        
+        Returns:
+            int: The validated value
         """
         try:
-            with Image.open(image_path) as img:
-                # Get image dimensions
-                width, height = img.size
-                
-                # Calculate max capacity (3 color channels, 1 bit per channel)
-                max_bits = width * height * 3 * 1
-                
-                # Calculate required bits (8 bits per character + delimiter)
-                required_bits = len(text) * 8 + 16  # 16 bits for delimiter
-                
-                return max_bits >= required_bits
-        except Exception as e:
-            raise SteganographyError(f"Error checking image capacity: {str(e)}")
+            bits_per_channel = int(bits_per_channel)
+        except (TypeError, ValueError):
+            bits_per_channel = 0
+        if not MIN_BITS_PER_CHANNEL <= bits_per_channel <= MAX_BITS_PER_CHANNEL:
+            raise SteganographyError(
+                f"Bits per channel must be between {MIN_BITS_PER_CHANNEL} and {MAX_BITS_PER_CHANNEL}")
+        return bits_per_channel
     
     @staticmethod
-    def encode(image_path, text, output_path=None):
+    def check_matrix(matrix):
         """
-        Hide text data within an image and generate a 4-digit auth code.
+        Validate a matrix embedding parameter.
         
         Args:
-            image_path: Path to the original image
-            text: Text to hide in the image
-            output_path: Path to save the steganographic image
-            
+            matrix: Hamming code parameter k, or 0 for plain LSB embedding
+        
         Returns:
-            tuple: (Path to the output image, authentication code)
+            int: The validated value
         """
         try:
-            if not text:
-                raise SteganographyError("No text provided for encoding")
-            
-            # Generate the 4-digit authentication code
-            auth_code = Steganography.generate_auth_code()
-            
-            # Add the auth code as a prefix to the text with a separator
-            secured_text = f"AUTH:{auth_code}:{text}"
-            
-            # Prepare output path
-            if not output_path:
-                name, ext = os.path.splitext(image_path)
-                # Force PNG format to avoid compression issues
-                output_path = f"{name}_encoded.png"
-            
-            # Check if we can encode the text in the image
-            if not Steganography.can_encode(image_path, secured_text):
+            matrix = int(matrix or 0)
+        except (TypeError, ValueError):
+            matrix = -1
+        if matrix and not MIN_MATRIX_K <= matrix <= MAX_MATRIX_K:
+            raise SteganographyError(
+                f"Matrix embedding k must be between {MIN_MATRIX_K} and {MAX_MATRIX_K} (or 0 to turn it off)")
+        return matrix
+    
+    @staticmethod
+    def block_size(matrix):
+        """Return the number of channel values in a matrix embedding block (2^k - 1)."""
+        return (1 << matrix) - 1
+    
+    @staticmethod
+    def embedding_efficiency(bits_per_channel=1, matrix=0):
+        """
+        Return the expected number of payload bits hidden per changed channel.
+        
+        A channel (plain embedding) or a block (matrix embedding) holding
+        b bits is left alone with probability 2^-b, so on average it hides
+        b / (1 - 2^-b) bits per change: 2 for 1-bit LSB, about 3.4 for k=3
+        and 5.2 for k=5.
+        
+        Args:
+            bits_per_channel: Number of LSBs used per channel value
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        
+        Returns:
+            float: Payload bits per changed channel value
+        """
+        bits = matrix or bits_per_channel
+        return bits / (1 - 2.0 ** -bits)
+    
+    @staticmethod
+    def channels_needed(length, bits_per_channel=1, matrix=0):
+        """
+        Return the number of channel values needed to store length bytes.
+        
+        Args:
+            length: Number of bytes
+            bits_per_channel: Number of LSBs used per channel value
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        
+        Returns:
+            int: Number of channel values
+        """
+        if matrix:
+            return -(-length * 8 // matrix) * Steganography.block_size(matrix)
+        return -(-length * 8 // bits_per_channel)
+    
+    @staticmethod
+    def max_payload_size(total_channels, bits_per_channel=1, matrix=0):
+        """
+        Return the largest payload (in bytes) that fits in a carrier.
+        
+        Args:
+            total_channels: Number of channel values in the image
+            bits_per_channel: Number of LSBs used per channel value
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        
+        Returns:
+            int: Maximum payload size in bytes
+        """
+        if matrix:
+            blocks = max(0, total_channels - HEADER_BITS) // Steganography.block_size(matrix)
+            return blocks * matrix // 8
+        return max(0, (total_channels - HEADER_BITS) * bits_per_channel // 8)
+    
+    @staticmethod
+    def embed_bits(flattened, bits, bits_per_channel=1, positions=None):
+        """
+        Write bits into the least significant bits of a flattened pixel array.
+        
+        Bits are grouped bits_per_channel at a time (most significant first)
+        and the first ceil(len(bits) / bits_per_channel) elements are updated
+        in place with a single masked bitwise operation over the whole slice.
+        With positions, the same operation is applied as a scatter to those
+        elements instead.
+        
+        Args:
+            flattened: 1-D uint8 array of channel values (modified in place)
+            bits: uint8 array of 0/1 values
+            bits_per_channel: Number of LSBs to replace per channel value
+            positions: Optional index array of the elements to write, in order
+        
+        Returns:
+            numpy.ndarray: The modified flattened array
+        """
+        if bits_per_channel == 1:
+            values = bits
+        else:
+            # Pad to a whole number of groups and fold each group into a value
+            padding = -len(bits) % bits_per_channel
+            groups = np.concatenate([bits, np.zeros(padding, dtype=np.uint8)]).reshape(-1, bits_per_channel)
+            values = np.zeros(len(groups), dtype=np.uint8)
+            for column in range(bits_per_channel):
+                values = (values << 1) | groups[:, column]
+        
+        count = len(values)
+        mask = np.uint8(0xFF ^ ((1 << bits_per_channel) - 1))
+        if positions is not None:
+            if count > len(positions):
                 raise SteganographyError("Text is too large for this image")
-            
-            # Open image and convert to RGB
-            with Image.open(image_path) as img:
-                # Convert image to RGB if not already
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Get image as numpy array
-                img_array = np.array(img)
-                height, width, channels = img_array.shape
-                
-                # Convert text to binary
-                binary_text = Steganography.text_to_binary(secured_text)
-                
-                # Flatten the image array for easier looping
-                flattened = img_array.reshape(-1)
-                
-                # Counter for binary text position
-                binary_index = 0
-                binary_length = len(binary_text)
-                
-                # Loop through pixels and hide data
-                for i in range(0, len(flattened), 1):
-                    if binary_index < binary_length:
-                        # LSB encoding: Replace the least significant bit
-                        if binary_text[binary_index] == '1':
-                            # Set LSB to 1 (ensure it's 1)
-                            if flattened[i] % 2 == 0:  # If LSB is 0
-                                flattened[i] += 1
-                        else:
-                            # Set LSB to 0 (ensure it's 0)
-                            if flattened[i] % 2 == 1:  # If LSB is 1
-                                flattened[i] -= 1
-                        
-                        binary_index += 1
-                    else:
-                        # We've encoded all our data
-                        break
-                
-                # Reshape back to original dimensions
-                img_array_modified = flattened.reshape(height, width, channels)
-                
-                # Create a new image from the modified array
-                encoded_img = Image.fromarray(img_array_modified.astype('uint8'), 'RGB')
-                
-                # Save the image
-                encoded_img.save(output_path)
-                
-                # Return both the path and the authentication code
-                return output_path, auth_code
+            positions = positions[:count]
+            flattened[positions] = (flattened[positions] & mask) | values
+            return flattened
+        
+        if count > len(flattened):
+            raise SteganographyError("Text is too large for this image")
+        
+        flattened[:count] = (flattened[:count] & mask) | values
+        return flattened
+    
+    @staticmethod
+    def embed_bits_reference(flattened, binary_text):
+        """
+        Reference per-element implementation of embed_bits.
+        
+        This is the original pixel-by-pixel loop. It is far too slow for
+        production use but is kept so the vectorized path can be checked
+        bit-for-bit against it.
+        
+        Args:
+            flattened: 1-D uint8 array of channel values (modified in place)
+            binary_text: String of '0' and '1' characters
+        
+        Returns:
+            numpy.ndarray: The modified flattened array
+        """
+        # Counter for binary text position
+        binary_index = 0
+        binary_length = len(binary_text)
+        
+        # Loop through pixels and hide data
+        for i in range(0, len(flattened), 1):
+            if binary_index < binary_length:
+                # LSB encoding: Replace the least significant bit
+                if binary_text[binary_index] == '1':
+                    # Set LSB to 1 (ensure it's 1)
+                    if flattened[i] % 2 == 0:  # If LSB is 0
+                        flattened[i] += 1
+                else:
+                    # Set LSB to 0 (ensure it's 0)
+                    if flattened[i] % 2 == 1:  # If LSB is 1
+                        flattened[i] -= 1
                 
-        except SteganographyError as e:
-            raise e
-        except Exception as e:
-            raise SteganographyError(f"Error encoding message: {str(e)}")
+                binary_index += 1
+            else:
+                # We've encoded all our data
+                break
+        
+        return flattened
     
     @staticmethod
-    def decode(image_path, auth_code=None):
+    def syndromes(blocks, matrix):
         """
-        Extract hidden text from a steganographic image with authentication.
+        Compute the Hamming syndrome of every matrix embedding block at once.
+        
+        The syndrome of a block is the XOR of the (1-based) positions of its
+        channels whose LSB is set, i.e. the block's LSBs multiplied by the
+        parity-check matrix whose columns are the numbers 1 to 2^k - 1.
         
         Args:
-            image_path: Path to the steganographic image
-            auth_code: Optional authentication code for decoding
+            blocks: uint8 array of shape (blocks, 2^k - 1)
+            matrix: Matrix embedding k
+        
+        Returns:
+            numpy.ndarray: uint8 syndrome (k bits) of each block
+        """
+        columns = np.arange(1, Steganography.block_size(matrix) + 1, dtype=np.uint8)
+        return np.bitwise_xor.reduce((blocks & 1) * columns, axis=1)
+    
+    @staticmethod
+    def matrix_embed(flattened, bits, matrix):
+        """
+        Hide bits in the LSBs of a flattened pixel array by matrix embedding.
+        
+        Each block of 2^k - 1 channel values stores k bits (most significant
+        first) as its syndrome. Where a block's syndrome differs from the
+        bits it must hold, XORing the two gives the position of the single
+        LSB to flip, so all blocks are fixed with one scatter.
+        
+        Args:
+            flattened: 1-D uint8 array of channel values (modified in place)
+            bits: uint8 array of 0/1 values
+            matrix: Matrix embedding k
+        
+        Returns:
+            numpy.ndarray: The modified flattened array
+        """
+        size = Steganography.block_size(matrix)
+        padding = -len(bits) % matrix
+        groups = np.concatenate([bits, np.zeros(padding, dtype=np.uint8)]).reshape(-1, matrix)
+        count = len(groups)
+        if count * size > len(flattened):
+            raise SteganographyError("Text is too large for this image")
+        
+        values = np.zeros(count, dtype=np.uint8)
+        for column in range(matrix):
+            values = (values << 1) | groups[:, column]
+        
+        flips = Steganography.syndromes(flattened[:count * size].reshape(count, size), matrix) ^ values
+        blocks = np.flatnonzero(flips)
+        flattened[blocks * size + flips[blocks] - 1] ^= 1
+        return flattened
+    
+    @staticmethod
+    def matrix_extract(channels, length, matrix):
+        """
+        Read bytes hidden by matrix_embed.
+        
+        Args:
+            channels: 1-D uint8 array of the channel values holding the data
+            length: Number of bytes to read
+            matrix: Matrix embedding k
+        
+        Returns:
+            bytes: The extracted bytes
+        """
+        size = Steganography.block_size(matrix)
+        count = len(channels) // size
+        values = Steganography.syndromes(channels[:count * size].reshape(count, size), matrix)
+        shifts = np.arange(matrix - 1, -1, -1, dtype=np.uint8)
+        bits = ((values[:, None] >> shifts) & 1).reshape(-1)[:length * 8]
+        return np.packbits(bits).tobytes()
+    
+    @staticmethod
+    def extract_bytes(flattened, delimiter=DELIMITER_BYTES, chunk_size=EXTRACT_CHUNK_SIZE,
+                      require_delimiter=False):
+        """
+        Extract LSB data from a flattened pixel array as bytes.
+        
+        LSBs are pulled in bulk chunks and packed with np.packbits, and the
+        delimiter is located with a byte search on the packed data, so the
+        work grows with the payload size rather than the image size.
+        
+        Args:
+            flattened: 1-D uint8 array of channel values
+            delimiter: Byte sequence marking the end of the message, or None
+                to return every complete byte
+            chunk_size: Number of channel values to unpack per step
+            require_delimiter: Return b"" instead of every complete byte
+                when the delimiter is not found
+        
+        Returns:
+            bytes: Extracted data up to (not including) the delimiter
+        """
+        # Only whole bytes can be recovered
+        usable = len(flattened) - len(flattened) % 8
+        chunk_size -= chunk_size % 8
+        
+        data = bytearray()
+        for start in range(0, usable, chunk_size):
+            chunk = flattened[start:min(start + chunk_size, usable)] & 1
             
+            # The delimiter may straddle the previous chunk boundary
+            search_from = max(0, len(data) - len(delimiter) + 1) if delimiter else 0
+            data += np.packbits(chunk).tobytes()
+            
+            if delimiter:
+                delimiter_index = data.find(delimiter, search_from)
+                if delimiter_index != -1:
+                    return bytes(data[:delimiter_index])
+        
+        if delimiter and require_delimiter:
+            return b""
+        return bytes(data)
+    
+    @staticmethod
+    def bytes_to_bits(data):
+        """
+        Convert bytes into a uint8 array of bit values (MSB first).
+        
+        Args:
+            data: Bytes to convert
+        
         Returns:
-            str or tuple: Extracted text or auth_required flag with auth code
+            numpy.ndarray: Array of 0/1 values, eight per byte
         """
-        try:
-            # Open the image
-            with Image.open(image_path) as img:
-                # Convert image to RGB if not already
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Get image as numpy array
-                img_array = np.array(img)
-                
-                # Flatten the array
-                flattened = img_array.reshape(-1)
-                
-                # Extract the LSB from each byte
-                binary_message = ""
-                for i in range(len(flattened)):
-                    binary_message += str(flattened[i] & 1)
-                    
-                    # Look for the delimiter as we go to stop early if possible
-                    if len(binary_message) >= 16 and binary_message[-16:] == '1111111111111110':
-                        binary_message = binary_message[:-16]  # Remove the delimiter
-                        break
-                
-                # Convert binary back to text
-                full_text = Steganography.binary_to_text(binary_message)
-                
-                # Check if the text has authentication information
-                if full_text.startswith("AUTH:"):
-                    parts = full_text.split(":", 2)
-                    if len(parts) == 3:
-                        stored_auth_code = parts[1]
-                        actual_message = parts[2]
-                        
-                        # If no auth code is provided, return a flag indicating auth is required
-                        if auth_code is None:
-                            return {"auth_required": True, "stored_code": stored_auth_code}
-                        
-                        # Verify the authentication code
-                        if Steganography.verify_auth_code(auth_code, stored_auth_code):
-                            return actual_message
-                        else:
-                            raise SteganographyError("Invalid authentication code")
-                
-                # Handle the NOAUTH case (messages explicitly encoded without auth)
-                elif full_text.startswith("NOAUTH:"):
-                    parts = full_text.split(":", 1)
-                    if len(parts) == 2:
-                        return parts[1]
-                
-                # If there's no authentication code in the text, return it as is
-                return full_text
-                
-        except Exception as e:
-            raise SteganographyError(f"Error decoding message: {str(e)}")
+        return np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+    
+    @staticmethod
+    def read_bytes(flattened, offset, length, bits_per_channel=1, positions=None, matrix=0):
+        """
+        Read a run of bytes from the LSBs of a flattened pixel array.
+        
+        Args:
+            flattened: 1-D uint8 array of channel values
+            offset: Index of the first channel value to read
+            length: Number of bytes to read
+            bits_per_channel: Number of LSBs stored per channel value
+            positions: Optional index array to gather from instead of the
+                run starting at offset
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        
+        Returns:
+            bytes: The extracted bytes
+        """
+        count = Steganography.channels_needed(length, bits_per_channel, matrix)
+        if positions is not None:
+            if count > len(positions):
+                raise SteganographyError("Message length exceeds image capacity")
+            channels = flattened[positions[:count]]
+        else:
+            if offset + count > len(flattened):
+                raise SteganographyError("Message length exceeds image capacity")
+            channels = flattened[offset:offset + count]
+        
+        if matrix:
+            return Steganography.matrix_extract(channels, length, matrix)
+        if bits_per_channel == 1:
+            return np.packbits(channels & 1).tobytes()
+        
+        # Unfold each value into its bits_per_channel low bits, MSB first
+        values = channels & ((1 << bits_per_channel) - 1)
+        shifts = np.arange(bits_per_channel - 1, -1, -1, dtype=np.uint8)
+        bits = ((values[:, None] >> shifts) & 1).reshape(-1)[:length * 8]
+        return np.packbits(bits).tobytes()
+    
+    @staticmethod
+    def build_header(payload, flags=0, bits_per_channel=1, codec=0, matrix=0):
+        """
+        Build the v2 container header for a payload.
+        
+        Args:
+            payload: Stored (possibly compressed) payload bytes that will
+                follow the header
+            flags: Header flag bits
+            bits_per_channel: Number of LSBs used per channel for the payload
+            codec: Compression codec value from COMPRESSION_CODECS
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        
+        Returns:
+            bytes: Packed header
+        """
+        return HEADER_STRUCT.pack(HEADER_MAGIC, HEADER_VERSION, flags, bits_per_channel | matrix << 4, codec,
+                                  memoryview(payload).nbytes, zlib.crc32(payload))
+    
+    @staticmethod
+    def build_shard_header(set_id, index, count, crc):
+        """
+        Build the shard header that starts each FLAG_SHARD payload.
+        
+        Args:
+            set_id: 8-byte ID shared by every shard of a message
+            index: Position of this shard (0-based)
+            count: Number of shards in the set
+            crc: CRC32 of the whole stored payload before splitting
+        
+        Returns:
+            bytes: Packed shard header
+        """
+        return SHARD_STRUCT.pack(set_id, index, count, crc)
+    
+    @staticmethod
+    def parse_shard_header(data):
+        """
+        Parse the shard header at the start of a FLAG_SHARD payload.
+        
+        Args:
+            data: Stored payload bytes
+        
+        Returns:
+            dict: set_id (hex), index, count and crc fields
+        """
+        if len(data) < SHARD_STRUCT.size:
+            raise SteganographyError("Message is corrupted (shard header is truncated)")
+        set_id, index, count, crc = SHARD_STRUCT.unpack_from(data)
+        if index >= count:
+            raise SteganographyError("Message is corrupted (invalid shard index)")
+        return {"set_id": set_id.hex(), "index": index, "count": count, "crc": crc}
+    
+    @staticmethod
+    def has_header(flattened):
+        """
+        Check whether a flattened pixel array starts with a v2 header magic.
+        
+        Args:
+            flattened: 1-D uint8 array of channel values
+        
+        Returns:
+            bool: True if the first LSBs hold the header magic
+        """
+        if len(flattened) < HEADER_BITS:
+            return False
+        return Steganography.read_bytes(flattened, 0, len(HEADER_MAGIC)) == HEADER_MAGIC
+    
+    @staticmethod
+    def parse_header(header):
+        """
+        Parse a v2 container header.
+        
+        Args:
+            header: HEADER_STRUCT.size bytes read from the image
+        
+        Returns:
+            dict or None: Header fields, or None if the magic does not match
+        """
+        magic, version, flags, embedding, codec, length, crc = HEADER_STRUCT.unpack(header)
+        if magic != HEADER_MAGIC:
+            return None
+        if version != HEADER_VERSION:
+            raise SteganographyError(f"Unsupported message format version: {version}")
+        return {"version": version, "flags": flags,
+                "bits_per_channel": Steganography.check_bits_per_channel(embedding & 0x0F),
+                "matrix": Steganography.check_matrix(embedding >> 4),
+                "codec": Steganography.codec_name(codec), "length": length, "crc": crc}
+    
+    @staticmethod
+    def codec_name(codec):
+        """
+        Return the name of a header codec value.
+        
+        Args:
+            codec: Codec value stored in the header
+        
+        Returns:
+            str: Codec name from COMPRESSION_CODECS
+        """
+        for name, value in COMPRESSION_CODECS.items():
+            if value == codec:
+                return name
+        raise SteganographyError(f"Unsupported compression codec: {codec}")
+    
+    @staticmethod
+    def compress(data, compression=DEFAULT_COMPRESSION):
+        """
+        Compress a payload before embedding.
+        
+        Args:
+            data: Bytes-like payload
+            compression: 'none', 'zlib', 'lzma', 'bz2', or 'auto' to keep the
+                smallest result (uncompressed if nothing helps)
+        
+        Returns:
+            tuple: (codec name, stored payload)
+        """
+        if compression not in COMPRESSION_CHOICES:
+            raise SteganographyError(
+                f"Unknown compression '{compression}'. Use one of: {', '.join(COMPRESSION_CHOICES)}")
+        if compression == 'none':
+            return 'none', data
+        if compression != 'auto':
+            return compression, COMPRESSORS[compression][0](data)
+        
+        best = ('none', data)
+        for name, (compress, _) in COMPRESSORS.items():
+            compressed = compress(data)
+            if len(compressed) < memoryview(best[1]).nbytes:
+                best = (name, compressed)
+        return best
+    
+    @staticmethod
+    def decompress(payload, codec, max_size=MAX_DECOMPRESSED_SIZE):
+        """
+        Decompress a stored payload.
+        
+        Args:
+            payload: Stored payload bytes
+            codec: Codec name from the header
+            max_size: Largest accepted decompressed size in bytes
+        
+        Returns:
+            bytes: The original payload
+        """
+        if codec == 'none':
+            return payload
+        
+        decompressor = COMPRESSORS[codec][1]()
+        try:
+            data = decompressor.decompress(payload, max_size + 1)
+        except Exception as e:
+            raise SteganographyError(f"Message is corrupted ({codec} data is invalid: {str(e)})")
+        if len(data) > max_size:
+            raise SteganographyError("Message is too large to decompress")
+        if not decompressor.eof:
+            raise SteganographyError(f"Message is corrupted ({codec} data is truncated)")
+        return data
+    
+    @staticmethod
+    def payload_positions(total_channels, length, bits_per_channel, key, matrix=0):
+        """
+        Return the keyed channel positions holding a scattered payload.
+        
+        Only the positions the payload needs are generated, so the cost
+        scales with the payload size rather than the image size.
+        
+        Args:
+            total_channels: Number of channel values in the image
+            length: Stored payload length in bytes
+            bits_per_channel: Number of LSBs used per channel for the payload
+            key: Auth code or passphrase seeding the order
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        
+        Returns:
+            numpy.ndarray: Channel indices after the header, in payload order
+        """
+        available = total_channels - HEADER_BITS
+        count = Steganography.channels_needed(length, bits_per_channel, matrix)
+        if count > available:
+            raise SteganographyError("Message length exceeds image capacity")
+        return scatter_positions(key, available, count, offset=HEADER_BITS)
+    
+    @staticmethod
+    def embed_payload(flattened, payload, flags=0, bits_per_channel=1, codec='none', key=None, matrix=0):
+        """
+        Embed a payload with its v2 header into a flattened pixel array.
+        
+        The header always uses 1 bit per channel so it can be read before
+        the payload's bits-per-channel setting is known. With a key, the
+        payload bits are scattered over the channels after the header in a
+        keyed pseudo-random order and FLAG_KEYED is set. With matrix, the
+        payload is matrix embedded (see matrix_embed) into 1 bit per channel.
+        
+        Args:
+            flattened: 1-D uint8 array of channel values (modified in place)
+            payload: Stored payload bytes (already compressed with codec)
+            flags: Header flag bits
+            bits_per_channel: Number of LSBs used per channel for the payload
+            codec: Compression codec name recorded in the header
+            key: Optional auth code or passphrase for scattered embedding
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        
+        Returns:
+            numpy.ndarray: The modified flattened array
+        """
+        bits_per_channel = Steganography.check_bits_per_channel(bits_per_channel)
+        matrix = Steganography.check_matrix(matrix)
+        if matrix and bits_per_channel != 1:
+            raise SteganographyError("Matrix embedding uses 1 bit per channel")
+        if memoryview(payload).nbytes > Steganography.max_payload_size(len(flattened), bits_per_channel, matrix):
+            raise SteganographyError("Text is too large for this image")
+        
+        size = memoryview(payload).nbytes
+        if key:
+            flags |= FLAG_KEYED
+        header = Steganography.build_header(payload, flags, bits_per_channel, COMPRESSION_CODECS[codec], matrix)
+        
+        # Header and payload are embedded separately to avoid copying the payload
+        Steganography.embed_bits(flattened[:HEADER_BITS], Steganography.bytes_to_bits(header))
+        if matrix:
+            bits = Steganography.bytes_to_bits(payload)
+            if key:
+                # Blocks are formed from the channels in scattered order
+                positions = Steganography.payload_positions(len(flattened), size, 1, key, matrix)
+                channels = flattened[positions]
+                flattened[positions] = Steganography.matrix_embed(channels, bits, matrix)
+            else:
+                Steganography.matrix_embed(flattened[HEADER_BITS:], bits, matrix)
+        elif key:
+            positions = Steganography.payload_positions(len(flattened), size, bits_per_channel, key)
+            Steganography.embed_bits(flattened, Steganography.bytes_to_bits(payload), bits_per_channel,
+                                     positions)
+        else:
+            Steganography.embed_bits(flattened[HEADER_BITS:], Steganography.bytes_to_bits(payload),
+                                     bits_per_channel)
+        return flattened
+    
+    @staticmethod
+    def extract_payload(flattened, key=None, total_channels=None):
+        """
+        Extract a payload from a flattened pixel array.
+        
+        v2 images are recognised from the magic in the first 32 LSBs, after
+        which only the header and exactly `length` payload bytes are read.
+        Scattered payloads are gathered with the key and compressed payloads
+        are decompressed transparently. For shards the shard header is
+        parsed into header["shard"] and the undecompressed shard data is
+        returned (see sharding.py). Images without a header are read in the
+        legacy delimiter format, stopping at the delimiter; an empty payload
+        is returned when no delimiter ends a text message within
+        LEGACY_MAX_BYTES.
+        
+        Args:
+            flattened: 1-D uint8 array of channel values
+            key: Auth code or passphrase for scattered payloads
+            total_channels: Number of channel values in the whole image when
+                flattened only holds its first rows (see channels_used)
+        
+        Returns:
+            tuple: (payload bytes, header dict or None for legacy messages)
+        """
+        total_channels = total_channels or len(flattened)
+        if total_channels < HEADER_BITS:
+            return b"", None
+        
+        header = Steganography.parse_header(Steganography.read_bytes(flattened, 0, HEADER_STRUCT.size))
+        if header is not None:
+            bits_per_channel, matrix = header["bits_per_channel"], header["matrix"]
+            if header["length"] > Steganography.max_payload_size(total_channels, bits_per_channel, matrix):
+                raise SteganographyError("Message length exceeds image capacity")
+            
+            if header["flags"] & FLAG_KEYED:
+                if not key:
+                    raise KeyRequiredError("This message is scattered; its authentication code or passphrase is required")
+                positions = Steganography.payload_positions(total_channels, header["length"], bits_per_channel, key,
+                                                            matrix)
+                payload = Steganography.read_bytes(flattened, HEADER_BITS, header["length"], bits_per_channel,
+                                                   positions, matrix)
+                if zlib.crc32(payload) != header["crc"]:
+                    raise SteganographyError("Invalid authentication code or passphrase")
+            else:
+                payload = Steganography.read_bytes(flattened, HEADER_BITS, header["length"], bits_per_channel,
+                                                   matrix=matrix)
+                if zlib.crc32(payload) != header["crc"]:
+                    raise SteganographyError("Message is corrupted (checksum mismatch)")
+            
+            # Shards are decompressed once the whole payload is reassembled
+            if header["flags"] & FLAG_SHARD:
+                header["shard"] = Steganography.parse_shard_header(payload)
+                return payload[SHARD_STRUCT.size:], header
+            return Steganography.decompress(payload, header["codec"]), header
+        
+        # No header: fall back to the legacy delimiter format, which older
+        # versions wrote with or without an AUTH:/NOAUTH: prefix
+        scanned = flattened[:(LEGACY_MAX_BYTES + len(DELIMITER_BYTES)) * 8]
+        payload = Steganography.extract_bytes(scanned, require_delimiter=True)
+        if len(payload.translate(None, LEGACY_CONTROL_BYTES)) != len(payload):
+            return b"", None
+        return payload, None
+    
+    @staticmethod
+    def channels_used(flattened, total_channels, key=None):
+        """
+        Return how many leading channel values a v2 payload occupies.
+        
+        Used to read only the start of an image: the header is parsed from
+        the first HEADER_BITS values and the end of the payload is computed
+        from its length (or, for scattered payloads, its last position).
+        
+        Args:
+            flattened: At least the first HEADER_BITS channel values
+            total_channels: Number of channel values in the whole image
+            key: Auth code or passphrase for scattered payloads
+        
+        Returns:
+            int: Number of channel values to read from the start of the image
+        """
+        header = Steganography.parse_header(Steganography.read_bytes(flattened, 0, HEADER_STRUCT.size))
+        if header is None:
+            return total_channels
+        
+        bits_per_channel, matrix, length = header["bits_per_channel"], header["matrix"], header["length"]
+        # Invalid or keyless headers only need the header to report the error
+        if not length or length > Steganography.max_payload_size(total_channels, bits_per_channel, matrix):
+            return HEADER_BITS
+        if header["flags"] & FLAG_KEYED:
+            if not key:
+                return HEADER_BITS
+            positions = Steganography.payload_positions(total_channels, length, bits_per_channel, key, matrix)
+            return int(positions.max()) + 1
+        return HEADER_BITS + Steganography.channels_needed(length, bits_per_channel, matrix)
+    
+    @staticmethod
+    def payload_size(data):
+        """
+        Return the number of payload bytes needed to store text or binary data.
+        
+        Args:
+            data: str (stored as UTF-8) or any bytes-like object
+        
+        Returns:
+            int: Payload size in bytes
+        """
+        if isinstance(data, str):
+            return len(data.encode('utf-8'))
+        return memoryview(data).nbytes
+    
+    @staticmethod
+    def compressed_size(data, compression=DEFAULT_COMPRESSION):
+        """
+        Return the number of payload bytes stored after compression.
+        
+        Args:
+            data: str (stored as UTF-8) or any bytes-like object
+            compression: Compression applied before embedding
+        
+        Returns:
+            int: Stored payload size in bytes
+        """
+        if compression == 'none':
+            return Steganography.payload_size(data)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return Steganography.payload_size(Steganography.compress(data, compression)[1])
+    
+    @staticmethod
+    def compress_message(text, auth_code=None, compression=DEFAULT_COMPRESSION):
+        """
+        Build and compress the stored payload of a text message.
+        
+        Lets callers size a carrier from the payload (see CarrierPool.pick)
+        and then pass it to encode, so the message is compressed only once.
+        
+        Args:
+            text: Message text
+            auth_code: Auth code the message will be encoded with, or None
+                for a message stored without authentication
+            compression: Compression applied before embedding
+        
+        Returns:
+            tuple: (codec name, stored payload including the AUTH/NOAUTH prefix)
+        """
+        prefix = f"AUTH:{auth_code}:" if auth_code else "NOAUTH:"
+        return Steganography.compress((prefix + text).encode('utf-8'), compression)
+    
+    @staticmethod
+    def can_encode(image_path, text, bits_per_channel=1, compression=DEFAULT_COMPRESSION, output_format=None):
+        """
+        Check if the image has enough capacity to encode the text.
+        
+        Args:
+            image_path: Path to the image file or a loaded Carrier
+            text: Text (or bytes-like data) to encode
+            bits_per_channel: Number of LSBs used per channel value
+            compression: Compression applied before embedding; the
+                compressed size is checked
+            output_format: Output format (JPEG carriers hold less as JPEG)
+        
+        Returns:
+            bool: True if the image can store the text, False otherwise
+        """
+        bits_per_channel = Steganography.check_bits_per_channel(bits_per_channel)
+        if isinstance(image_path, Carrier) or raw_format(image_path) or jpegdct.is_jpeg(image_path):
+            carrier = Carrier.load(image_path)
+            carrier = carrier.for_format(carrier.resolve_output_format(None, output_format))
+            return carrier.can_fit(text, bits_per_channel, compression)
+        
+        try:
+            with Image.open(image_path) as img:
+                # Get image dimensions
+                width, height = img.size
+                
+                # Calculate max capacity (3 color channels after the header)
+                max_bytes = Steganography.max_payload_size(width * height * 3, bits_per_channel)
+                
+                return Steganography.compressed_size(text, compression) <= max_bytes
+        except SteganographyError as e:
+            raise e
+        except Exception as e:
+            raise SteganographyError(f"Error checking image capacity: {str(e)}")
+    
+    @staticmethod
+    def resolve_output_format(output_path=None, output_format=None):
+        """
+        Determine the lossless output format for an encoded image.
+        
+        Args:
+            output_path: Output path whose extension selects the format
+                when output_format is not given
+            output_format: Explicit format name ('png', 'webp' or 'tiff')
+        
+        Returns:
+            str: Output format name
+        """
+        if output_format is None:
+            ext = ''
+            if isinstance(output_path, (str, os.PathLike)):
+                ext = os.path.splitext(output_path)[1].lower().lstrip('.')
+            if not ext:
+                return 'png'
+            output_format = OUTPUT_FORMAT_EXTENSIONS.get(ext, ext)
+        
+        output_format = output_format.lower()
+        if output_format in JPEG_EXTENSIONS:
+            raise SteganographyError(
+                f"Only JPEG images can be encoded as JPEG. Use one of: {', '.join(OUTPUT_FORMATS)}")
+        if output_format not in OUTPUT_FORMATS:
+            raise SteganographyError(
+                f"Unsupported output format '{output_format}'. Use one of: {', '.join(OUTPUT_FORMATS)}")
+        return output_format
+    
+    @staticmethod
+    def save_options(output_format, save_profile=DEFAULT_SAVE_PROFILE):
+        """
+        Return the Pillow format name and save options for a profile.
+        
+        Args:
+            output_format: Output format name ('png', 'webp' or 'tiff')
+            save_profile: 'fast', 'balanced' or 'smallest'
+        
+        Returns:
+            tuple: (Pillow format name, dict of save keyword arguments)
+        """
+        if save_profile not in SAVE_PROFILES:
+            raise SteganographyError(
+                f"Unknown save profile '{save_profile}'. Use one of: {', '.join(SAVE_PROFILES)}")
+        return output_format.upper(), dict(SAVE_OPTIONS[output_format][save_profile])
+    
+    @staticmethod
+    def encode_bytes(image_path, data, output_path=None, flags=0, bits_per_channel=1,
+                     output_format=None, save_profile=DEFAULT_SAVE_PROFILE, compression=DEFAULT_COMPRESSION,
+                     key=None, matrix=0, codec=None):
+        """
+        Hide binary data within an image.
+        
+        The data is optionally compressed, then embedded directly from its
+        buffer as a uint8 bit array, without building an intermediate bit
+        string.
+        
+        Args:
+            image_path: Path to the original image or a loaded Carrier
+            data: bytes, bytearray or memoryview to hide
+            output_path: Path to save the steganographic image
+            flags: Header flag bits
+            bits_per_channel: Number of LSBs used per channel value (1-4)
+            output_format: 'png', 'webp' or 'tiff'; defaults to the output
+                path's extension, or PNG. Raw carriers (BMP, PPM, PGM, .npy)
+                keep their own format and are modified in a copy on disk.
+                JPEG carriers can be saved as 'jpeg' (see JPEGCarrier).
+            save_profile: 'fast', 'balanced' or 'smallest' speed/size trade-off
+            compression: 'none', 'zlib', 'lzma', 'bz2' or 'auto'
+            key: Optional auth code or passphrase; scatters the payload in
+                a keyed pseudo-random order
+            matrix: Hamming code parameter k for matrix embedding (fewer
+                changed channels, less capacity), or 0 for plain LSB
+            codec: Codec the data is already compressed with (see
+                compress_message), or None to compress it with `compression`
+        
+        Returns:
+            str: Path to the output image
+        """
+        try:
+            matrix = Steganography.check_matrix(matrix)
+            payload = memoryview(data).cast('B')
+            if not payload.nbytes:
+                raise SteganographyError("No data provided for encoding")
+            
+            carrier = Carrier.load(image_path)
+            output_format = carrier.resolve_output_format(output_path, output_format)
+            carrier = carrier.for_format(output_format)
+            
+            # Prepare output path
+            if not output_path:
+                name, ext = os.path.splitext(carrier.filename)
+                # Force a lossless format to avoid compression issues
+                output_path = f"{name}_encoded.{output_format}"
+            
+            # Compress the payload unless it already is; the codec is recorded in the header
+            if codec is None:
+                if compression != 'none':
+                    with carrier.instrumentation.stage('compress', bytes=payload.nbytes):
+                        codec, payload = Steganography.compress(payload, compression)
+                else:
+                    codec = 'none'
+            
+            # Check if we can encode the data in the image
+            if not carrier.can_fit(payload, bits_per_channel, matrix=matrix):
+                raise SteganographyError(
+                    f"Text is too large for this image ({Steganography.payload_size(payload)} bytes to store, "
+                    f"capacity {carrier.capacity(bits_per_channel, matrix)} bytes)")
+            
+            # Write the header and payload, then save the image
+            carrier = carrier.for_output(output_path, output_format)
+            carrier.embed(payload, flags, bits_per_channel, codec, key, matrix)
+            carrier.save(output_path, output_format, save_profile)
+            
+            return output_path
+        
+        except SteganographyError as e:
+            raise e
+        except Exception as e:
+            raise SteganographyError(f"Error encoding message: {str(e)}")
+    
+    @staticmethod
+    def encode(image_path, text, output_path=None, bits_per_channel=1,
+               output_format=None, save_profile=DEFAULT_SAVE_PROFILE, compression=DEFAULT_COMPRESSION,
+               scatter=False, passphrase=None, auth_code=None, matrix=0, compressed=None):
+        """
+        Hide text data within an image and generate a 4-digit auth code.
+        
+        Args:
+            image_path: Path to the original image or a loaded Carrier
+            text: Text to hide in the image
+            output_path: Path to save the steganographic image
+            bits_per_channel: Number of LSBs used per channel value (1-4)
+            output_format: 'png', 'webp' or 'tiff'; defaults to the output
+                path's extension, or PNG (raw carriers keep their format and
+                JPEG carriers can be saved as 'jpeg')
+            save_profile: 'fast', 'balanced' or 'smallest' speed/size trade-off
+            compression: 'none', 'zlib', 'lzma', 'bz2' or 'auto'
+            scatter: Scatter the message in an order seeded by the auth code
+            passphrase: Scatter the message in an order seeded by this
+                passphrase instead (implies scatter)
+            auth_code: 4-digit code to use instead of a newly generated one
+                (e.g. one already passed to compress_message)
+            matrix: Hamming code parameter k for matrix embedding, or 0
+            compressed: (codec, payload) from compress_message for this text
+                and auth_code, so the message is not compressed again
+        
+        Returns:
+            tuple: (Path to the output image, authentication code)
+        """
+        if not text:
+            raise SteganographyError("No text provided for encoding")
+        
+        # Generate the 4-digit authentication code
+        auth_code = auth_code or Steganography.generate_auth_code()
+        
+        # Add the auth code as a prefix to the text with a separator
+        if compressed is not None:
+            codec, data = compressed
+        else:
+            codec, data = None, f"AUTH:{auth_code}:{text}".encode('utf-8')
+        key = passphrase or (auth_code if scatter else None)
+        
+        output_path = Steganography.encode_bytes(
+            image_path, data, output_path, FLAG_TEXT, bits_per_channel,
+            output_format, save_profile, compression, key, matrix, codec)
+        
+        # Return both the path and the authentication code
+        return output_path, auth_code
+    
+    @staticmethod
+    def read_payload(image_path, key=None):
+        """
+        Extract the raw payload and its header from an image.
+        
+        Args:
+            image_path: Path to the steganographic image or a loaded Carrier
+            key: Auth code or passphrase for scattered payloads
+        
+        Returns:
+            tuple: (payload bytes, header dict or None for legacy messages)
+        """
+        try:
+            return Carrier.load(image_path).extract(key)
+        except SteganographyError as e:
+            raise e
+        except Exception as e:
+            raise SteganographyError(f"Error decoding message: {str(e)}")
+    
+    @staticmethod
+    def decode_bytes(image_path, key=None):
+        """
+        Extract hidden binary data from a steganographic image.
+        
+        Args:
+            image_path: Path to the steganographic image or a loaded Carrier
+            key: Auth code or passphrase for scattered payloads
+        
+        Returns:
+            bytes: Extracted payload (empty if no message was found)
+        """
+        return Steganography.read_payload(image_path, key)[0]
+    
+    @staticmethod
+    def decode_text(payload, header):
+        """
+        Convert an extracted payload back to text.
+        
+        Args:
+            payload: Payload bytes
+            header: Header dict, or None for legacy messages
+        
+        Returns:
+            str: Decoded text
+        """
+        if header and header["flags"] & FLAG_SHARD:
+            shard = header["shard"]
+            raise SteganographyError(
+                f"This image holds shard {shard['index'] + 1} of {shard['count']} of a message; "
+                "decode all of its images together")
+        
+        # v2 payloads are UTF-8; legacy messages hold one character per byte
+        return payload.decode('utf-8' if header else 'latin-1')
+    
+    @staticmethod
+    def unwrap_message(full_text, auth_code=None):
+        """
+        Strip the AUTH/NOAUTH prefix from decoded text and check the auth code.
+        
+        Args:
+            full_text: Text extracted from the image
+            auth_code: Optional authentication code for decoding
+        
+        Returns:
+            str or dict: Message text or auth_required flag with auth code
+        """
+        # Check if the text has authentication information
+        if full_text.startswith("AUTH:"):
+            parts = full_text.split(":", 2)
+            if len(parts) == 3:
+                stored_auth_code = parts[1]
+                actual_message = parts[2]
+                
+                # If no auth code is provided, return a flag indicating auth is required
+                if auth_code is None:
+                    return {"auth_required": True, "stored_code": stored_auth_code}
+                
+                # Verify the authentication code
+                if Steganography.verify_auth_code(auth_code, stored_auth_code):
+                    return actual_message
+                else:
+                    raise SteganographyError("Invalid authentication code")
+        
+        # Handle the NOAUTH case (messages explicitly encoded without auth)
+        elif full_text.startswith("NOAUTH:"):
+            parts = full_text.split(":", 1)
+            if len(parts) == 2:
+                return parts[1]
+        
+        # If there's no authentication code in the text, return it as is
+        return full_text
+    
+    @staticmethod
+    def decode(image_path, auth_code=None, passphrase=None):
+        """
+        Extract hidden text from a steganographic image with authentication.
+        
+        Scattered messages are gathered with the passphrase if given,
+        otherwise with the auth code; without either, auth is reported as
+        required.
+        
+        Args:
+            image_path: Path to the steganographic image or a loaded Carrier
+            auth_code: Optional authentication code for decoding
+            passphrase: Optional passphrase for scattered messages
+        
+        Returns:
+            str or tuple: Extracted text or auth_required flag with auth code
+        """
+        try:
+            try:
+                payload, header = Steganography.read_payload(image_path, passphrase or auth_code)
+            except KeyRequiredError:
+                return {"auth_required": True, "stored_code": None}
+            full_text = Steganography.decode_text(payload, header)
+            return Steganography.unwrap_message(full_text, auth_code)
+        
+        except Exception as e:
+            raise SteganographyError(f"Error decoding message: {str(e)}")
+
+
+class Carrier:
+    """
+    An image opened and decoded once for repeated steganography operations.
+    
+    Opening an image, converting it to RGB and copying it into a NumPy array
+    is the most expensive part of every operation, so a Carrier does it a
+    single time and caches the dimensions, mode and pixel array. Capacity
+    checks, embedding, extraction and saving all reuse that array.
+    
+    The pixels are decoded on first use. Extracting from a PNG before that
+    reads only the rows holding the payload (see PNGRowReader).
+    """
+    
+    def __init__(self, source, instrumentation=None):
+        """
+        Open an image and read its dimensions.
+        
+        Args:
+            source: Path to the image file or a binary file-like object
+            instrumentation: Optional Instrumentation recording stage timings
+                for this carrier's operations
+        """
+        self.instrumentation = instrumentation or NO_INSTRUMENTATION
+        self.source = source
+        self._start = None if isinstance(source, (str, os.PathLike)) else source.tell()
+        self._pixels = None
+        
+        try:
+            with self.instrumentation.stage('open', bytes=Carrier.source_size(source)):
+                self._image = Image.open(source)
+            self.format = self._image.format.lower() if self._image.format else ""
+            self.mode = self._image.mode
+            self.width, self.height = self._image.size
+        except Exception as e:
+            raise SteganographyError(f"Error opening image: {str(e)}")
+    
+    @property
+    def pixels(self):
+        """RGB uint8 pixel array of shape (height, width, 3), decoded on first use."""
+        if self._pixels is None:
+            self._decode()
+        return self._pixels
+    
+    @pixels.setter
+    def pixels(self, value):
+        self._pixels = value
+    
+    def _decode(self):
+        """Decode the whole image into the cached pixel array."""
+        instrument = self.instrumentation
+        pixel_count = self.width * self.height
+        
+        try:
+            with self._reopen() as img:
+                with instrument.stage('decode', pixels=pixel_count):
+                    img.load()
+                
+                # Convert image to RGB if not already
+                if img.mode != 'RGB':
+                    with instrument.stage('convert', pixels=pixel_count):
+                        img = img.convert('RGB')
+                
+                # Cache the pixels as a writable numpy array
+                with instrument.stage('array', bytes=pixel_count * 3, pixels=pixel_count):
+                    self._pixels = np.array(img)
+        except Exception as e:
+            raise SteganographyError(f"Error opening image: {str(e)}")
+        finally:
+            self._image = None
+    
+    def _reopen(self):
+        """Return the open image, or open the source again if it was closed."""
+        if self._image is not None:
+            return self._image
+        if self._start is not None:
+            self.source.seek(self._start)
+        return Image.open(self.source)
+    
+    def _extract_incremental(self, key=None):
+        """
+        Extract a v2 payload from a PNG by decoding only its leading rows.
+        
+        Args:
+            key: Auth code or passphrase for scattered payloads
+        
+        Returns:
+            tuple or None: (payload bytes, header dict), or None when the
+                image has to be decoded in full (not a supported PNG, no v2
+                header, or a payload reaching too far into the image)
+        """
+        total_channels = self.width * self.height * 3
+        budget = min(INCREMENTAL_MAX_CHANNELS, total_channels * INCREMENTAL_MAX_FRACTION)
+        
+        try:
+            if self._start is None:
+                fp = open(self.source, 'rb')
+            else:
+                fp = self.source
+                fp.seek(self._start)
+            
+            try:
+                reader = PNGRowReader(fp)
+                if (reader.width, reader.height) != (self.width, self.height):
+                    return None
+                
+                with self.instrumentation.stage('decode') as record:
+                    flattened = reader.read_channels(HEADER_BITS)
+                    needed = HEADER_BITS
+                    if Steganography.has_header(flattened):
+                        needed = Steganography.channels_used(flattened, total_channels, key)
+                        if needed <= budget:
+                            flattened = reader.read_channels(needed)
+                    record['pixels'] = reader.rows_read * self.width
+            finally:
+                if fp is not self.source:
+                    fp.close()
+        except (UnsupportedPNGError, zlib.error, OSError):
+            return None
+        
+        if not Steganography.has_header(flattened) or needed > budget:
+            return None
+        
+        with self.instrumentation.stage('extract') as record:
+            payload, header = Steganography.extract_payload(flattened, key, total_channels)
+            record['bytes'] = len(payload)
+        
+        # The image itself is only reopened if the pixels are needed later
+        if self._image is not None:
+            self._image.close()
+            self._image = None
+        return payload, header
+    
+    @staticmethod
+    def source_size(source):
+        """Return the size in bytes of an image path or seekable stream, if known."""
+        try:
+            if isinstance(source, (str, os.PathLike)):
+                return os.path.getsize(source)
+            position = source.tell()
+            size = source.seek(0, os.SEEK_END)
+            source.seek(position)
+            return size - position
+        except (OSError, AttributeError, ValueError):
+            return None
+    
+    @classmethod
+    def load(cls, image, instrumentation=None):
+        """
+        Return image unchanged if it is already a Carrier, else open it.
+        
+        Uncompressed BMP, PPM, PGM and .npy files are memory-mapped as a
+        RawCarrier, JPEGs are opened as a JPEGCarrier and everything else is
+        decoded with Pillow.
+        
+        Args:
+            image: Path, file-like object or Carrier
+            instrumentation: Optional Instrumentation for a newly opened carrier
+        
+        Returns:
+            Carrier: The loaded carrier
+        """
+        if isinstance(image, Carrier):
+            return image
+        if raw_format(image):
+            return RawCarrier(image, instrumentation)
+        if jpegdct.is_jpeg(image):
+            return JPEGCarrier(image, instrumentation)
+        return Carrier(image, instrumentation)
+    
+    @property
+    def filename(self):
+        """Path or name of the source image, used to derive output names."""
+        if isinstance(self.source, (str, os.PathLike)):
+            return os.fspath(self.source)
+        return getattr(self.source, 'name', None) or 'image'
+    
+    @property
+    def flattened(self):
+        """Flat view of the pixel array (writes go to the cached pixels)."""
+        return self.pixels.reshape(-1)
+    
+    def capacity(self, bits_per_channel=1, matrix=0):
+        """
+        Return the maximum payload size in bytes.
+        
+        Args:
+            bits_per_channel: Number of LSBs used per channel value
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        
+        Returns:
+            int: Number of payload bytes that fit after the header
+        """
+        return Steganography.max_payload_size(self.width * self.height * 3, bits_per_channel, matrix)
+    
+    def resolve_output_format(self, output_path=None, output_format=None):
+        """
+        Determine the format an encoded copy of this carrier is saved in.
+        
+        Args:
+            output_path: Output path whose extension selects the format
+            output_format: Explicit format name
+        
+        Returns:
+            str: Output format name (see Steganography.resolve_output_format)
+        """
+        return Steganography.resolve_output_format(output_path, output_format)
+    
+    def for_format(self, output_format):
+        """
+        Return the carrier whose capacity applies to an output format.
+        
+        Args:
+            output_format: Resolved output format
+        
+        Returns:
+            Carrier: This carrier (every format stores the same channels)
+        """
+        return self
+    
+    def for_output(self, output_path, output_format=None):
+        """
+        Return the carrier to embed into when writing to output_path.
+        
+        Args:
+            output_path: Path or file-like object the image will be saved to
+            output_format: Resolved output format
+        
+        Returns:
+            Carrier: This carrier (the pixels are written out by save)
+        """
+        return self
+    
+    def can_fit(self, data, bits_per_channel=1, compression=DEFAULT_COMPRESSION, matrix=0):
+        """
+        Check if text or binary data fits in this carrier.
+        
+        Args:
+            data: str (stored as UTF-8) or bytes-like object
+            bits_per_channel: Number of LSBs used per channel value
+            compression: Compression applied before embedding
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        
+        Returns:
+            bool: True if the data fits, False otherwise
+        """
+        return Steganography.compressed_size(data, compression) <= self.capacity(bits_per_channel, matrix)
+    
+    def embed(self, data, flags=0, bits_per_channel=1, codec='none', key=None, matrix=0):
+        """
+        Embed a payload with its v2 header into the cached pixels.
+        
+        Args:
+            data: Bytes-like stored payload (already compressed with codec)
+            flags: Header flag bits
+            bits_per_channel: Number of LSBs used per channel value
+            codec: Compression codec name recorded in the header
+            key: Optional auth code or passphrase for scattered embedding
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        """
+        size = memoryview(data).nbytes
+        channels = HEADER_BITS + Steganography.channels_needed(size, bits_per_channel, matrix)
+        with self.instrumentation.stage('embed', bytes=size, pixels=-(-channels // 3)):
+            Steganography.embed_payload(self.flattened, data, flags, bits_per_channel, codec, key, matrix)
+    
+    def extract(self, key=None):
+        """
+        Extract the payload from the image.
+        
+        PNG payloads near the start of the image are read incrementally
+        when the pixels have not been decoded yet; otherwise the cached
+        pixels are used.
+        
+        Args:
+            key: Auth code or passphrase for scattered payloads
+        
+        Returns:
+            tuple: (payload bytes, header dict or None for legacy messages)
+        """
+        if self._pixels is None and self.format == 'png':
+            result = self._extract_incremental(key)
+            if result is not None:
+                return result
+        
+        with self.instrumentation.stage('extract') as record:
+            payload, header = Steganography.extract_payload(self.flattened, key)
+            record['bytes'] = len(payload)
+        return payload, header
+    
+    def save(self, output, output_format=None, save_profile=DEFAULT_SAVE_PROFILE):
+        """
+        Save the (possibly modified) pixels as a lossless image.
+        
+        Args:
+            output: Output path or binary file-like object
+            output_format: 'png', 'webp' or 'tiff'; defaults to the file
+                extension for paths and to PNG for file objects
+            save_profile: 'fast', 'balanced' or 'smallest' speed/size trade-off
+        """
+        output_format = Steganography.resolve_output_format(output, output_format)
+        pillow_format, options = Steganography.save_options(output_format, save_profile)
+        pixel_count = self.width * self.height
+        
+        with self.instrumentation.stage('fromarray', pixels=pixel_count):
+            img = Image.fromarray(self.pixels, 'RGB')
+        
+        with self.instrumentation.stage('save', pixels=pixel_count) as record:
+            start = None if isinstance(output, (str, os.PathLike)) else output.tell()
+            img.save(output, format=pillow_format, **options)
+            record['bytes'] = os.path.getsize(output) if start is None else output.tell() - start
+
+
+class RawCarrier(Carrier):
+    """
+    An uncompressed image memory-mapped from disk instead of decoded.
+    
+    The payload channels are the file's sample bytes in storage order (see
+    RawImage), so embedding and extraction only touch the pages holding
+    the header and payload and the full pixel array is never loaded. An
+    encoded carrier is written back in its own format: encoding copies the
+    file to the output path and embeds into the copy in place. Carriers
+    whose samples are already in RGB order (3-channel PPM and .npy) can
+    also be saved as PNG, WebP or TIFF.
+    """
+    
+    def __init__(self, source, instrumentation=None, mode='c'):
+        """
+        Map an uncompressed image.
+        
+        Args:
+            source: Path to a BMP, PPM, PGM or .npy file
+            instrumentation: Optional Instrumentation recording stage timings
+            mode: np.memmap mode; the default copy-on-write mode keeps
+                changes in memory until save, 'r+' writes them to the file
+        """
+        self.instrumentation = instrumentation or NO_INSTRUMENTATION
+        self.source = source
+        self._start = None
+        self._image = None
+        
+        try:
+            with self.instrumentation.stage('open', bytes=Carrier.source_size(source)):
+                self.raw = RawImage(source, mode)
+        except (UnsupportedRawImageError, OSError, ValueError) as e:
+            raise SteganographyError(f"Error opening image: {str(e)}")
+        
+        self.format = self.raw.format
+        self.mode = self.raw.mode
+        self.width, self.height = self.raw.width, self.raw.height
+        self._pixels = self.raw.pixels
+    
+    @property
+    def flattened(self):
+        """Flat view of the mapped sample bytes, in file order."""
+        return self.raw.samples
+    
+    def capacity(self, bits_per_channel=1, matrix=0):
+        """
+        Return the maximum payload size in bytes.
+        
+        Args:
+            bits_per_channel: Number of LSBs used per channel value
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        
+        Returns:
+            int: Number of payload bytes that fit after the header
+        """
+        return Steganography.max_payload_size(self.raw.samples.size, bits_per_channel, matrix)
+    
+    def resolve_output_format(self, output_path=None, output_format=None):
+        """
+        Determine the format an encoded copy of this carrier is saved in.
+        
+        Raw carriers keep their own format unless their samples are in RGB
+        order, in which case a lossless Pillow format may be requested.
+        
+        Args:
+            output_path: Output path whose extension selects the format
+            output_format: Explicit format name
+        
+        Returns:
+            str: Output format name (the carrier's format by default)
+        """
+        requested = output_format
+        if requested is None and isinstance(output_path, (str, os.PathLike)):
+            requested = os.path.splitext(output_path)[1].lower().lstrip('.') or None
+        if requested is None or requested.lower() == self.format:
+            return self.format
+        if self.raw.rgb_order:
+            return Steganography.resolve_output_format(output_path, output_format)
+        raise SteganographyError(
+            f"{self.format.upper()} carriers are saved as .{self.format} files, not '{requested}'")
+    
+    def for_output(self, output_path, output_format=None):
+        """
+        Copy the image to output_path and return a carrier mapping the copy.
+        
+        The payload is then written straight into the output file. Streams
+        cannot be mapped and other formats are written by Pillow, so for
+        them this carrier is returned unchanged.
+        
+        Args:
+            output_path: Path or file-like object the image will be saved to
+            output_format: Resolved output format
+        
+        Returns:
+            RawCarrier: Carrier writing to output_path in place
+        """
+        if not isinstance(output_path, (str, os.PathLike)) or output_format not in (None, self.format):
+            return self
+        if os.path.exists(output_path) and os.path.samefile(output_path, self.source):
+            return RawCarrier(output_path, self.instrumentation, mode='r+')
+        
+        with self.instrumentation.stage('copy', bytes=Carrier.source_size(self.source)):
+            shutil.copyfile(self.source, output_path)
+        return RawCarrier(output_path, self.instrumentation, mode='r+')
+    
+    def save(self, output, output_format=None, save_profile=DEFAULT_SAVE_PROFILE):
+        """
+        Write the (possibly modified) image.
+        
+        Args:
+            output: Output path or binary file-like object
+            output_format: The carrier's format (default), or a lossless
+                Pillow format for carriers in RGB order
+            save_profile: Save profile for Pillow formats; raw formats are
+                stored uncompressed
+        """
+        output_format = self.resolve_output_format(output, output_format)
+        if output_format != self.format:
+            # The samples are already decoded RGB, so Pillow can write them
+            return Carrier.save(self, output, output_format, save_profile)
+        
+        with self.instrumentation.stage('save') as record:
+            if not isinstance(output, (str, os.PathLike)):
+                record['bytes'] = self.raw.write_to(output)
+                return
+            
+            if os.path.exists(output) and os.path.samefile(output, self.source):
+                if self.raw.writable:
+                    # Changes already live in the file
+                    self.raw.flush()
+                    record['bytes'] = self.raw.data.size
+                    return
+                raise SteganographyError("Cannot overwrite a raw carrier opened copy-on-write")
+            
+            with open(output, 'wb') as f:
+                record['bytes'] = self.raw.write_to(f)
+
+
+class JPEGCarrier(Carrier):
+    """
+    A JPEG that hides its payload in the quantized DCT coefficients of its luma.
+    
+    Saving a JPEG as PNG to keep its LSBs intact makes it several times
+    larger. Saved as JPEG instead, a JPEGCarrier keeps the original
+    quantization tables and chroma subsampling, so the output stays a JPEG
+    of about the same size. Its channel values are the low bytes of the
+    luma coefficients selected by jpegdct.usable_mask, each holding one
+    payload bit (JSteg style). Only the 8x8 blocks whose coefficients
+    changed are rebuilt, and the encoded image is read back until every
+    usable coefficient survives the trip through pixels (see save).
+    
+    JPEG output is only used when asked for (see resolve_output_format);
+    for lossless output formats for_format returns a plain Carrier, which
+    embeds into pixel LSBs as before.
+    """
+    
+    def __init__(self, source, instrumentation=None):
+        """
+        Open a JPEG and read its dimensions, quantization tables and subsampling.
+        
+        Args:
+            source: Path to the image file or a binary file-like object
+            instrumentation: Optional Instrumentation recording stage timings
+        """
+        super().__init__(source, instrumentation)
+        self.quantization = getattr(self._image, 'quantization', None)
+        self.subsampling = JpegImagePlugin.get_sampling(self._image)
+        self.info = {key: value for key, value in self._image.info.items()
+                     if key in ('exif', 'icc_profile', 'dpi', 'progressive')}
+        self._planes = None
+        self._table = None
+        self._coefficients = None
+        self._usable = None
+        self._parity = None
+        self._payload = None
+        self._retired = None
+    
+    @property
+    def dct_supported(self):
+        """True if the payload can be kept in DCT coefficients (grayscale and YCbCr JPEGs)."""
+        return bool(self.quantization) and self.mode in ('L', 'RGB')
+    
+    @property
+    def planes(self):
+        """Decoded uint8 YCbCr samples (height, width, 3), or luma only for grayscale."""
+        if self._planes is None:
+            self._decode_planes()
+        return self._planes
+    
+    def _decode_planes(self):
+        """Decode the image without color conversion and compute its luma coefficients."""
+        instrument = self.instrumentation
+        pixel_count = self.width * self.height
+        
+        try:
+            with self._reopen() as img:
+                with instrument.stage('decode', pixels=pixel_count):
+                    # Keep the decoder's YCbCr output instead of converting to RGB
+                    if img.mode == 'RGB':
+                        img.draft('YCbCr', img.size)
+                    img.load()
+                with instrument.stage('array', bytes=pixel_count * len(img.getbands()), pixels=pixel_count):
+                    planes = np.array(img)
+        except Exception as e:
+            raise SteganographyError(f"Error opening image: {str(e)}")
+        finally:
+            self._image = None
+        
+        with instrument.stage('dct', pixels=pixel_count):
+            self._table = jpegdct.quant_table(self.quantization)
+            self._coefficients = jpegdct.forward(self._luma(planes), self._table)
+            self._usable = jpegdct.usable_mask(self._coefficients, self._table)
+        self._planes = planes
+    
+    @staticmethod
+    def _luma(planes):
+        """Return a writable view of the luma plane."""
+        return planes if planes.ndim == 2 else planes[..., 0]
+    
+    @property
+    def flattened(self):
+        """Low bytes of the usable luma coefficients' magnitudes, in block order (a copy)."""
+        if self._usable is None:
+            self._decode_planes()
+        magnitudes = np.abs(self._coefficients[self._usable])
+        return (magnitudes & 0xFF).astype(np.uint8)
+    
+    def capacity(self, bits_per_channel=1, matrix=0):
+        """
+        Return the maximum payload size in bytes.
+        
+        This counts every usable coefficient; images with many blocks that
+        clip at 0 or 255 may hold less, since blocks that do not survive
+        saving are retired (see save).
+        
+        Args:
+            bits_per_channel: Must be 1; each usable coefficient holds one bit
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        
+        Returns:
+            int: Number of payload bytes that fit after the header
+        """
+        if not self.dct_supported:
+            raise SteganographyError(
+                f"{self.mode} JPEGs can only be encoded in a lossless format ({', '.join(OUTPUT_FORMATS)})")
+        if Steganography.check_bits_per_channel(bits_per_channel) != 1:
+            raise SteganographyError(
+                "JPEG outputs hide 1 bit per DCT coefficient; use 1 bit per channel or a lossless output format")
+        if self._usable is None:
+            self._decode_planes()
+        return Steganography.max_payload_size(int(np.count_nonzero(self._usable)), 1, matrix)
+    
+    def resolve_output_format(self, output_path=None, output_format=None):
+        """
+        Determine the format an encoded copy of this carrier is saved in.
+        
+        Args:
+            output_path: Output path whose extension selects the format
+            output_format: Explicit format name
+        
+        Returns:
+            str: 'jpeg' if requested by the format or the output path's
+                extension, else a lossless format (PNG by default)
+        """
+        requested = output_format
+        if requested is None and isinstance(output_path, (str, os.PathLike)):
+            requested = os.path.splitext(output_path)[1].lower().lstrip('.') or None
+        if requested is not None and requested.lower() in JPEG_EXTENSIONS:
+            if not self.dct_supported:
+                raise SteganographyError(
+                    f"{self.mode} JPEGs can only be encoded in a lossless format ({', '.join(OUTPUT_FORMATS)})")
+            return JPEG_OUTPUT_FORMAT
+        return Steganography.resolve_output_format(output_path, output_format)
+    
+    def for_format(self, output_format):
+        """
+        Return the carrier whose capacity applies to an output format.
+        
+        Args:
+            output_format: Resolved output format
+        
+        Returns:
+            Carrier: This carrier for JPEG output, else a Carrier embedding
+                into the decoded RGB pixels
+        """
+        if output_format == JPEG_OUTPUT_FORMAT:
+            return self
+        # Closing an unloaded image would also close a caller's stream
+        if self._image is not None and self._start is None:
+            self._image.close()
+        self._image = None
+        if self._start is not None:
+            self.source.seek(self._start)
+        carrier = Carrier(self.source, self.instrumentation)
+        carrier.pixels = self._pixels
+        return carrier
+    
+    def embed(self, data, flags=0, bits_per_channel=1, codec='none', key=None, matrix=0):
+        """
+        Embed a payload with its v2 header into the luma DCT coefficients.
+        
+        Args:
+            data: Bytes-like stored payload (already compressed with codec)
+            flags: Header flag bits
+            bits_per_channel: Must be 1
+            codec: Compression codec name recorded in the header
+            key: Optional auth code or passphrase for scattered embedding
+            matrix: Matrix embedding k, or 0 for plain LSB embedding
+        """
+        self.capacity(bits_per_channel)
+        self._payload = (bytes(data), flags, codec, key, matrix)
+        self._retired = np.zeros(self._coefficients.shape[:2], dtype=bool)
+        self._write_payload()
+    
+    def _write_payload(self):
+        """Write the stored payload into the usable coefficients and rebuild the changed blocks."""
+        data, flags, codec, key, matrix = self._payload
+        channels = self.flattened
+        with self.instrumentation.stage('embed', bytes=len(data)):
+            Steganography.embed_payload(channels, data, flags, 1, codec, key, matrix)
+        
+        with self.instrumentation.stage('dct') as record:
+            usable = self._usable
+            coefficients = self._coefficients[usable]
+            updated = np.sign(coefficients) * ((np.abs(coefficients) & ~0xFF) | channels)
+            modified = np.zeros(self._coefficients.shape, dtype=bool)
+            modified[usable] = updated != coefficients
+            self._coefficients[usable] = updated
+            self._parity = np.abs(self._coefficients) & 1
+            
+            # Rebuild only the blocks with a changed coefficient
+            changed = modified.any(axis=(2, 3))
+            self._coefficients[changed] = jpegdct.settle(
+                self._coefficients[changed], usable[changed], self._parity[changed], self._table)
+            jpegdct.write_blocks(self._luma(self._planes), self._coefficients, changed, self._table)
+            record['pixels'] = int(np.count_nonzero(changed)) * jpegdct.BLOCK_SIZE ** 2
+    
+    def extract(self, key=None):
+        """
+        Extract the payload from the luma DCT coefficients.
+        
+        Args:
+            key: Auth code or passphrase for scattered payloads
+        
+        Returns:
+            tuple: (payload bytes, header dict or None if there is no payload)
+        """
+        if not self.dct_supported:
+            return super().extract(key)
+        channels = self.flattened
+        with self.instrumentation.stage('extract') as record:
+            payload, header = Steganography.extract_payload(channels, key)
+            record['bytes'] = len(payload)
+        return payload, header
+    
+    def save(self, output, output_format=None, save_profile=DEFAULT_SAVE_PROFILE):
+        """
+        Save the image as JPEG with its original tables, or in a lossless format.
+        
+        A JPEG holding a payload is decoded again after encoding; blocks
+        whose coefficients did not read back as embedded are rebuilt and
+        the image is encoded again. Blocks that come back wrong
+        JPEG_RETIRE_AFTER times are retired (see _retire) and the payload is
+        written again around them, which fails if it no longer fits. Saving
+        gives up after JPEG_SAVE_ATTEMPTS attempts without a retirement.
+        
+        Args:
+            output: Output path or binary file-like object
+            output_format: 'jpeg' or a lossless format (the default)
+            save_profile: 'fast', 'balanced' or 'smallest' speed/size trade-off
+        """
+        output_format = self.resolve_output_format(output, output_format)
+        if output_format != JPEG_OUTPUT_FORMAT:
+            return Carrier.save(self, output, output_format, save_profile)
+        
+        pillow_format, options = Steganography.save_options(output_format, save_profile)
+        options['qtables'] = self.quantization
+        if self.subsampling != -1:
+            options['subsampling'] = self.subsampling
+        options.update((key, value) for key, value in self.info.items() if key != 'progressive')
+        if self.info.get('progressive'):
+            options['progressive'] = True
+        
+        planes = self.planes
+        pixel_count = self.width * self.height
+        mode = 'L' if planes.ndim == 2 else 'YCbCr'
+        rng = np.random.default_rng(0)
+        previous = None
+        stuck = None
+        attempt = 0
+        while attempt < JPEG_SAVE_ATTEMPTS:
+            attempt += 1
+            with self.instrumentation.stage('save', pixels=pixel_count) as record:
+                encoded = io.BytesIO()
+                Image.fromarray(planes, mode).save(encoded, format=pillow_format, **options)
+                record['bytes'] = encoded.tell()
+            if self._payload is None:
+                break
+            
+            with self.instrumentation.stage('verify', pixels=pixel_count):
+                saved = JPEGCarrier(encoded)
+                saved._decode_planes()
+                wrong = (saved._coefficients != self._coefficients) & (self._usable | saved._usable)
+                mismatched = wrong.any(axis=(2, 3))
+            if not mismatched.any():
+                break
+            
+            # Count the attempts each block has come back wrong since the last retirement
+            stuck = mismatched.astype(np.int32) if stuck is None else stuck + mismatched
+            retired = (stuck >= JPEG_RETIRE_AFTER) & ~self._retired
+            if retired.any():
+                self._retire(retired)
+                stuck, previous, attempt = None, None, 0
+            else:
+                self._rebuild(saved._coefficients, mismatched, previous, rng)
+                previous = mismatched
+        else:
+            raise SteganographyError(
+                "The message could not be stored in this JPEG's coefficients; "
+                f"save the image in a lossless format ({', '.join(OUTPUT_FORMATS)}) instead")
+        
+        if isinstance(output, (str, os.PathLike)):
+            with open(output, 'wb') as f:
+                f.write(encoded.getbuffer())
+        else:
+            output.write(encoded.getbuffer())
+    
+    def _retire(self, blocks):
+        """
+        Stop using blocks that keep reading back wrong, and write the payload again.
+        
+        Their coefficients in data-carrying positions are set to zero, so
+        neither embedding nor extraction uses them; the payload then moves
+        to the remaining coefficients.
+        
+        Args:
+            blocks: Boolean array of shape (block rows, block columns)
+                selecting the blocks to retire
+        """
+        self._retired |= blocks
+        self._coefficients[blocks[..., None, None] & jpegdct.usable_positions(self._table)] = 0
+        self._usable = jpegdct.usable_mask(self._coefficients, self._table)
+        jpegdct.write_blocks(self._luma(self._planes), self._coefficients, blocks, self._table)
+        
+        data, _, _, _, matrix = self._payload
+        capacity = Steganography.max_payload_size(int(np.count_nonzero(self._usable)), 1, matrix)
+        if len(data) > capacity:
+            raise SteganographyError(
+                f"The message does not fit in the coefficients of this JPEG that survive saving "
+                f"({len(data)} bytes to store, {capacity} bytes fit); save the image in a lossless "
+                f"format ({', '.join(OUTPUT_FORMATS)}) instead")
+        self._write_payload()
+    
+    def _rebuild(self, decoded, mismatched, previous, rng):
+        """
+        Rebuild blocks that did not read back as embedded.
+        
+        The coefficients actually read are taken as the new starting point
+        and the payload bits are set again; blocks that were also wrong on
+        the previous attempt get a perturbed coefficient as well.
+        
+        Args:
+            decoded: Coefficients read back from the encoded image
+            mismatched: Boolean array selecting the blocks to rebuild
+            previous: The previous attempt's mismatched blocks, or None
+            rng: numpy.random.Generator for perturb()
+        """
+        usable, parity = self._usable[mismatched], self._parity[mismatched]
+        blocks = jpegdct.set_parity(decoded[mismatched], usable, parity, np.sign(self._coefficients[mismatched]),
+                                    self._table)
+        if previous is not None:
+            again = previous[mismatched]
+            blocks[again] = jpegdct.perturb(blocks[again], usable[again], rng)
+        self._coefficients[mismatched] = jpegdct.settle(blocks, usable, parity, self._table)
+        jpegdct.write_blocks(self._luma(self._planes), self._coefficients, mismatched, self._table)
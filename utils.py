@@ -5,6 +5,21 @@ import os
 import sys
 import time
 from PIL import Image
+from stegano import Steganography, Carrier
+from steganalysis import analyze, DEFAULT_MAX_SAMPLES, HEAD_SAMPLES
+from rawimage import RawImage, RAW_FORMATS, raw_format
+import jpegdct
+
+# Image formats accepted as carriers (uncompressed raw formats are
+# memory-mapped), and the file extensions batch mode picks up
+SUPPORTED_FORMATS = ('png', 'jpg', 'jpeg', 'webp', 'tiff') + RAW_FORMATS
+SUPPORTED_EXTENSIONS = ('png', 'jpg', 'jpeg', 'webp', 'tif', 'tiff')
+
+# Formats that preserve pixel values exactly (written by Steganography.encode)
+LOSSLESS_FORMATS = ('png', 'webp', 'tiff') + RAW_FORMATS
+
+# Steganalysis score at or above which an image is reported as likely to hold data
+STEGANALYSIS_THRESHOLD = 0.5
 
 def validate_image_path(file_path):
     """
@@ -19,10 +34,18 @@ def validate_image_path(file_path):
     if not os.path.exists(file_path):
         return False
     
+    # Uncompressed carriers are mapped rather than decoded by Pillow
+    if raw_format(file_path):
+        try:
+            RawImage(file_path)
+            return True
+        except:
+            return False
+    
     try:
         with Image.open(file_path) as img:
             format = img.format.lower() if img.format else ""
-            return format in ['png', 'jpg', 'jpeg']
+            return format in SUPPORTED_FORMATS
     except:
         return False
 
@@ -61,66 +84,70 @@ def display_progress(current, total, bar_length=40):
     if progress >= 1.0:
         sys.stdout.write('\n')
 
-def estimate_encoding_capacity(image_path):
+def estimate_encoding_capacity(image_path, bits_per_channel=1, output_format=None):
     """
     Estimate how many characters can be hidden in the image.
     
     Args:
-        image_path: Path to the image file
+        image_path: Path to the image file or a loaded Carrier
+        bits_per_channel: Number of LSBs used per channel value
+        output_format: Output format (JPEG carriers hold less as JPEG)
         
     Returns:
         int: Estimated number of characters that can be hidden
     """
     try:
+        if isinstance(image_path, Carrier) or raw_format(image_path) or jpegdct.is_jpeg(image_path):
+            carrier = Carrier.load(image_path)
+            carrier = carrier.for_format(carrier.resolve_output_format(None, output_format))
+            return carrier.capacity(bits_per_channel)
+        
         with Image.open(image_path) as img:
             width, height = img.size
-            # Each pixel has 3 color channels (R,G,B) and we use 1 bit per channel
-            # 8 bits = 1 character, plus some overhead for the delimiter
-            max_bits = width * height * 3
-            # Leave some space for the delimiter
-            max_chars = (max_bits - 16) // 8
-            return max_chars
+            # Each pixel has 3 color channels (R,G,B) and we use bits_per_channel
+            # bits per channel; 8 bits = 1 character, minus the message header
+            return Steganography.max_payload_size(width * height * 3, bits_per_channel)
     except:
         return 0
 
-def is_likely_steganographic_image(image_path):
+def steganalysis_score(image_path, max_samples=DEFAULT_MAX_SAMPLES):
     """
-    Try to determine if the image likely contains hidden data.
+    Score how likely the image is to contain LSB-embedded data.
     This is a heuristic and not foolproof.
     
+    The LSB ratio, chi-square pair statistics and RS analysis are computed
+    over a bounded sample of the image (see steganalysis.analyze).
+    
     Args:
-        image_path: Path to the image file
+        image_path: Path to the image file or a loaded Carrier
+        max_samples: Maximum number of channel values to analyse
         
     Returns:
-        bool: True if the image likely contains hidden data
+        float: Score between 0 and 1; higher means more likely
     """
     try:
-        with Image.open(image_path) as img:
-            if img.format.lower() != 'png':
-                # JPEG compression disrupts steganography, so if it's not PNG, less likely
-                return False
-            
-            # Check for patterns in LSBs that might indicate hidden data
-            img_array = img.convert('RGB')
-            pixels = list(img_array.getdata())
-            
-            # Sample a portion of the image pixels
-            sample_size = min(1000, len(pixels))
-            lsb_ones = 0
-            
-            for i in range(sample_size):
-                r, g, b = pixels[i]
-                # Count LSBs that are 1
-                lsb_ones += (r & 1) + (g & 1) + (b & 1)
-            
-            # Calculate the ratio of 1s in the LSBs
-            lsb_ratio = lsb_ones / (sample_size * 3)
-            
-            # In natural images, the distribution of 0s and 1s in LSBs is roughly equal
-            # Significant deviation might indicate steganography
-            return 0.45 <= lsb_ratio <= 0.55
+        carrier = Carrier.load(image_path)
+        if carrier.format not in LOSSLESS_FORMATS:
+            # JPEG compression disrupts steganography, so if it's not lossless, less likely
+            return 0.0
+        
+        # The head comes from the flattened samples, which raw carriers map in file order
+        return analyze(carrier.pixels, max_samples, carrier.flattened[:HEAD_SAMPLES])['score']
     except:
-        return False
+        return 0.0
+
+def is_likely_steganographic_image(image_path, threshold=STEGANALYSIS_THRESHOLD):
+    """
+    Try to determine if the image likely contains hidden data.
+    
+    Args:
+        image_path: Path to the image file or a loaded Carrier
+        threshold: Minimum steganalysis score to report
+        
+    Returns:
+        bool: True if the image likely contains hidden data
+    """
+    return steganalysis_score(image_path) >= threshold
 
 def safe_text_read(file_path):
     """